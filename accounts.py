@@ -0,0 +1,61 @@
+"""
+Запросы данных клиента сразу по нескольким портфелям: эндпоинты
+позиций, сводки, рисков и прочего и их сборка в один словарь
+{портфель: {эндпоинт: ответ}}. Используется Api.get_accounts() и
+AsyncApi.get_accounts().
+"""
+from models import FortsRisk, Order, Position, Risk, StopOrder, Summary, Trade
+from routing import DERIVATIVES
+
+# эндпоинт: (путь после /md/v2/, модель для typed=True)
+ACCOUNT_ENDPOINTS = {
+    'positions': ('Clients/{exchange}/{portfolio}/positions', Position),
+    'summary': ('clients/{exchange}/{portfolio}/summary', Summary),
+    'risk': ('Clients/{exchange}/{portfolio}/risk', Risk),
+    'fortsrisk': ('Clients/{exchange}/{portfolio}/fortsrisk', FortsRisk),
+    'orders': ('clients/{exchange}/{portfolio}/orders', Order),
+    'stoporders': ('clients/{exchange}/{portfolio}/stoporders', StopOrder),
+    'trades': ('Clients/{exchange}/{portfolio}/trades', Trade),
+}
+DEFAULT_ENDPOINTS = ('positions', 'summary', 'risk')
+
+
+def default_endpoints(market: str) -> tuple:
+    """
+    Эндпоинты по умолчанию для портфеля рынка: риски FORTS
+    запрашиваются только для срочного рынка
+    """
+    if market == DERIVATIVES:
+        return DEFAULT_ENDPOINTS + ('fortsrisk',)
+    return DEFAULT_ENDPOINTS
+
+
+def account_jobs(url_api: str, exchange: str, portfolios, endpoints,
+                 markets: dict) -> list:
+    """
+    :param portfolios: Портфели
+    :param endpoints: Ключи ACCOUNT_ENDPOINTS, None - default_endpoints()
+     по рынку портфеля
+    :param markets: {портфель: рынок} из RoutingTable.markets
+    :return: [(портфель, эндпоинт, URL, модель), ...]
+    """
+    jobs = []
+    for portfolio in portfolios:
+        names = endpoints or default_endpoints(markets.get(portfolio))
+        for name in names:
+            path, model = ACCOUNT_ENDPOINTS[name]
+            url = f'{url_api}/md/v2/' + path.format(exchange=exchange,
+                                                    portfolio=portfolio)
+            jobs.append((portfolio, name, url, model))
+    return jobs
+
+
+def merge(jobs: list, results) -> dict:
+    """
+    :param results: Ответы в порядке jobs (None - ошибка)
+    :return: {портфель: {эндпоинт: ответ}}
+    """
+    merged = {}
+    for (portfolio, name, _, _), result in zip(jobs, results):
+        merged.setdefault(portfolio, {})[name] = result
+    return merged
@@ -0,0 +1,136 @@
+"""
+Векторная аналитика ленты сделок на NumPy: VWAP, скользящий объем,
+дисбаланс покупок/продаж и построение баров по времени, числу сделок
+и объему. Все функции принимают массив с dtype TRADE_DTYPE, который
+собирается из ответа get_today_trades() за один проход.
+"""
+import numpy as np
+
+from history import BAR_DTYPE
+
+TRADE_DTYPE = np.dtype([
+    ('timestamp', 'i8'),
+    ('id', 'i8'),
+    ('price', 'f8'),
+    ('qty', 'i8'),
+    ('side', 'i1'),
+])
+
+BUY = 1
+SELL = -1
+
+
+def trades_to_array(trades: list) -> np.ndarray:
+    """
+    Лента get_today_trades() в структурированный массив
+
+    :param trades: [ Simple JSON ] или генератор iter_today_trades()
+    :return: np.ndarray с dtype TRADE_DTYPE, side: 1 - buy, -1 - sell
+    """
+    count = len(trades) if hasattr(trades, '__len__') else -1
+    return np.fromiter(
+        ((t['timestamp'], t['id'], t['price'], t['qty'],
+          BUY if t['side'] == 'buy' else SELL) for t in trades),
+        dtype=TRADE_DTYPE, count=count)
+
+
+def vwap(tape: np.ndarray) -> float:
+    """
+    Средневзвешенная по объему цена
+    """
+    volume = tape['qty'].sum()
+    if not volume:
+        return float('nan')
+    return float(np.dot(tape['price'], tape['qty']) / volume)
+
+
+def cumulative_vwap(tape: np.ndarray) -> np.ndarray:
+    """
+    VWAP с начала ленты на момент каждой сделки
+    """
+    turnover = np.cumsum(tape['price'] * tape['qty'])
+    return turnover / np.cumsum(tape['qty'])
+
+
+def _trailing_sum(values: np.ndarray, timestamps: np.ndarray,
+                  window: int) -> np.ndarray:
+    cumulative = np.cumsum(values)
+    left = np.searchsorted(timestamps, timestamps - window, side='right')
+    before = np.where(left > 0, cumulative[left - 1], 0)
+    return cumulative - before
+
+
+def rolling_volume(tape: np.ndarray, window: int) -> np.ndarray:
+    """
+    Объем за последние window миллисекунд на момент каждой сделки
+    """
+    return _trailing_sum(tape['qty'], tape['timestamp'], window)
+
+
+def imbalance(tape: np.ndarray, window: int = None):
+    """
+    Дисбаланс (покупки - продажи) / (покупки + продажи) по объему
+
+    :param window: Если задано - скользящий дисбаланс за window
+     миллисекунд на момент каждой сделки, иначе по всей ленте
+    """
+    signed = tape['qty'] * tape['side']
+    if window is None:
+        volume = tape['qty'].sum()
+        return float(signed.sum() / volume) if volume else float('nan')
+    volume = rolling_volume(tape, window)
+    return _trailing_sum(signed, tape['timestamp'], window) / volume
+
+
+def _bars(tape: np.ndarray, starts: np.ndarray,
+          times: np.ndarray) -> np.ndarray:
+    """
+    Бары по группам подряд идущих сделок, starts - индексы начала групп
+    """
+    bars = np.empty(len(starts), dtype=BAR_DTYPE)
+    if not len(starts):
+        return bars
+    price = tape['price']
+    ends = np.append(starts[1:], len(tape)) - 1
+    bars['time'] = times
+    bars['open'] = price[starts]
+    bars['high'] = np.maximum.reduceat(price, starts)
+    bars['low'] = np.minimum.reduceat(price, starts)
+    bars['close'] = price[ends]
+    bars['volume'] = np.add.reduceat(tape['qty'], starts)
+    return bars
+
+
+def _group_starts(groups: np.ndarray) -> np.ndarray:
+    if not len(groups):
+        return np.empty(0, dtype=np.intp)
+    return np.concatenate(([0], np.flatnonzero(np.diff(groups)) + 1))
+
+
+def time_bars(tape: np.ndarray, seconds: int) -> np.ndarray:
+    """
+    Бары по времени, только для интервалов, в которых были сделки
+
+    :return: np.ndarray с dtype BAR_DTYPE, time - начало бара в секундах
+    """
+    buckets = tape['timestamp'] // (seconds * 1000)
+    starts = _group_starts(buckets)
+    return _bars(tape, starts, buckets[starts] * seconds)
+
+
+def tick_bars(tape: np.ndarray, ticks: int) -> np.ndarray:
+    """
+    Бары по ticks сделок, time - время первой сделки бара в секундах
+    """
+    starts = np.arange(0, len(tape), ticks)
+    return _bars(tape, starts, tape['timestamp'][starts] // 1000)
+
+
+def volume_bars(tape: np.ndarray, volume: int) -> np.ndarray:
+    """
+    Бары по объему: новый бар начинается со сделки, до которой набран
+    очередной объем volume. Сделка не делится между барами.
+    """
+    before = np.cumsum(tape['qty']) - tape['qty']
+    starts = _group_starts(before // volume)
+    return _bars(tape, starts, tape['timestamp'][starts] // 1000)
@@ -0,0 +1,1212 @@
+import asyncio
+import time
+from copy import copy
+from json import JSONDecodeError
+from typing import List
+
+import aiohttp
+
+from accounts import account_jobs, merge
+from auth import TokenManager
+from cache import ResponseCache
+from codec import loads, dumps
+from batch import BatchOrders
+from client import Api
+from jsonstream import aiter_json_array
+from log import logger, request_fields
+from metrics import Metrics, connect_trace
+from models import (
+    Book, FortsRisk, Order, Position, Risk, StopOrder, Summary, Trade,
+    decode
+)
+from orderbook import fetch_orderbooks
+from ratelimit import RateLimiter
+from routing import RoutingTable, Route, instrument_type, DEFAULT_TRADE_SERVER
+from singleflight import AsyncSingleFlight, request_key
+from order_id import OrderIdGenerator
+from settings import (
+    URL_OAUTH,
+    URL_API,
+    LOGGING,
+    ASYNC_POOL_SIZE, HTTP_TIMEOUT,
+    ORDERBOOK_CONCURRENCY, ORDERBOOK_TIMEOUT,
+    STREAM_CHUNK_SIZE,
+    BATCH_CONCURRENCY, BATCH_RATE, BATCH_RETRIES,
+    RATE_LIMITS,
+    CACHE_TTL,
+    ACCOUNT_CONCURRENCY,
+    ROUTING_RETRY_DELAY,
+    EXCHANGE
+)
+
+
+def _params(query: dict) -> dict:
+    """
+    aiohttp, в отличие от requests, не пропускает None в query-параметрах
+    """
+    return {k: v for k, v in query.items() if v is not None}
+
+
+class AsyncApi:
+    """
+    Асинхронный клиент: те же методы, что и у Api, но корутины.
+    Все запросы идут через одну долгоживущую aiohttp.ClientSession,
+    обновление JWT токена не блокирует event loop.
+
+        async with AsyncApi(REFRESH_TOKEN, USERNAME) as alor:
+            alor.exchange = 'MOEX'
+            print(await alor.get_portfolios())
+    """
+
+    _payload = Api._payload
+    _random_order_id = Api._random_order_id
+    is_working_hours = Api.is_working_hours
+
+    def __init__(self,
+                 refresh=None,
+                 username=None,
+                 pool_size: int = ASYNC_POOL_SIZE,
+                 timeout: tuple = HTTP_TIMEOUT,
+                 url_api: str = URL_API,
+                 url_oauth: str = URL_OAUTH,
+                 background_refresh: bool = True,
+                 rate_limits: dict = RATE_LIMITS,
+                 coalesce: bool = True,
+                 cache: ResponseCache = None,
+                 metrics: Metrics = None,
+                 ):
+        """
+        :param refresh: Токен обновления
+        :param username: Аккаунт клиента
+        :param pool_size: Максимум одновременных соединений сессии
+        :param timeout: Таймауты (подключение, чтение) в секундах
+        :param url_api: Адрес API (по умолчанию из settings)
+        :param url_oauth: Адрес сервера авторизации (по умолчанию из settings)
+        :param background_refresh: Обновлять JWT токен заранее в фоновой
+         задаче, а не в момент запроса
+        :param rate_limits: Лимиты запросов по классам эндпоинтов
+         {класс: (запросов в секунду, всплеск)}, None - без ограничений
+         и без повтора ответов 429/5xx
+        :param coalesce: Объединять одинаковые одновременные GET запросы,
+         счетчики в coalescer.requests и coalescer.coalesced
+        :param cache: Кеш справочных ответов (инструменты, портфели,
+         время сервера), по умолчанию свой ResponseCache(), False -
+         без кеша
+        :param metrics: Сборщик метрик запросов, по умолчанию свой
+         Metrics(), False - без метрик
+        """
+        self.error = False
+        self.username = username
+        self.refresh_token = refresh
+        self._order_ids = OrderIdGenerator(username)
+        self.portfolio = None
+        self.exchange = None
+        self.url_api = url_api
+        self.url_oauth = url_oauth
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.background_refresh = background_refresh
+        self.limiter = RateLimiter(rate_limits) if rate_limits else None
+        self.coalescer = AsyncSingleFlight() if coalesce else None
+        self.cache = ResponseCache() if cache is None else cache or None
+        self.metrics = Metrics() if metrics is None else metrics or None
+        self._routing = None
+        self._routing_retry_at = 0.0
+        self._unresolved = {}
+        self.tokens = TokenManager(refresh, url_oauth=url_oauth)
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Сессия создается при первом запросе, внутри работающего event loop
+        """
+        if self._session is None or self._session.closed:
+            connect, read = self.timeout
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect,
+                                              sock_read=read),
+                trace_configs=[connect_trace()] if self.metrics else None
+            )
+        return self._session
+
+    async def close(self):
+        """
+        Закрыть сессию и соединения пула
+        """
+        await self.tokens.stop_async()
+        if self._session is not None:
+            await self._session.close()
+
+    @property
+    def jwt_token(self):
+        return self.tokens.jwt_token
+
+    async def _jwt(self):
+        """
+        Действующий JWT токен
+        """
+        await self._headers()
+        return self.tokens.jwt_token
+
+    async def _headers(self):
+        """
+        Готовые заголовки авторизации из TokenManager. При первом вызове
+        запускается фоновое обновление токена в текущем event loop.
+        Словарь общий, для добавления заголовков делайте копию.
+        """
+        if self.background_refresh:
+            self.tokens.start_async(self.session)
+        headers = await self.tokens.get_headers_async(self.session)
+        if headers is None:
+            self.error = True
+            if LOGGING:
+                logger.error('Не найден JWT токен, проверьте refresh токен!')
+        return headers
+
+    async def _auth(self, url: str):
+        """
+        _headers() с записью фазы auth в metrics
+        """
+        start = time.perf_counter()
+        headers = await self._headers()
+        if self.metrics is not None:
+            self.metrics.observe(url, 'auth', time.perf_counter() - start)
+        return headers
+
+    def _account(self, portfolio: str = None, exchange: str = None):
+        if self.portfolio:
+            portfolio = self.portfolio
+        if self.exchange:
+            exchange = self.exchange
+        return portfolio, exchange
+
+    async def _request(self, method: str, url: str, headers: dict = None,
+                       ttl: float = None, **kwargs):
+        """
+        Одинаковые одновременные GET запросы объединяются в один
+
+        :param ttl: Срок хранения успешного ответа в кеше, секунды
+        :return: (HTTP статус, тело ответа)
+        """
+        if ttl and method == 'GET' and self.cache is not None:
+            key = request_key(method, url, kwargs.get('params'))
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            status, body = await self._request(method, url, headers,
+                                               **kwargs)
+            if status == 200:
+                self.cache.set(key, (status, body), ttl, size=len(body))
+            return status, body
+        if headers is None:
+            headers = await self._auth(url)
+        if 'json' in kwargs:
+            kwargs['data'] = dumps(kwargs.pop('json'))
+            headers = dict(headers or {},
+                           **{'Content-Type': 'application/json'})
+        if 'params' in kwargs:
+            kwargs['params'] = _params(kwargs['params'])
+        if method != 'GET' or self.coalescer is None:
+            return await self._send(method, url, headers, **kwargs)
+        key = request_key(method, url, kwargs.get('params'), headers)
+        return await self.coalescer.do(
+            key, lambda: self._send(method, url, headers, **kwargs))
+
+    async def _send(self, method: str, url: str, headers: dict, **kwargs):
+        """
+        Запрос в пределах лимита класса эндпоинта с повтором 429/5xx
+        для GET и команд с X-ALOR-REQID
+        """
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                await self.limiter.acquire_async(url)
+            res, body = await self._http(method, url, headers, **kwargs)
+            if self.limiter is None or \
+                    not self.limiter.should_retry(res.status, attempt,
+                                                  method, headers):
+                return res.status, body
+            delay = self.limiter.retry_delay(
+                url, res.status, attempt, res.headers.get('Retry-After'))
+            if LOGGING:
+                logger.warning('%s %s %s, повтор через %.2f с',
+                               res.status, method, url, delay,
+                               extra=request_fields(url, res.status))
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _http(self, method: str, url: str, headers: dict, **kwargs):
+        """
+        Один HTTP запрос с записью в metrics
+
+        :return: (ответ, тело ответа)
+        """
+        if self.metrics is None:
+            async with self.session.request(method, url, headers=headers,
+                                            **kwargs) as res:
+                return res, await res.read()
+        sent = len(kwargs.get('data') or b'')
+        timing = {}
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, url, headers=headers,
+                                            trace_request_ctx=timing,
+                                            **kwargs) as res:
+                body = await res.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.metrics.request(url, 0, time.perf_counter() - start,
+                                 timing.get('connect', 0.0), sent)
+            raise
+        self.metrics.request(url, res.status, time.perf_counter() - start,
+                             timing.get('connect', 0.0), sent, len(body))
+        return res, body
+
+    def _check_results(self, status: int, body: bytes, model=None,
+                       url: str = None):
+        """
+        :param model: Класс из models.py - вернуть модели вместо JSON
+        :param url: URL запроса, для записи фазы decode в metrics
+        """
+        if status != 200:
+            self.error = True
+            if LOGGING:
+                logger.error('Ошибка: %s %s', status,
+                             body.decode(errors='replace'),
+                             extra=request_fields(url, status))
+            return
+        start = time.perf_counter()
+        try:
+            result = decode(loads(body), model)
+            self.error = False
+        except JSONDecodeError as e:
+            self.error = True
+            if self.metrics is not None and url is not None:
+                self.metrics.error(url)
+            if LOGGING:
+                logger.error('Ошибка декодирования JSON: %s', e,
+                             extra=request_fields(url, status))
+            return
+        if self.metrics is not None and url is not None:
+            self.metrics.observe(url, 'decode', time.perf_counter() - start)
+        return result
+
+    async def _get(self, url: str, params: dict = None, ttl: float = None,
+                   model=None):
+        kwargs = {} if params is None else {'params': params}
+        status, body = await self._request('GET', url, ttl=ttl, **kwargs)
+        return self._check_results(status, body, model, url)
+
+    async def _iter(self, url: str, params: dict = None,
+                    fields: tuple = None):
+        """
+        Потоковый аналог _get() для ответов-массивов: элементы
+        разбираются по мере чтения тела ответа
+        """
+        headers = await self._auth(url)
+        kwargs = {} if params is None else {'params': _params(params)}
+        if self.limiter is not None:
+            await self.limiter.acquire_async(url)
+        async with self.session.get(url, headers=headers, **kwargs) as res:
+            if res.status != 200:
+                self._check_results(res.status, await res.read(), url=url)
+                return
+            try:
+                async for record in aiter_json_array(
+                        res.content.iter_chunked(STREAM_CHUNK_SIZE), fields):
+                    yield record
+                self.error = False
+            except ValueError as e:
+                self.error = True
+                if LOGGING:
+                    logger.error('Ошибка декодирования JSON: %s', e,
+                                 extra=request_fields(url, res.status))
+
+    # ---------------- Блок "Информация о клиенте -------------------
+
+    async def get_portfolios(self):
+        """
+        Получение списка серверов и идентификаторы клиентского портфеля
+        :return: Simple JSON
+        """
+        return await self._get(
+            f'{self.url_api}/client/v1.0/users/{self.username}/portfolios',
+            ttl=CACHE_TTL['portfolios'])
+
+    async def get_orders_info(self, portfolio: str = None,
+                              exchange: str = None, typed: bool = False):
+        """
+        Запрос информации о всех заявках
+
+        :param portfolio: Идентификатор клиентского портфеля (например D39004)
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Order вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/clients/{exchange}/{portfolio}/orders',
+            model=Order if typed else None)
+
+    async def get_order_info(self, orderId: str, portfolio: str = None,
+                             exchange: str = None, typed: bool = False):
+        """
+        Запрос информации о выбранной заявке
+
+        :param portfolio: Идентификатор клиентского портфеля (например D39004)
+        :param orderId: Идентификатор заявки (например 18995978560)
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Order вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/clients/{exchange}/{portfolio}'
+            f'/orders/{orderId}',
+            model=Order if typed else None)
+
+    async def get_stoporders_info(self, portfolio: str = None,
+                                  exchange: str = 'MOEX', typed: bool = False):
+        """Запрос информации о всех стоп-заявках
+
+        :param portfolio: Идентификатор клиентского портфеля (например D39004)
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.StopOrder вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/clients/{exchange}/{portfolio}/stoporders',
+            model=StopOrder if typed else None)
+
+    async def get_stoporder_info(self, orderId: str, portfolio: str = None,
+                                 exchange: str = None, typed: bool = False):
+        """Запрос информации о выбранной стоп-заявке
+
+        :param portfolio: Идентификатор клиентского портфеля (например D39004)
+        :param orderId: Идентификатор заявки (например 18995978560)
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.StopOrder вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/clients/{exchange}'
+            f'/{portfolio}/stoporders/{orderId}',
+            model=StopOrder if typed else None)
+
+    async def get_summary_info(self, portfolio: str = None,
+                               exchange: str = None, typed: bool = False):
+        """
+        Запрос сводной информации
+
+        :param portfolio: Идентификатор клиентского портфеля (например D39004)
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Summary вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/clients/{exchange}/{portfolio}/summary',
+            model=Summary if typed else None)
+
+    async def get_positions_info(self, portfolio: str = None,
+                                 exchange: str = None, typed: bool = False):
+        """
+        Запрос информации о позициях
+
+        :param portfolio: Идентификатор клиентского портфеля
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Position вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/Clients/{exchange}/{portfolio}/positions',
+            model=Position if typed else None)
+
+    async def get_position_info(self, ticker: str, portfolio: str = None,
+                                exchange: str = None, typed: bool = False):
+        """
+        Запрос информации о позици по инструменту
+
+        :param ticker: Инструмент (GAZP)
+        :param portfolio: Идентификатор клиентского портфеля
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Position вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/'
+            f'clients/{exchange}/{portfolio}/positions/{ticker}',
+            model=Position if typed else None)
+
+    async def get_trades_info(self, portfolio: str = None,
+                              exchange: str = None, typed: bool = False):
+        """Запрос информации о сделках
+
+        :param portfolio: Идентификатор клиентского портфеля
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Trade вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/Clients/{exchange}/{portfolio}/trades',
+            model=Trade if typed else None)
+
+    async def get_trade_info(self, ticker: str, portfolio: str = None,
+                             exchange: str = None, typed: bool = False):
+        """Запрос информации о сделках по выбранному инструменту
+
+        :param ticker: Инструмент (GAZP)
+        :param portfolio: Идентификатор клиентского портфеля
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Trade вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/'
+            f'Clients/{exchange}/{portfolio}/{ticker}/trades',
+            model=Trade if typed else None)
+
+    async def get_fortrisk_info(self, portfolio: str = None,
+                                exchange: str = None, typed: bool = False):
+        """
+        Запрос информации о рисках
+
+        :param portfolio: Идентификатор клиентского портфеля
+        :param exchange: Биржа Available values : MOEX
+        :param typed: Вернуть models.FortsRisk вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/Clients/{exchange}/{portfolio}/fortsrisk',
+            model=FortsRisk if typed else None)
+
+    async def get_risk_info(self, portfolio: str = None,
+                            exchange: str = None, typed: bool = False):
+        """
+        Запрос информации о рисках
+
+        :param portfolio: Идентификатор клиентского портфеля
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Risk вместо JSON
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/Clients/{exchange}/{portfolio}/risk',
+            model=Risk if typed else None)
+
+    async def get_accounts(self, portfolios: list = None,
+                           endpoints: tuple = None, exchange: str = None,
+                           concurrency: int = ACCOUNT_CONCURRENCY,
+                           typed: bool = False):
+        """
+        Данные клиента по нескольким портфелям одним вызовом: запросы
+        всех пар портфель x эндпоинт выполняются параллельно, поэтому
+        общее время - примерно один запрос, а не N x M. Значение
+        по умолчанию self.portfolio здесь не применяется.
+
+            await alor.get_accounts(endpoints=('positions', 'summary'))
+            # {'D00031': {'positions': [...], 'summary': {...}},
+            #  '7500031': {'positions': [...], 'summary': {...}}}
+
+        :param portfolios: Портфели, по умолчанию все из get_portfolios()
+        :param endpoints: Ключи accounts.ACCOUNT_ENDPOINTS: positions,
+         summary, risk, fortsrisk, orders, stoporders, trades. По
+         умолчанию positions, summary, risk и fortsrisk для портфелей
+         срочного рынка
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param concurrency: Максимум одновременных запросов
+        :param typed: Вернуть модели из models.py вместо JSON
+        :return: {портфель: {эндпоинт: JSON или None при ошибке}}
+        """
+        routing = await self.get_routing()
+        markets = routing.markets if routing is not None else {}
+        if portfolios is None:
+            portfolios = list(markets)
+        _, exchange = self._account(exchange=exchange)
+        jobs = account_jobs(self.url_api, exchange or EXCHANGE, portfolios,
+                            endpoints, markets)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(job):
+            _, _, url, model = job
+            async with semaphore:
+                try:
+                    return await self._get(url, model=model if typed else None)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if LOGGING:
+                        logger.error('Ошибка запроса %s: %s', url, e,
+                                     extra=request_fields(url))
+                    return None
+
+        results = await asyncio.gather(*(fetch(job) for job in jobs))
+        self.error = any(result is None for result in results)
+        return merge(jobs, results)
+
+    # ------------------ Блок Ценные бумаги / инструменты ---------------------
+
+    async def get_securities_info(self, ticker: str, limit: int = None,
+                                  sector: str = None, cficode: str = None,
+                                  exchange: str = None):
+        """
+        Запрос информации об имеющихся ценных бумагах
+
+        :param exchange: Фильтр по коду биржи MOEX или SPBX
+        :param limit: Ограничение на количество выдаваемых результатов поиска
+        :param sector: Рынок на бирже Available values : FORTS, FOND, CURR
+        :param cficode: Код финансового инструмента
+        по стандарту ISO 10962 (EXXXXX)
+        :param ticker: Фильтр про инструменту GAZP
+        :return: [ Simple JSON ]
+        """
+        _, exchange = self._account(exchange=exchange)
+        query = {'query': ticker,
+                 'limit': limit,
+                 'sector': sector,
+                 'cficode': cficode,
+                 'exchange': exchange
+                 }
+        return await self._get(f'{self.url_api}/md/v2/securities',
+                               params=query, ttl=CACHE_TTL['securities'])
+
+    async def get_all_securities_info(self, exchange: str = None):
+        """
+        Запрос информации об инструментах на выбранной бирже
+        ВНИМАНИЕ! Возвращает все инструменты! ~ 25 мб
+
+        :param exchange:  Биржа Available values : MOEX, SPBX
+
+        :return: Simple JSON
+        """
+        _, exchange = self._account(exchange=exchange)
+        return await self._get(f'{self.url_api}/md/v2/Securities/{exchange}')
+
+    def iter_all_securities_info(self, exchange: str = None,
+                                 fields: tuple = None):
+        """
+        Потоковый вариант get_all_securities_info()
+
+        :param exchange:  Биржа Available values : MOEX, SPBX
+        :param fields: Оставить только эти поля, например ('symbol', 'ISIN')
+        :return: Асинхронный генератор Simple JSON
+        """
+        _, exchange = self._account(exchange=exchange)
+        return self._iter(f'{self.url_api}/md/v2/Securities/{exchange}',
+                          fields=fields)
+
+    async def get_security_info(self, ticker: str, exchange: str = None):
+        """
+        Запрос информации о выбранном финансовом инструменте на бирже
+        (Аналог get_securities_info())
+
+        :param exchange: Биржа : MOEX, SPBX
+        :param ticker: Инструмент GAZP
+        :return: Simple JSON
+        """
+        _, exchange = self._account(exchange=exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/Securities/{exchange}/{ticker}',
+            ttl=CACHE_TTL['securities'])
+
+    async def get_quotes_list(self, symbols: str):
+        """
+        Запрос информации о котировках для выбранных инструментов и бирж
+
+        :param symbols: Принимает несколько пар биржа-тикер.
+         Пары отделены запятыми. Биржа и тикер разделены двоеточием.
+         Например MOEX:SBER,MOEX:GAZP,SPBX:AAPL
+        :return: Simple JSON
+        """
+        return await self._get(
+            f'{self.url_api}/md/v2/securities/{symbols}/quotes')
+
+    async def get_orderbook(self, sec: str, depth: int = 5,
+                            typed: bool = False):
+        """
+        Получить стакан bid/ask для ценной бумаги
+
+        :param sec: Ценная бумага
+        :param depth: Глубина стакана
+        :param typed: Вернуть стакан models.Book вместо JSON
+        :return: (Название бумаги, JSON)
+        """
+        _, exchange = self._account()
+        return sec, await self._get(
+            f'{self.url_api}/md/v2/orderbooks/{exchange}/{sec}',
+            params={'depth': depth},
+            model=Book if typed else None)
+
+    async def get_orderbooks(self,
+                             sec_ls: list = None,
+                             depth: int = 5,
+                             concurrency: int = ORDERBOOK_CONCURRENCY,
+                             timeout: float = ORDERBOOK_TIMEOUT,
+                             return_errors: bool = False,
+                             typed: bool = False,
+                             ):
+        """
+        Получить списки заявок bid/ask для ценных бумаг
+
+        :param depth: Глубина стакана
+        :param sec_ls: Список ценных бумаг
+        :param concurrency: Максимум одновременных запросов
+        :param timeout: Таймаут на одну бумагу в секундах
+        :param return_errors: Вернуть тройки с текстом ошибки по бумаге
+        :param typed: Вернуть стаканы models.Book вместо JSON
+        :return: [(Название бумаги, JSON), ... ]
+         или [(Название бумаги, JSON, ошибка), ... ]
+        """
+        if sec_ls is None:
+            return None
+        if isinstance(sec_ls, str):
+            sec_ls = [sec_ls]
+        _, exchange = self._account()
+        results = await fetch_orderbooks(
+            self.session, self.url_api, exchange, sec_ls, depth,
+            await self._headers(), concurrency=concurrency, timeout=timeout,
+            limiter=self.limiter)
+        return Api._orderbooks_result(results, return_errors, typed)
+
+    async def get_today_trades(self,
+                               ticker: str,
+                               exchange: str = None,
+                               start: int = None,
+                               finish: int = None,
+                               typed: bool = False,
+                               ):
+        """
+        Запросить данные о всех сделках (лента) по ценным бумагам
+        за сегодняшний день. Если указать UTC метки start и finish,
+        вернет данные трейдов в промежутке между ними.
+
+        :param exchange: Биржа : MOEX, SPBX
+        :param ticker: Инструмент GAZP
+        :param start: Начало отрезка времени (UTC) для фильтра результатов
+        :param finish: Конец отрезка времени (UTC) для фильтра результатов
+        :param typed: Вернуть models.Trade вместо JSON
+        :return: Simple JSON
+        """
+        _, exchange = self._account(exchange=exchange)
+        query = {'from': start, 'to': finish}
+        return await self._get(
+            f'{self.url_api}/md/v2/Securities/{exchange}/{ticker}/alltrades',
+            params=query,
+            model=Trade if typed else None)
+
+    def iter_today_trades(self,
+                          ticker: str,
+                          exchange: str = None,
+                          start: int = None,
+                          finish: int = None,
+                          fields: tuple = None,
+                          ):
+        """
+        Потоковый вариант get_today_trades()
+
+        :param exchange: Биржа : MOEX, SPBX
+        :param ticker: Инструмент GAZP
+        :param start: Начало отрезка времени (UTC) для фильтра результатов
+        :param finish: Конец отрезка времени (UTC) для фильтра результатов
+        :param fields: Оставить только эти поля, например ('price', 'qty')
+        :return: Асинхронный генератор Simple JSON
+        """
+        _, exchange = self._account(exchange=exchange)
+        query = {'from': start, 'to': finish}
+        return self._iter(
+            f'{self.url_api}/md/v2/Securities/{exchange}/{ticker}/alltrades',
+            params=query, fields=fields)
+
+    async def get_futures_quotes(self, symbol: str, exchange: str = None):
+        """
+        Запрос информации о фьючерсах (ближайшем)
+
+        :param exchange: Биржа MOEX
+        :param symbol: Инструмент SBRF
+        :return: Simple JSON
+        """
+        _, exchange = self._account(exchange=exchange)
+        return await self._get(
+            f'{self.url_api}/md/v2/Securities/'
+            f'{exchange}/{symbol}/actualFuturesQuote',
+            ttl=CACHE_TTL['futures_quotes'])
+
+    async def get_history(self,
+                          ticker: str,
+                          start: int,
+                          finish: int,
+                          tfs: int,
+                          exchange: str = None
+                          ):
+        """
+        Запрос истории рынка для выбранных биржи и финансового инструмента.
+
+        :param exchange: Биржа - допустимые значения MOEX, SPBX
+        :param ticker: Код инструмента SBER
+        :param start: От (unix time seconds)
+        :param finish: До (unix time seconds)
+        :param tfs: Длительность таймфрейма в секундах.
+         Допустимые значения 15, 60, 300, 900, 3600, 86400
+        :return: Simple JSON
+        """
+        status, body = await self._history(ticker, start, finish, tfs,
+                                           exchange)
+        return self._check_results(status, body,
+                                   url=f'{self.url_api}/md/v2/history')
+
+    async def _history(self, ticker: str, start: int, finish: int,
+                       tfs: int, exchange: str = None) -> tuple:
+        """
+        Запрос get_history() без разбора ответа, для HistoryLoader
+
+        :return: (HTTP статус, тело ответа)
+        """
+        _, exchange = self._account(exchange=exchange)
+        payload = {
+            'exchange': exchange,
+            'symbol': ticker,
+            'from': start,
+            'to': finish,
+            'tf': tfs}
+        return await self._request('GET', f'{self.url_api}/md/v2/history',
+                                   params=payload)
+
+    # ------------- Другое --------------------------
+    async def get_time(self):
+        """
+        Запрос текущего UTC времени в формате Unix. Время берется из
+        кеша как смещение часов сервера относительно локальных.
+
+        :return:
+        """
+        url = f'{self.url_api}/md/v2/time'
+        key = request_key('GET', url)
+        offset = None if self.cache is None else self.cache.get(key)
+        if offset is not None:
+            return int(time.time() + offset)
+        result = await self._get(url)
+        if result is not None and self.cache is not None:
+            self.cache.set(key, result - time.time(), CACHE_TTL['time'])
+        return result
+
+    # ------------- Работа с заявками ---------------
+
+    async def get_routing(self):
+        """
+        Таблица маршрутов заявок, загружается из get_portfolios() один раз.
+        После ошибки повторная загрузка не раньше, чем через
+        ROUTING_RETRY_DELAY секунд.
+
+        :return: RoutingTable или None, если портфели не получены
+        """
+        if self._routing is None and \
+                time.monotonic() >= self._routing_retry_at:
+            portfolios = await self.get_portfolios()
+            if portfolios:
+                self._routing = RoutingTable(portfolios)
+            else:
+                self._routing_retry_at = \
+                    time.monotonic() + ROUTING_RETRY_DELAY
+        return self._routing
+
+    async def route(self, ticker: str = None, portfolio: str = None,
+                    exchange: str = None):
+        """
+        Маршрут заявки: портфель, tks (account) и код торгового сервера,
+        см. Api.route()
+
+        :return: Route или None
+        """
+        routing = await self.get_routing()
+        if routing is None:
+            return None
+        if portfolio is not None:
+            return routing.for_portfolio(portfolio, exchange)
+        if ticker is None:
+            return None
+        key = ticker, exchange
+        if time.monotonic() < self._unresolved.get(key, 0.0):
+            return None
+        security = await self.get_security_info(ticker, exchange)
+        if not security:
+            self._unresolved[key] = time.monotonic() + ROUTING_RETRY_DELAY
+            return None
+        self._unresolved.pop(key, None)
+        market, kind = instrument_type(security)
+        return routing.resolve(market, exchange, kind)
+
+    async def _route(self, ticker, portfolio, exchange) -> Route:
+        route = await self.route(ticker, portfolio, exchange)
+        if route is None:
+            return Route(None, portfolio, None, DEFAULT_TRADE_SERVER)
+        return route._replace(portfolio=portfolio or route.portfolio)
+
+    async def _command(self, method: str, url: str, request_id: str = None,
+                       **kwargs):
+        headers = await self._auth(url)
+        if headers is None:
+            return None
+        if request_id is not None:
+            headers = dict(headers, **{'X-ALOR-REQID': request_id})
+        status, body = await self._request(method, url, headers=headers,
+                                           **kwargs)
+        if body in (b'success', b'Succeeded'):
+            return body.decode()
+        return self._check_results(status, body, url=url)
+
+    async def set_market_order(self, ticker: str,
+                               side: str,
+                               quantity: int,
+                               portfolio: str = None,
+                               exchange: str = None,
+                               order_id: str = None):
+        """
+        Создание рыночной заявки ПО РЫНКУ
+
+        :param exchange: Биржа MOEX, SPBX
+        :param ticker: Инструмент GDH1
+        :param side: Купить или продать по рынку sell, buy
+        :param quantity: Количество лотов
+        :param portfolio: Идентификатор клиентского портфеля
+        :param order_id: Уникальная строка ордера
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        route = await self._route(ticker, portfolio, exchange)
+        portfolio = route.portfolio
+        if not order_id:
+            order_id = self._random_order_id
+        payload = self._payload(ticker, side, quantity, type_order='market',
+                                exchange=exchange, portfolio=portfolio)
+        return await self._command(
+            'POST',
+            f'{self.url_api}/commandapi/warptrans/'
+            f'{route.trade_server_code}/v2/client/orders/actions/market',
+            request_id=f'{portfolio};{order_id}',
+            json=payload)
+
+    async def set_limit_order(self,
+                              ticker: str,
+                              side: str,
+                              quantity: int,
+                              price: float,
+                              portfolio: str = None,
+                              exchange: str = None,
+                              order_id: str = None,
+                              ):
+        """
+        Создание отложенной рыночной заявки (LIMIT)
+
+        :param exchange: Биржа MOEX, SPBX
+        :param ticker: Инструмент GDH1
+        :param side: Купить или продать по рынку sell, buy
+        :param quantity: Количество лотов
+        :param price: Цена
+        :param portfolio: Идентификатор клиентского портфеля
+        :param order_id: Уникальная строка ордера
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        route = await self._route(ticker, portfolio, exchange)
+        portfolio = route.portfolio
+        if not order_id:
+            order_id = self._random_order_id
+        payload = self._payload(ticker, side, quantity,
+                                type_order='limit',
+                                price=price,
+                                exchange=exchange,
+                                portfolio=portfolio)
+        return await self._command(
+            'POST',
+            f'{self.url_api}/commandapi/warptrans/'
+            f'{route.trade_server_code}/v2/client/orders/actions/limit',
+            request_id=f'{portfolio};{order_id}',
+            json=payload)
+
+    async def set_orders(self, orders: list,
+                         concurrency: int = BATCH_CONCURRENCY,
+                         rate: float = BATCH_RATE,
+                         retries: int = BATCH_RETRIES):
+        """
+        Пакетное создание рыночных и лимитных заявок, см. BatchOrders
+
+        :param orders: Список заявок [{'ticker', 'side', 'quantity',
+         'price', 'portfolio', 'exchange', 'order_id'}, ...], без price -
+         рыночная заявка
+        :param concurrency: Максимум одновременных запросов
+        :param rate: Максимум заявок в секунду
+        :param retries: Сколько раз повторять заявку после сетевой ошибки
+        :return: [OrderResult] в порядке orders
+        """
+        batch = BatchOrders(self, concurrency=concurrency, rate=rate,
+                            retries=retries)
+        return await batch.submit(orders)
+
+    def _stop_payload(self, ticker, side, quantity, price, account,
+                      portfolio, exchange):
+        return {
+            "Quantity": quantity,
+            "Side": side,
+            "TriggerPrice": price,
+            "Instrument": {
+                "Symbol": ticker,
+                "Exchange": exchange
+            },
+            "User": {
+                "Account": account,
+                "Portfolio": portfolio
+            },
+            "OrderEndUnixTime": 0
+        }
+
+    async def set_stoploss(self,
+                           ticker: str,
+                           side: str,
+                           quantity: int,
+                           price: float,
+                           trade_server_code: str = None,
+                           account: str = None,
+                           portfolio: str = None,
+                           exchange: str = None,
+                           order_id: str = None,
+                           ):
+        """
+        Создание стоп лосс заявки
+
+        :param account: Значение tks из выдачи get_portfolios(),
+        например (L01-00000F00), по умолчанию из таблицы маршрутов
+        :param trade_server_code: Код сервера, TRADE для фондового рынка, FX1
+        для валютного, по умолчанию из таблицы маршрутов
+        :param exchange: Биржа MOEX, SPBX
+        :param ticker: Инструмент GDH1
+        :param side: Купить или продать по рынку sell, buy
+        :param quantity: Количество лотов
+        :param price: Цена
+        :param portfolio: Идентификатор клиентского портфеля
+        из выдачи get_portfolios()
+        :param order_id: Уникальная строка ордера
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        if trade_server_code is None or account is None or portfolio is None:
+            route = await self._route(ticker, portfolio, exchange)
+            portfolio = route.portfolio
+            account = account or route.tks
+            trade_server_code = trade_server_code or route.trade_server_code
+        if not order_id:
+            order_id = self._random_order_id
+        payload = self._stop_payload(ticker, side, quantity, price, account,
+                                     portfolio, exchange)
+        return await self._command(
+            'POST',
+            f'{self.url_api}/warptrans/{trade_server_code}/'
+            f'v2/client/orders/actions/stopLoss',
+            request_id=order_id,
+            json=payload)
+
+    async def set_take_profit(self,
+                              ticker: str,
+                              side: str,
+                              quantity: int,
+                              price: float,
+                              trade_server_code: str = None,
+                              account: str = None,
+                              portfolio: str = None,
+                              exchange: str = None,
+                              order_id: str = None,
+                              ):
+        """
+        Создание тэйк-профит заявки
+
+        :param account: Значение tks из выдачи get_portfolios(),
+        например (L01-00000F00), по умолчанию из таблицы маршрутов
+        :param trade_server_code: Код сервера, TRADE для фондового рынка, FX1
+        для валютного, по умолчанию из таблицы маршрутов
+        :param exchange: Биржа MOEX, SPBX
+        :param ticker: Инструмент GDH1
+        :param side: Купить или продать по рынку sell, buy
+        :param quantity: Количество лотов
+        :param price: Цена
+        :param portfolio: Идентификатор клиентского портфеля
+        из выдачи get_portfolios()
+        :param order_id: Уникальная строка ордера
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        if trade_server_code is None or account is None or portfolio is None:
+            route = await self._route(ticker, portfolio, exchange)
+            portfolio = route.portfolio
+            account = account or route.tks
+            trade_server_code = trade_server_code or route.trade_server_code
+        if not order_id:
+            order_id = self._random_order_id
+        payload = self._stop_payload(ticker, side, quantity, price, account,
+                                     portfolio, exchange)
+        return await self._command(
+            'POST',
+            f'{self.url_api}/warptrans/{trade_server_code}/'
+            f'v2/client/orders/actions/takeProfit',
+            request_id=order_id,
+            json=payload)
+
+    async def change_market_order(self,
+                                  ticker: str,
+                                  side: str,
+                                  quantity: int,
+                                  order_id: str,
+                                  portfolio: str = None,
+                                  exchange: str = None,
+                                  ):
+        """
+        Правка рыночной заявки ПО РЫНКУ
+
+        :param exchange: Биржа MOEX, SPBX
+        :param ticker: Инструмент GDH1
+        :param side: Купить или продать по рынку sell, buy
+        :param quantity: Количество лотов
+        :param portfolio: Идентификатор клиентского портфеля
+        :param order_id: Уникальная строка ордера
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        route = await self._route(ticker, portfolio, exchange)
+        portfolio = route.portfolio
+        payload = self._payload(ticker, side, quantity, type_order='market',
+                                exchange=exchange, )
+        return await self._command(
+            'PUT',
+            f'{self.url_api}/commandapi/warptrans/'
+            f'{route.trade_server_code}/v2/client/orders/actions/market/'
+            f'{order_id}',
+            request_id=f'{portfolio};{order_id};{quantity}',
+            json=payload)
+
+    async def change_limit_order(self,
+                                 ticker: str,
+                                 side: str,
+                                 quantity: int,
+                                 price: float,
+                                 order_id: str,
+                                 portfolio: str = None,
+                                 exchange: str = None,
+                                 ):
+        """
+        Изменение отложенной рыночной заявки (LIMIT)
+
+        :param exchange: Биржа MOEX, SPBX
+        :param ticker: Инструмент GDH1
+        :param side: Купить или продать по рынку sell, buy
+        :param quantity: Количество лотов
+        :param price: Цена
+        :param portfolio: Идентификатор клиентского портфеля
+        :param order_id: Уникальная строка ордера
+        :return: Simple JSON
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        route = await self._route(ticker, portfolio, exchange)
+        portfolio = route.portfolio
+        payload = self._payload(ticker, side, quantity, type_order='limit',
+                                price=price,
+                                exchange=exchange,
+                                portfolio=portfolio)
+        return await self._command(
+            'PUT',
+            f'{self.url_api}/commandapi/warptrans/'
+            f'{route.trade_server_code}/v2/client/orders/actions/limit/'
+            f'{order_id}',
+            request_id=f'{portfolio};{order_id};{quantity}',
+            json=payload)
+
+    async def cancel_order(self,
+                           order_id: str,
+                           stop: bool,
+                           exchange: str = None,
+                           portfolio: str = None,
+                           ):
+        """
+        Снятие заявки
+
+        :param exchange:
+        :param portfolio:
+        :param order_id:
+        :param stop:
+        :return:
+        """
+        portfolio, exchange = self._account(portfolio, exchange)
+        route = await self._route(None, portfolio, exchange)
+        payload = {
+            'exchange': exchange,
+            'portfolio': portfolio,
+            'account': self.username,
+            'stop': 'true' if stop else 'false',
+            'format': 'Simple'
+        }
+        path_part = '/commandapi' if not stop else ''
+        return await self._command(
+            'DELETE',
+            f'{self.url_api}{path_part}/warptrans/'
+            f'{route.trade_server_code}/v2/client/orders/{order_id}',
+            params=payload)
+
+    async def set_group_order(
+            self,
+            order_ids: List[int],
+            exchange: str = None,
+            portfolio: str = None,
+            order_type: str = 'Limit',
+    ):
+        """
+        Сгруппировать ордера (для последующей отмены разом, например)
+        :return:
+        """
+        payload = {
+            'Orders': list(),
+            'ExecutionPolicy': 'OnExecuteOrCancel'
+        }
+        portfolio, exchange = self._account(portfolio, exchange)
+        default_order = {
+            'Portfolio': portfolio,
+            'Exchange': exchange,
+            'OrderId': 0,
+            'Type': order_type
+        }
+        for order_id in order_ids:
+            order = copy(default_order)
+            order['OrderId'] = order_id
+            payload['Orders'].append(order)
+        return await self._command(
+            'POST',
+            f'{self.url_api}/commandapi/api/orderGroups',
+            json=payload)
+
+    async def cancel_orders_group(self, group_id: str):
+        """
+        Отмена группирования
+        :param group_id:
+        :return:
+        """
+        return await self._command(
+            'DELETE',
+            f'{self.url_api}/commandapi/api/orderGroups/{group_id}')
+
+    async def get_orders_group(self, group_id: str):
+        """
+        Получить инфо по группе ордеров
+        :param group_id:
+        :return:
+        """
+        return await self._get(
+            f'{self.url_api}/commandapi/api/orderGroups/{group_id}')
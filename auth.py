@@ -0,0 +1,217 @@
+import asyncio
+import json
+import threading
+import time
+from json import JSONDecodeError
+
+import aiohttp
+import requests
+
+from log import logger
+from settings import (
+    URL_OAUTH,
+    LOGGING, TTL_JWT_TOKEN, TOKEN_REFRESH_MARGIN,
+    HTTP_TIMEOUT
+)
+
+RETRY_DELAY = 1
+
+
+class TokenManager:
+    """
+    JWT токен и готовые заголовки авторизации.
+
+    Токен обновляется заранее, за margin секунд до истечения ttl, в
+    фоновом потоке (start) или фоновой задаче event loop (start_async),
+    поэтому запросы не ждут обращения к серверу авторизации. Обновление
+    всегда выполняет только один вызывающий: остальные ждут на блокировке
+    и получают уже новый токен.
+
+    Заголовки кешируются одним словарем, изменять его нельзя - для
+    дополнительных заголовков делайте копию.
+    """
+
+    def __init__(self,
+                 refresh_token: str,
+                 url_oauth: str = URL_OAUTH,
+                 ttl: int = TTL_JWT_TOKEN,
+                 margin: int = TOKEN_REFRESH_MARGIN,
+                 session: requests.Session = None,
+                 timeout: tuple = HTTP_TIMEOUT,
+                 ):
+        """
+        :param refresh_token: Токен обновления
+        :param url_oauth: Адрес сервера авторизации
+        :param ttl: Время жизни JWT токена в секундах
+        :param margin: За сколько секунд до истечения обновлять токен
+        :param session: Сессия requests для синхронного обновления
+        :param timeout: Таймауты (подключение, чтение) в секундах
+        """
+        self.refresh_token = refresh_token
+        self.url_oauth = url_oauth
+        self.ttl = ttl
+        self.margin = min(margin, ttl / 2)
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.jwt_token = None
+        self.headers = None
+        self.error = False
+        self.refreshes = 0
+        self._issued = None
+        self._lock = threading.Lock()
+        self._async_lock = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._task = None
+
+    def _age(self) -> float:
+        if self._issued is None:
+            return float('inf')
+        return time.monotonic() - self._issued
+
+    @property
+    def expired(self) -> bool:
+        return self._age() > self.ttl
+
+    def _due(self) -> bool:
+        return self._age() > self.ttl - self.margin
+
+    def _delay(self) -> float:
+        """
+        Сколько ждать фоновому обновлению до следующей попытки
+        """
+        if self.error:
+            return RETRY_DELAY
+        return max(self.ttl - self.margin - self._age(), 0)
+
+    def _inline_refresh_needed(self, background) -> bool:
+        if background is None:
+            return self._due()
+        return self.expired
+
+    def _set(self, status: int, body: bytes):
+        if status != 200:
+            if LOGGING:
+                logger.error('Ошибка получения JWT токена: %s', status)
+            self.error = True
+            return
+        try:
+            jwt = json.loads(body).get('AccessToken')
+        except JSONDecodeError as e:
+            if LOGGING:
+                logger.error('Ошибка декодирования JWT токена: %s', e)
+            self.error = True
+            return
+        self.jwt_token = jwt
+        self.headers = {"Content-Type": "application/json",
+                        "Authorization": f"Bearer {jwt}"
+                        }
+        self._issued = time.monotonic()
+        self.error = False
+        self.refreshes += 1
+
+    # ------------- Синхронные клиенты ---------------
+
+    def refresh(self, force: bool = False):
+        """
+        Обновить токен, если он устарел (или force). Параллельные вызовы
+        ждут первый и не делают повторный запрос.
+
+        :return: JWT или None
+        """
+        with self._lock:
+            if force or self._due():
+                try:
+                    res = self.session.post(
+                        url=f'{self.url_oauth}/refresh',
+                        params={'token': self.refresh_token},
+                        timeout=self.timeout
+                    )
+                    self._set(res.status_code, res.content)
+                except requests.RequestException as e:
+                    if LOGGING:
+                        logger.error('Ошибка получения JWT токена: %s', e)
+                    self.error = True
+        return self.jwt_token
+
+    def get_headers(self):
+        """
+        :return: Заголовки авторизации или None
+        """
+        if self._inline_refresh_needed(self._thread):
+            self.refresh()
+        return self.headers
+
+    def start(self):
+        """
+        Запустить фоновый поток заблаговременного обновления
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name='alor-token', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self._delay()):
+            self.refresh()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    # ------------- Асинхронные клиенты ---------------
+
+    async def refresh_async(self, session: aiohttp.ClientSession,
+                            force: bool = False):
+        """
+        То же, что refresh(), но через aiohttp сессию, не блокируя loop
+
+        :return: JWT или None
+        """
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if force or self._due():
+                try:
+                    async with session.post(
+                            url=f'{self.url_oauth}/refresh',
+                            params={'token': self.refresh_token}) as res:
+                        self._set(res.status, await res.read())
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if LOGGING:
+                        logger.error('Ошибка получения JWT токена: %s', e)
+                    self.error = True
+        return self.jwt_token
+
+    async def get_headers_async(self, session: aiohttp.ClientSession):
+        """
+        :return: Заголовки авторизации или None
+        """
+        if self._inline_refresh_needed(self._task):
+            await self.refresh_async(session)
+        return self.headers
+
+    def start_async(self, session: aiohttp.ClientSession):
+        """
+        Запустить фоновую задачу обновления в текущем event loop
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(
+                self._run_async(session))
+
+    async def _run_async(self, session: aiohttp.ClientSession):
+        while True:
+            await asyncio.sleep(self._delay())
+            await self.refresh_async(session)
+
+    async def stop_async(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
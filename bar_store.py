@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import time
+from json import JSONDecodeError
+
+import numpy as np
+
+from history import BAR_DTYPE, merge_bars
+from settings import BAR_STORE_DIR
+
+
+def _merge_ranges(ranges: list) -> list:
+    merged = []
+    for start, finish in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], finish)
+        else:
+            merged.append([start, finish])
+    return merged
+
+
+def _gaps(ranges: list, start: int, finish: int) -> list:
+    """
+    Части интервала [start, finish], не покрытые ranges
+    """
+    gaps = []
+    for left, right in ranges:
+        if right < start or left > finish:
+            continue
+        if left > start:
+            gaps.append((start, left - 1))
+        start = max(start, right + 1)
+    if start <= finish:
+        gaps.append((start, finish))
+    return gaps
+
+
+class BarStore:
+    """
+    Локальное хранилище баров по ключу биржа/тикер/таймфрейм.
+
+    Каждая колонка (time, open, high, low, close, volume) лежит в своем
+    файле и читается через np.memmap, поэтому чтение интервала - это
+    срез без копирования. Новые бары дописываются в конец файлов; если
+    загружена более ранняя история, колонки пересобираются в файлы
+    следующего сегмента. В meta.json хранятся номер текущего сегмента и
+    уже загруженные интервалы времени, и get_history запрашивается
+    только для недостающих.
+
+        store = BarStore(HistoryLoader(alor))
+        bars = await store.get('MOEX', 'SBER', 60, start, finish)
+        bars['close'][-10:]
+    """
+
+    def __init__(self, loader, root: str = BAR_STORE_DIR):
+        """
+        :param loader: HistoryLoader для загрузки недостающих баров
+        :param root: Каталог хранилища
+        """
+        self.loader = loader
+        self.root = root
+        self._maps = {}
+        self._locks = {}
+
+    def _dir(self, exchange: str, ticker: str, tf: int) -> str:
+        return os.path.join(self.root, exchange, ticker, str(tf))
+
+    def _meta(self, path: str) -> dict:
+        try:
+            with open(os.path.join(path, 'meta.json'),
+                      encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, JSONDecodeError):
+            return {'ranges': []}
+
+    def _write_meta(self, path: str, meta: dict):
+        tmp = os.path.join(path, 'meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(path, 'meta.json'))
+
+    def ranges(self, exchange: str, ticker: str, tf: int) -> list:
+        """
+        :return: Загруженные интервалы [[от, до], ...]
+        """
+        return self._meta(self._dir(exchange, ticker, tf))['ranges']
+
+    @staticmethod
+    def _file(path: str, name: str, segment: int) -> str:
+        suffix = f'.{segment}' if segment else ''
+        return os.path.join(path, f'{name}{suffix}.bin')
+
+    def _columns(self, path: str) -> dict:
+        columns = self._maps.get(path)
+        if columns is None:
+            columns = {}
+            segment = self._meta(path).get('segment', 0)
+            for name in BAR_DTYPE.names:
+                file = self._file(path, name, segment)
+                dtype = BAR_DTYPE[name]
+                if os.path.exists(file) and os.path.getsize(file):
+                    columns[name] = np.memmap(file, dtype=dtype, mode='r')
+                else:
+                    columns[name] = np.empty(0, dtype=dtype)
+            self._maps[path] = columns
+        return columns
+
+    def read(self, exchange: str, ticker: str, tf: int,
+             start: int = None, finish: int = None) -> dict:
+        """
+        Прочитать бары из хранилища без обращения к серверу
+
+        :return: {колонка: np.memmap срез}, индексируется как
+         структурированный массив: bars['close']
+        """
+        columns = self._columns(self._dir(exchange, ticker, tf))
+        times = columns['time']
+        left = 0 if start is None else np.searchsorted(times, start, 'left')
+        right = len(times) if finish is None else \
+            np.searchsorted(times, finish, 'right')
+        return {name: column[left:right] for name, column in columns.items()}
+
+    def _write(self, path: str, bars: np.ndarray, meta: dict):
+        os.makedirs(path, exist_ok=True)
+        stored = self._columns(path)
+        self._maps.pop(path, None)
+        segment = meta.get('segment', 0)
+        if not (len(stored['time']) and len(bars) and
+                bars['time'][0] <= stored['time'][-1]):
+            for name in BAR_DTYPE.names:
+                with open(self._file(path, name, segment), 'ab') as f:
+                    f.write(np.ascontiguousarray(bars[name]).tobytes())
+            return
+        # более ранняя история: пересобрать колонки. Старые файлы могут
+        # быть открыты через memmap (в том числе срезами read()), а на
+        # Windows такой файл нельзя заменить, поэтому пишем новый
+        # сегмент и переключаемся на него через meta.json
+        old = np.empty(len(stored['time']), dtype=BAR_DTYPE)
+        for name in BAR_DTYPE.names:
+            old[name] = stored[name]
+        del stored
+        bars = merge_bars([old, bars])
+        meta['segment'] = segment + 1
+        current = set()
+        for name in BAR_DTYPE.names:
+            file = self._file(path, name, meta['segment'])
+            current.add(os.path.basename(file))
+            with open(file, 'wb') as f:
+                f.write(np.ascontiguousarray(bars[name]).tobytes())
+        self._write_meta(path, meta)
+        for file in os.listdir(path):
+            if file.endswith('.bin') and file not in current:
+                try:
+                    os.remove(os.path.join(path, file))
+                except OSError:
+                    # еще открыт, удалится при следующей пересборке
+                    pass
+
+    async def update(self, exchange: str, ticker: str, tf: int,
+                     start: int, finish: int):
+        """
+        Догрузить недостающие в хранилище бары интервала.
+        Текущий, еще не закрытый бар не сохраняется.
+        """
+        path = self._dir(exchange, ticker, tf)
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            closed = int(time.time()) // tf * tf - 1
+            finish = min(finish, closed)
+            meta = self._meta(path)
+            for gap_start, gap_finish in _gaps(meta['ranges'], start,
+                                               finish):
+                bars, failed = await self.loader.load_windows(
+                    ticker, gap_start, gap_finish, tf, exchange=exchange)
+                if len(bars):
+                    self._write(path, bars, meta)
+                if not failed:
+                    meta['ranges'] = _merge_ranges(
+                        meta['ranges'] + [[gap_start, gap_finish]])
+                    os.makedirs(path, exist_ok=True)
+                    self._write_meta(path, meta)
+
+    async def get(self, exchange: str, ticker: str, tf: int,
+                  start: int, finish: int) -> dict:
+        """
+        Бары интервала: недостающие загружаются, остальные читаются
+        с диска
+
+        :return: {колонка: np.memmap срез}
+        """
+        await self.update(exchange, ticker, tf, start, finish)
+        return self.read(exchange, ticker, tf, start, finish)
@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import aiohttp
+
+from log import logger
+from settings import LOGGING, BATCH_CONCURRENCY, BATCH_RATE, BATCH_RETRIES
+
+
+class OrderResult:
+    """
+    Результат одной заявки пакета
+    """
+
+    __slots__ = ('spec', 'order_id', 'result', 'error', 'latency',
+                 'attempts')
+
+    def __init__(self, spec: dict, order_id: str):
+        self.spec = spec
+        self.order_id = order_id
+        self.result = None
+        self.error = None
+        self.latency = None
+        self.attempts = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.result is not None
+
+    def __repr__(self):
+        return (f'OrderResult({self.spec.get("ticker")}, '
+                f'order_id={self.order_id}, ok={self.ok}, '
+                f'latency={self.latency}, error={self.error})')
+
+
+class BatchOrders:
+    """
+    Пакетная отправка заявок через AsyncApi.
+
+    Заявки уходят параллельно по соединениям пула сессии, не больше
+    concurrency одновременно и не чаще rate в секунду. Уникальная строка
+    ордера назначается каждой заявке до отправки, поэтому повтор после
+    сетевой ошибки или таймаута уходит с тем же X-ALOR-REQID и не создает
+    дубль на сервере. Ответ сервера с ошибкой не повторяется.
+
+        batch = BatchOrders(alor)
+        results = await batch.submit([
+            {'ticker': 'SBER', 'side': 'buy', 'quantity': 1},
+            {'ticker': 'GAZP', 'side': 'sell', 'quantity': 2,
+             'price': 150.5},
+        ])
+    """
+
+    def __init__(self, api,
+                 concurrency: int = BATCH_CONCURRENCY,
+                 rate: float = BATCH_RATE,
+                 retries: int = BATCH_RETRIES):
+        """
+        :param api: AsyncApi
+        :param concurrency: Максимум одновременных запросов
+        :param rate: Максимум заявок в секунду, None - без ограничения
+        :param retries: Сколько раз повторять заявку после сетевой ошибки
+        """
+        self.api = api
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self._next_slot = 0
+
+    async def _wait_slot(self):
+        """
+        Равномерно распределить отправку заявок в пределах rate
+        """
+        if not self.rate:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def _send(self, spec: dict, order_id: str):
+        kwargs = {'portfolio': spec.get('portfolio'),
+                  'exchange': spec.get('exchange'),
+                  'order_id': order_id}
+        if spec.get('price') is None:
+            return self.api.set_market_order(
+                spec['ticker'], spec['side'], spec['quantity'], **kwargs)
+        return self.api.set_limit_order(
+            spec['ticker'], spec['side'], spec['quantity'], spec['price'],
+            **kwargs)
+
+    async def _dispatch(self, semaphore, order: OrderResult):
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+                await self._wait_slot()
+                order.attempts += 1
+                start = time.perf_counter()
+                try:
+                    order.result = await self._send(order.spec,
+                                                    order.order_id)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    order.error = str(e) or type(e).__name__
+                    if LOGGING:
+                        logger.error('Ошибка отправки заявки %s: %s',
+                                     order.order_id, order.error)
+                    continue
+                finally:
+                    order.latency = time.perf_counter() - start
+                order.error = None if order.ok else 'Заявка отклонена'
+                return order
+        return order
+
+    async def submit(self, orders: list) -> list:
+        """
+        Отправить пакет заявок
+
+        :param orders: Список заявок [{'ticker', 'side', 'quantity',
+         'price', 'portfolio', 'exchange', 'order_id'}, ...], без price -
+         рыночная заявка, portfolio, exchange и order_id необязательны
+        :return: [OrderResult] в порядке orders
+        """
+        results = [OrderResult(spec, spec.get('order_id')
+                               or self.api._random_order_id)
+                   for spec in orders]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._dispatch(semaphore, order)
+                               for order in results))
+        return results
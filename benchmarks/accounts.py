@@ -0,0 +1,70 @@
+"""
+Полная картина по всем портфелям клиента (позиции, сводка, риски,
+риски FORTS): последовательные вызовы с переключением alor.portfolio
+против одного get_accounts() с параллельными запросами.
+
+Запуск из корня репозитория:
+    python -m benchmarks.accounts [задержка сервера, мс]
+"""
+import asyncio
+import sys
+import time
+
+from async_client import AsyncApi
+from benchmarks.mock_server import MockServer
+from client import Api
+
+METHODS = ('get_positions_info', 'get_summary_info', 'get_risk_info',
+           'get_fortrisk_info')
+
+
+def sequential(alor: Api) -> dict:
+    result = {}
+    for portfolio in alor.routing.markets:
+        alor.portfolio = portfolio
+        result[portfolio] = {name: getattr(alor, name)()
+                             for name in METHODS}
+    alor.portfolio = None
+    return result
+
+
+async def gathered(server: MockServer) -> dict:
+    async with AsyncApi('refresh', 'P000000', url_api=server.url,
+                        url_oauth=server.url, cache=False) as alor:
+        await alor.get_routing()
+        start = time.perf_counter()
+        result = await alor.get_accounts()
+        return result, time.perf_counter() - start
+
+
+def measure(name: str, call):
+    start = time.perf_counter()
+    result = call()
+    report(name, time.perf_counter() - start, result)
+    return result
+
+
+def report(name: str, elapsed: float, result: dict):
+    calls = sum(map(len, result.values()))
+    print(f'{name:<40} {elapsed * 1000:8.1f} мс   запросов {calls}')
+
+
+def main(delay_ms: float = 20):
+    with MockServer(isolated=True, response_delay=delay_ms / 1000) as server:
+        with Api('refresh', 'P000000', url_api=server.url,
+                 url_oauth=server.url, cache=False) as alor:
+            alor.exchange = 'MOEX'
+            portfolios = list(alor.routing.markets)
+            print(f'Задержка сервера {delay_ms} мс, '
+                  f'портфелей {len(portfolios)}')
+            measure('последовательно, alor.portfolio = ...',
+                    lambda: sequential(alor))
+            result = measure('Api.get_accounts()', alor.get_accounts)
+            gathered_result, elapsed = asyncio.run(gathered(server))
+            report('AsyncApi.get_accounts()', elapsed, gathered_result)
+            for portfolio, data in result.items():
+                print(f'  {portfolio}: {", ".join(data)}')
+
+
+if __name__ == '__main__':
+    main(*(float(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,63 @@
+"""
+Скорость аналитики ленты на синтетической ленте из миллионов сделок
+в сравнении с обходом списка словарей в Python.
+
+Запуск из корня репозитория:
+    python -m benchmarks.analytics [количество сделок]
+"""
+import sys
+import time
+
+import numpy as np
+
+import analytics
+
+
+def synthetic_tape(count: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    tape = np.empty(count, dtype=analytics.TRADE_DTYPE)
+    tape['timestamp'] = 1_700_000_000_000 + np.cumsum(
+        rng.integers(0, 20, count))
+    tape['id'] = np.arange(count)
+    tape['price'] = 100 + np.cumsum(rng.normal(0, 0.01, count))
+    tape['qty'] = rng.integers(1, 100, count)
+    tape['side'] = rng.choice([analytics.BUY, analytics.SELL], count)
+    return tape
+
+
+def timed(name: str, call):
+    start = time.perf_counter()
+    call()
+    print(f'{name:<36} {(time.perf_counter() - start) * 1000:10.1f} ms')
+
+
+def python_vwap(trades: list) -> float:
+    turnover = volume = 0
+    for trade in trades:
+        turnover += trade['price'] * trade['qty']
+        volume += trade['qty']
+    return turnover / volume
+
+
+def main(count: int = 5_000_000):
+    tape = synthetic_tape(count)
+    print(f'{count} сделок')
+    timed('vwap', lambda: analytics.vwap(tape))
+    timed('cumulative_vwap', lambda: analytics.cumulative_vwap(tape))
+    timed('rolling_volume 60s', lambda: analytics.rolling_volume(tape, 60000))
+    timed('imbalance 60s', lambda: analytics.imbalance(tape, 60000))
+    timed('time_bars 60s', lambda: analytics.time_bars(tape, 60))
+    timed('tick_bars 1000', lambda: analytics.tick_bars(tape, 1000))
+    timed('volume_bars 50000', lambda: analytics.volume_bars(tape, 50000))
+
+    sample = min(count, 1_000_000)
+    trades = [{'timestamp': int(t), 'id': int(i), 'price': float(p),
+               'qty': int(q), 'side': 'buy' if s > 0 else 'sell'}
+              for t, i, p, q, s in tape[:sample].tolist()]
+    print(f'\n{sample} сделок в виде JSON (список словарей)')
+    timed('trades_to_array', lambda: analytics.trades_to_array(trades))
+    timed('vwap циклом Python', lambda: python_vwap(trades))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
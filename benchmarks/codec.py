@@ -0,0 +1,61 @@
+"""
+Скорость разбора больших ответов (выгрузка справочника инструментов,
+лента сделок за день) и кодирования тела заявки: json из стандартной
+библиотеки против codec (orjson, если установлен).
+
+Запуск из корня репозитория:
+    python -m benchmarks.codec [количество сделок]
+"""
+import json
+import sys
+import timeit
+
+import codec
+from benchmarks.models import trades_response
+
+
+def securities_response(count: int) -> bytes:
+    return json.dumps([
+        {'symbol': f'SEC{i}', 'shortname': f'Security {i}',
+         'description': f'Описание инструмента {i}', 'exchange': 'MOEX',
+         'type': 'Акции обыкновенные', 'lotsize': 10, 'facevalue': 1.0,
+         'cfiCode': 'ESVUFR', 'cancellation': '2099-01-01T00:00:00Z',
+         'minstep': 0.01, 'rating': 0, 'marginbuy': 100.0,
+         'marginsell': 100.0, 'marginrate': 0.25, 'pricestep': 0.01,
+         'priceMax': 300.0, 'priceMin': 200.0, 'theorPrice': 0,
+         'theorPriceLimit': 0, 'volatility': 0, 'currency': 'RUB',
+         'ISIN': f'RU{i:010d}', 'yield': None, 'primary_board': 'TQBR',
+         'tradingStatus': 17, 'tradingStatusInfo': 'нормальный период торгов',
+         'complexProductCategory': '', 'priceMultiplier': 1,
+         'priceShownUnits': 1}
+        for i in range(count)], ensure_ascii=False).encode()
+
+
+ORDER = {'side': 'buy', 'type': 'limit', 'quantity': 1, 'price': 250.5,
+         'instrument': {'symbol': 'SBER', 'exchange': 'MOEX'},
+         'user': {'account': 'P000000', 'portfolio': 'D00031'}}
+
+
+def compare(name: str, stdlib, fast, number: int):
+    base = timeit.timeit(stdlib, number=number) / number
+    faster = timeit.timeit(fast, number=number) / number
+    print(f'{name:<36} json {base * 1000:9.3f} ms   '
+          f'{codec.BACKEND} {faster * 1000:9.3f} ms   x{base / faster:.1f}')
+
+
+def main(trades: int = 1_000_000):
+    print(f'codec: {codec.BACKEND}')
+    securities = securities_response(20_000)
+    tape = trades_response(trades)
+    compare(f'справочник 20000 ({len(securities) >> 20} MiB)',
+            lambda: json.loads(securities), lambda: codec.loads(securities),
+            5)
+    compare(f'лента {trades} ({len(tape) >> 20} MiB)',
+            lambda: json.loads(tape), lambda: codec.loads(tape), 3)
+    compare('тело заявки (x1000)',
+            lambda: [json.dumps(ORDER).encode() for _ in range(1000)],
+            lambda: [codec.dumps(ORDER) for _ in range(1000)], 20)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
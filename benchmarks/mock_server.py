@@ -0,0 +1,483 @@
+"""
+Локальный сервер-заглушка, повторяющий маршруты REST API Alor.
+Используется бенчмарками, чтобы не ходить на реальные сервера брокера.
+
+    with MockServer() as server:
+        alor = Api('token', 'P000000',
+                   url_api=server.url, url_oauth=server.url)
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+
+from aiohttp import web
+
+MOCK_JWT = 'mock-jwt-token'
+
+
+def _orderbook(depth: int) -> dict:
+    return {
+        'snapshot': True,
+        'timestamp': int(time.time()),
+        'bids': [{'price': 100 - i * 0.01, 'volume': 10 + i}
+                 for i in range(depth)],
+        'asks': [{'price': 100.01 + i * 0.01, 'volume': 10 + i}
+                 for i in range(depth)],
+    }
+
+
+async def refresh(request):
+    return web.json_response({'AccessToken': MOCK_JWT})
+
+
+async def server_time(request):
+    return web.json_response(int(time.time()))
+
+
+async def portfolios(request):
+    return web.json_response({
+        'Фондовый рынок': [{
+            'portfolio': 'D00031',
+            'tks': 'L01-00000F00',
+            'tradeServersInfo': [{'tradeServerCode': 'TRADE',
+                                  'contracts': 'РЦБ'}],
+        }],
+        'Срочный рынок': [{
+            'portfolio': '7500031',
+            'tks': '7500031',
+            'tradeServersInfo': [{'tradeServerCode': 'FUT1',
+                                  'contracts': 'фьючерсы'}],
+        }],
+        'Валютный рынок': [{
+            'portfolio': 'G00031',
+            'tks': 'MB0063104103',
+            'tradeServersInfo': [{'tradeServerCode': 'FX1',
+                                  'contracts': ''}],
+        }],
+    })
+
+
+async def orders(request):
+    return web.json_response([])
+
+
+def _order(order_id: str) -> dict:
+    return {'id': order_id, 'symbol': 'SBER', 'exchange': 'MOEX',
+            'type': 'limit', 'side': 'buy', 'status': 'working',
+            'qty': 1, 'filled': 0, 'price': 100.0, 'existing': True}
+
+
+async def order(request):
+    return web.json_response(_order(request.match_info['order_id']))
+
+
+async def summary(request):
+    return web.json_response({'buyingPower': 100000.0,
+                              'portfolioEvaluation': 100000.0})
+
+
+def _position(ticker: str) -> dict:
+    return {'symbol': ticker, 'exchange': 'MOEX', 'qty': 10, 'avgPrice': 100.0,
+            'currentVolume': 1000.0, 'unrealisedPl': 0.0, 'isCurrency': False}
+
+
+async def positions(request):
+    """
+    app['positions'] позиций
+    """
+    return web.json_response([_position(f'SEC{i}')
+                              for i in range(request.app['positions'])])
+
+
+async def position(request):
+    return web.json_response(_position(request.match_info['ticker']))
+
+
+async def client_trades(request):
+    ticker = request.match_info.get('ticker', 'SBER')
+    return web.json_response([_trade(i, ticker, request.app['day_start'])
+                              for i in range(10)])
+
+
+async def risk(request):
+    return web.json_response({'portfolio': request.match_info['portfolio'],
+                              'portfolioEvaluation': 100000.0,
+                              'initialMargin': 0.0, 'minimalMargin': 0.0,
+                              'riskCategoryId': 1})
+
+
+async def fortsrisk(request):
+    return web.json_response({'portfolio': request.match_info['portfolio'],
+                              'moneyFree': 100000.0, 'moneyBlocked': 0.0,
+                              'fee': 0.0, 'isLimitsSet': False})
+
+
+async def orderbook(request):
+    depth = int(request.query.get('depth', 5))
+    return web.json_response(_orderbook(depth))
+
+
+async def order_action(request):
+    await request.read()
+    return web.json_response({'message': 'success',
+                              'orderNumber': str(time.time_ns())})
+
+
+async def order_cancel(request):
+    return web.Response(text='success')
+
+
+async def order_group(request):
+    if request.method == 'DELETE':
+        return web.Response(text='success')
+    if request.method == 'POST':
+        await request.read()
+        return web.json_response({'message': 'success',
+                                  'groupId': str(time.time_ns())})
+    return web.json_response({'id': request.match_info['group_id'],
+                              'orders': [], 'status': 'Active'})
+
+
+def _security(exchange: str, i: int) -> dict:
+    return {'symbol': f'SEC{i}', 'shortname': f'Security {i}',
+            'exchange': exchange, 'cfiCode': 'ESXXXX' if i % 2 else 'DBXXXX',
+            'ISIN': f'RU{i:010d}', 'board': 'TQBR' if i % 2 else 'TQCB',
+            'lotsize': 10, 'minstep': 0.01, 'currency': 'RUB'}
+
+
+async def securities(request):
+    """
+    Полная выгрузка инструментов app['securities'] штук, с ETag
+    """
+    exchange = request.match_info['exchange']
+    etag = f'"{exchange}-{request.app["securities"]}"'
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers={'ETag': etag})
+    data = [_security(exchange, i) for i in range(request.app['securities'])]
+    return web.json_response(data, headers={'ETag': etag})
+
+
+async def search(request):
+    exchange = request.query.get('exchange') or 'MOEX'
+    limit = int(request.query.get('limit') or 10)
+    return web.json_response([_security(exchange, i) for i in range(limit)])
+
+
+async def security(request):
+    ticker = request.match_info['ticker']
+    if not ticker.startswith('SEC'):
+        return web.Response(status=404, text='Not found')
+    return web.json_response(
+        _security(request.match_info['exchange'], int(ticker[3:])))
+
+
+async def quotes(request):
+    now = int(time.time())
+    return web.json_response([
+        {'symbol': symbol.split(':')[-1], 'exchange': symbol.split(':')[0],
+         'last_price': 100.0, 'bid': 99.99, 'ask': 100.01,
+         'last_price_timestamp': now}
+        for symbol in request.match_info['symbols'].split(',')])
+
+
+async def futures_quote(request):
+    return web.json_response(
+        {'symbol': f'{request.match_info["symbol"]}-12.99',
+         'exchange': request.match_info['exchange'], 'last_price': 100.0,
+         'last_price_timestamp': int(time.time())})
+
+
+def _trade(i: int, ticker: str, start: int) -> dict:
+    return {'id': i, 'orderno': 0, 'symbol': ticker, 'qty': 1 + i % 10,
+            'price': 100 + (i % 200) * 0.01, 'time': '',
+            'timestamp': start * 1000 + i * 10,
+            'side': 'buy' if i % 3 else 'sell', 'oi': 0, 'existing': False}
+
+
+async def alltrades(request):
+    """
+    Лента app['trades'] сделок за день, фильтр from/to (секунды)
+    """
+    ticker = request.match_info['ticker']
+    start = request.app['day_start']
+    trades = (_trade(i, ticker, start) for i in range(request.app['trades']))
+    if 'from' in request.query:
+        since = int(request.query['from']) * 1000
+        trades = (t for t in trades if t['timestamp'] >= since)
+    if 'to' in request.query:
+        till = int(request.query['to']) * 1000
+        trades = (t for t in trades if t['timestamp'] <= till)
+    return web.json_response(list(trades))
+
+
+async def history(request):
+    """
+    Минутные и прочие бары с начала окна from до to включительно,
+    каждый app['history_fail_every']-й запрос отвечает ошибкой 500
+    """
+    app = request.app
+    app['history_requests'] += 1
+    if app['history_fail_every'] and \
+            app['history_requests'] % app['history_fail_every'] == 0:
+        return web.Response(status=500, text='Internal error')
+    tf = int(request.query['tf'])
+    start = int(request.query['from'])
+    finish = int(request.query['to'])
+    first = -(-start // tf) * tf
+    bars = [{'time': t, 'open': 100.0, 'high': 101.0, 'low': 99.0,
+             'close': 100.0 + (t // tf) % 100 * 0.01, 'volume': 10}
+            for t in range(first, finish + 1, tf)]
+    return web.json_response({'history': bars, 'next': None, 'prev': None})
+
+
+def _stream_data(request: dict, n: int) -> dict:
+    opcode = request['opcode']
+    now = int(time.time())
+    if opcode == 'OrderBookGetAndSubscribe':
+        return _orderbook(request.get('depth', 10))
+    if opcode == 'QuotesSubscribe':
+        return {'symbol': request['code'], 'exchange': request['exchange'],
+                'last_price': 100 + n * 0.01, 'last_price_timestamp': now}
+    if opcode == 'AllTradesGetAndSubscribe':
+        return {'id': n, 'symbol': request['code'], 'price': 100.0,
+                'qty': 1, 'side': 'buy', 'timestamp': now * 1000}
+    return {'time': request.get('from', now) + n * request.get('tf', 60),
+            'open': 100.0, 'high': 100.1, 'low': 99.9, 'close': 100.0,
+            'volume': 10}
+
+
+async def _publish(ws, request: dict, interval: float):
+    guid = request['guid']
+    n = 0
+    while not ws.closed:
+        await ws.send_json({'data': _stream_data(request, n), 'guid': guid})
+        n += 1
+        await asyncio.sleep(interval)
+
+
+async def websocket(request):
+    """
+    WebSocket API: на каждую подписку подтверждение и поток обновлений
+    с интервалом app['ws_interval'] секунд
+    """
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    request.app['websockets'].add(ws)
+    publishers = {}
+    try:
+        async for msg in ws:
+            message = msg.json()
+            guid = message['guid']
+            if message['opcode'] == 'unsubscribe':
+                task = publishers.pop(guid, None)
+                if task is not None:
+                    task.cancel()
+            else:
+                publishers[guid] = asyncio.create_task(_publish(
+                    ws, message, request.app['ws_interval']))
+            await ws.send_json({'requestGuid': guid, 'httpCode': 200,
+                                'message': 'Handled successfully'})
+    finally:
+        for task in publishers.values():
+            task.cancel()
+        request.app['websockets'].discard(ws)
+    return ws
+
+
+@web.middleware
+async def throttle(request, handler):
+    """
+    Не больше app['rate_limit'] запросов в секунду, сверх лимита - 429
+    """
+    app = request.app
+    second = int(time.monotonic())
+    if app['rate_second'] != second:
+        app['rate_second'] = second
+        app['rate_count'] = 0
+    app['rate_count'] += 1
+    if app['rate_count'] > app['rate_limit']:
+        app['throttled'] += 1
+        return web.Response(status=429, headers={'Retry-After': '1'})
+    return await handler(request)
+
+
+@web.middleware
+async def latency(request, handler):
+    """
+    Имитация задержки сервера app['latency'] секунд
+    """
+    await asyncio.sleep(request.app['latency'])
+    return await handler(request)
+
+
+def create_app(ws_interval: float = 0.01,
+               securities_count: int = 1000,
+               trades_count: int = 1000,
+               history_fail_every: int = 0,
+               rate_limit: int = 0,
+               response_delay: float = 0,
+               positions_count: int = 10) -> web.Application:
+    """
+    :param rate_limit: Лимит запросов в секунду, 0 - без лимита
+    :param response_delay: Задержка каждого ответа в секундах
+    :param positions_count: Сколько позиций в ответе get_positions_info
+    """
+    middlewares = []
+    if rate_limit:
+        middlewares.append(throttle)
+    if response_delay:
+        middlewares.append(latency)
+    app = web.Application(middlewares=middlewares)
+    app['latency'] = response_delay
+    app['rate_limit'] = rate_limit
+    app['rate_second'] = None
+    app['rate_count'] = 0
+    app['throttled'] = 0
+    app['history_requests'] = 0
+    app['history_fail_every'] = history_fail_every
+    app['securities'] = securities_count
+    app['trades'] = trades_count
+    app['positions'] = positions_count
+    app['day_start'] = int(time.time()) // 86400 * 86400
+    app['websockets'] = set()
+    app['ws_interval'] = ws_interval
+    app.router.add_get('/ws', websocket)
+    app.router.add_post('/refresh', refresh)
+    app.router.add_get('/md/v2/time', server_time)
+    app.router.add_get('/client/v1.0/users/{username}/portfolios',
+                       portfolios)
+    app.router.add_get('/md/v2/clients/{exchange}/{portfolio}/orders',
+                       orders)
+    app.router.add_get(
+        '/md/v2/clients/{exchange}/{portfolio}/orders/{order_id}', order)
+    app.router.add_get('/md/v2/clients/{exchange}/{portfolio}/stoporders',
+                       orders)
+    app.router.add_get(
+        '/md/v2/clients/{exchange}/{portfolio}/stoporders/{order_id}', order)
+    app.router.add_get('/md/v2/clients/{exchange}/{portfolio}/summary',
+                       summary)
+    app.router.add_get('/md/v2/Clients/{exchange}/{portfolio}/positions',
+                       positions)
+    app.router.add_get(
+        '/md/v2/clients/{exchange}/{portfolio}/positions/{ticker}', position)
+    app.router.add_get('/md/v2/Clients/{exchange}/{portfolio}/trades',
+                       client_trades)
+    app.router.add_get(
+        '/md/v2/Clients/{exchange}/{portfolio}/{ticker}/trades',
+        client_trades)
+    app.router.add_get('/md/v2/Clients/{exchange}/{portfolio}/risk', risk)
+    app.router.add_get('/md/v2/Clients/{exchange}/{portfolio}/fortsrisk',
+                       fortsrisk)
+    app.router.add_get('/md/v2/orderbooks/{exchange}/{ticker}', orderbook)
+    app.router.add_get('/md/v2/history', history)
+    app.router.add_get('/md/v2/securities', search)
+    app.router.add_get('/md/v2/securities/{symbols}/quotes', quotes)
+    app.router.add_get('/md/v2/Securities/{exchange}', securities)
+    app.router.add_get('/md/v2/Securities/{exchange}/{ticker}', security)
+    app.router.add_get('/md/v2/Securities/{exchange}/{ticker}/alltrades',
+                       alltrades)
+    app.router.add_get(
+        '/md/v2/Securities/{exchange}/{symbol}/actualFuturesQuote',
+        futures_quote)
+    for prefix in ('/commandapi/warptrans', '/warptrans'):
+        actions = f'{prefix}/{{server}}/v2/client/orders/actions/{{type}}'
+        app.router.add_post(actions, order_action)
+        app.router.add_put(f'{actions}/{{order_id}}', order_action)
+        app.router.add_delete(
+            f'{prefix}/{{server}}/v2/client/orders/{{order_id}}',
+            order_cancel)
+    app.router.add_post('/commandapi/api/orderGroups', order_group)
+    app.router.add_get('/commandapi/api/orderGroups/{group_id}', order_group)
+    app.router.add_delete('/commandapi/api/orderGroups/{group_id}',
+                          order_group)
+    return app
+
+
+def _serve(conn, host: str, port: int, app_options: dict):
+    server = MockServer(host, port, **app_options).start()
+    conn.send(server.url)
+    conn.recv()
+    server.stop()
+
+
+class MockServer:
+    """
+    Запускает сервер-заглушку в отдельном потоке со своим event loop,
+    или, с isolated=True, в отдельном процессе: тогда сервер не делит
+    с клиентом ни GIL, ни память, что важно для замеров нагрузки и
+    потребления памяти.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 isolated: bool = False, **app_options):
+        """
+        :param isolated: Запустить сервер в отдельном процессе
+        :param app_options: Параметры create_app()
+        """
+        self.host = host
+        self.port = port
+        self.isolated = isolated
+        self.app_options = app_options
+        self.url = None
+        self._loop = None
+        self._thread = None
+        self._runner = None
+        self._process = None
+        self._conn = None
+
+    async def _start(self):
+        self._runner = web.AppRunner(
+            create_app(**self.app_options), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}'
+
+    def start(self):
+        if self.isolated:
+            self._conn, child = multiprocessing.Pipe()
+            self._process = multiprocessing.Process(
+                target=_serve, daemon=True,
+                args=(child, self.host, self.port, self.app_options))
+            self._process.start()
+            self.url = self._conn.recv()
+            return self
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    @property
+    def url_ws(self):
+        return f'{self.url.replace("http", "ws", 1)}/ws'
+
+    def drop_connections(self):
+        """
+        Разорвать все WebSocket соединения (проверка переподключения)
+        """
+        async def drop():
+            for ws in list(self._runner.app['websockets']):
+                await ws.close()
+
+        asyncio.run_coroutine_threadsafe(drop(), self._loop).result()
+
+    def stop(self):
+        if self.isolated:
+            self._conn.send('stop')
+            self._process.join()
+            return
+        asyncio.run_coroutine_threadsafe(
+            self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
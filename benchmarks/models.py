@@ -0,0 +1,63 @@
+"""
+Память, занимаемая большим ответом: список словарей json.loads()
+против моделей на __slots__ из models.py.
+
+Запуск из корня репозитория:
+    python -m benchmarks.models [количество записей]
+"""
+import gc
+import json
+import sys
+import tracemalloc
+
+from models import Order, Trade, decode
+
+
+def trades_response(count: int) -> bytes:
+    return json.dumps([
+        {'id': 1_000_000 + i, 'orderno': 2_000_000 + i, 'symbol': 'SBER',
+         'exchange': 'MOEX', 'qty': 1 + i % 50, 'price': 250 + i % 100 / 100,
+         'timestamp': 1_700_000_000_000 + i, 'side': 'buy' if i % 2 else
+         'sell', 'oi': 0, 'existing': True}
+        for i in range(count)]).encode()
+
+
+def orders_response(count: int) -> bytes:
+    return json.dumps([
+        {'id': str(30_000_000 + i), 'symbol': 'SBER',
+         'brokerSymbol': 'MOEX:SBER', 'exchange': 'MOEX', 'type': 'limit',
+         'side': 'buy', 'status': 'working',
+         'transTime': '2023-01-01T10:00:00.000Z',
+         'endTime': '2023-01-01T23:59:59.000Z', 'qtyUnits': 10,
+         'qtyBatch': 1, 'qty': 1, 'filledQtyUnits': 0, 'filledQtyBatch': 0,
+         'filled': 0, 'price': 250 + i % 100 / 100, 'existing': True,
+         'timeInForce': 'oneday', 'iceberg': None}
+        for i in range(count)]).encode()
+
+
+def measure(build) -> int:
+    """
+    :return: Сколько байт занимает результат build()
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main(count: int = 100_000):
+    for name, model, body in (('сделки', Trade, trades_response(count)),
+                              ('заявки', Order, orders_response(count))):
+        raw = measure(lambda: json.loads(body))
+        typed = measure(lambda: list(decode(json.loads(body), model)))
+        print(f'{count} {name}: словари {raw / 2 ** 20:7.1f} MiB, '
+              f'{model.__name__} {typed / 2 ** 20:7.1f} MiB '
+              f'({typed / raw:.0%})')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,81 @@
+"""
+Скорость генерации уникальных строк ордеров: прежний вариант
+(sha256 от аккаунта и текущего времени) против OrderIdGenerator,
+и проверка уникальности при генерации из многих потоков и процессов.
+
+Запуск из корня репозитория:
+    python -m benchmarks.order_id
+"""
+import hashlib
+import multiprocessing
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from order_id import OrderIdGenerator
+
+USERNAME = 'P000000'
+THREADS = 8
+PROCESSES = 4
+PER_WORKER = 100_000
+
+
+def sha256_order_id() -> str:
+    data = USERNAME + str(datetime.timestamp(datetime.now()))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:-30]
+
+
+def _generate(generator, count: int) -> list:
+    return [generator() for _ in range(count)]
+
+
+def _child(generator, conn):
+    conn.send(_generate(generator, PER_WORKER))
+    conn.close()
+
+
+def threads_duplicates(generator) -> int:
+    with ThreadPoolExecutor(THREADS) as pool:
+        chunks = pool.map(_generate, [generator] * THREADS,
+                          [PER_WORKER] * THREADS)
+        ids = [order_id for chunk in chunks for order_id in chunk]
+    return len(ids) - len(set(ids))
+
+
+def processes_unique(generator) -> int:
+    """
+    Дочерние процессы наследуют генератор через fork()
+    """
+    ctx = multiprocessing.get_context('fork')
+    ids = _generate(generator, PER_WORKER)
+    for _ in range(PROCESSES):
+        parent, child = ctx.Pipe()
+        process = ctx.Process(target=_child, args=(generator, child))
+        process.start()
+        ids.extend(parent.recv())
+        process.join()
+    assert len(ids) == len(set(ids)), 'повтор строки ордера в процессах'
+    return len(ids)
+
+
+def main(number: int = 200_000):
+    generator = OrderIdGenerator(USERNAME)
+    for name, func in (('sha256', sha256_order_id),
+                       ('OrderIdGenerator', generator)):
+        seconds = timeit.timeit(func, number=number)
+        print(f'{name:<18} {seconds / number * 1e9:8.0f} ns/id')
+
+    total = THREADS * PER_WORKER
+    print(f'sha256: повторов в {total} строк из {THREADS} потоков: '
+          f'{threads_duplicates(sha256_order_id)}')
+    duplicates = threads_duplicates(generator)
+    assert not duplicates, 'повтор строки ордера в потоках'
+    print(f'OrderIdGenerator: {total} строк из {THREADS} потоков '
+          f'без повторов')
+    if 'fork' in multiprocessing.get_all_start_methods():
+        print(f'OrderIdGenerator: {processes_unique(generator)} строк из '
+              f'{PROCESSES + 1} процессов без повторов')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Пропускная способность Api против сервера-заглушки с лимитом запросов
+в секунду: без ограничения частоты (ответы 429 не повторяются), с
+повтором 429 по Retry-After и с ведром токенов чуть ниже лимита.
+Кеш и объединение запросов отключены: каждый вызов доходит до сервера.
+
+Запуск из корня репозитория:
+    python -m benchmarks.ratelimit
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_server import MockServer
+from client import Api
+
+SERVER_RATE = 100
+THREADS = 8
+REQUESTS = 500
+
+
+def run(server: MockServer, name: str, rate_limits):
+    alor = Api('token', 'P000000', url_api=server.url,
+               url_oauth=server.url, rate_limits=rate_limits,
+               background_refresh=False, cache=False, coalesce=False)
+    # начать с новой секунды, чтобы у сервера был полный лимит
+    time.sleep(1 - time.monotonic() % 1)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        results = list(pool.map(lambda _: alor.get_time(), range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    alor.close()
+    ok = sum(result is not None for result in results)
+    throttled = alor.limiter.throttled if alor.limiter else '-'
+    print(f'{name:<28} {ok:5} / {REQUESTS} успешно, '
+          f'{ok / elapsed:6.1f} запросов/с, повторов 429: {throttled}')
+
+
+def main():
+    print(f'Лимит сервера: {SERVER_RATE} запросов/с, потоков: {THREADS}')
+    with MockServer(isolated=True, rate_limit=SERVER_RATE) as server:
+        run(server, 'без ограничения', None)
+        run(server, 'повтор 429 по Retry-After',
+            {'market': (SERVER_RATE * 10, SERVER_RATE * 10)})
+        run(server, 'ведро токенов 95/с',
+            {'market': (SERVER_RATE * 0.95, 1)})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Задержка одного вызова: новое соединение на каждый запрос (голый
+requests.get, как было раньше) против общей keep-alive сессии Api.
+Кеш ответов и ограничение частоты отключены, чтобы каждый get_time
+доходил до сервера без ожидания.
+
+Запуск из корня репозитория:
+    python -m benchmarks.session [количество вызовов]
+
+Локально экономится только TCP рукопожатие, на реальном сервере
+к нему добавляется TLS, и разница заметно больше.
+"""
+import statistics
+import sys
+import time
+
+import requests
+
+from benchmarks.mock_server import MockServer
+from client import Api
+
+
+def measure(call, n: int) -> list:
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f'{name:<28} median {statistics.median(timings):7.3f} ms   '
+          f'p99 {p99:7.3f} ms')
+
+
+def main(n: int = 1000):
+    with MockServer() as server:
+        with Api('refresh', 'P000000', url_api=server.url,
+                 url_oauth=server.url, rate_limits=None,
+                 cache=False) as alor:
+            url = f'{server.url}/md/v2/time'
+            headers = alor._headers
+
+            def no_reuse():
+                requests.get(url, headers=headers)
+
+            report('requests.get (no reuse)', measure(no_reuse, n))
+            report('Api.get_time (keep-alive)', measure(alor.get_time, n))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,43 @@
+"""
+Пиковая память при разборе выгрузки инструментов целиком
+(get_all_securities_info) и потоково (iter_all_securities_info).
+
+Запуск из корня репозитория:
+    python -m benchmarks.stream_decode [количество инструментов]
+"""
+import sys
+import time
+import tracemalloc
+
+from benchmarks.mock_server import MockServer
+from client import Api
+
+
+def measure(name: str, call):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = call()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<46} {count:>8} записей  {elapsed:6.2f} s  '
+          f'пик {peak / 2 ** 20:8.1f} MiB')
+
+
+def main(count: int = 100000):
+    with MockServer(isolated=True, securities_count=count) as server:
+        with Api('refresh', 'P000000', url_api=server.url,
+                 url_oauth=server.url) as alor:
+            alor.exchange = 'MOEX'
+            measure('get_all_securities_info',
+                    lambda: len(alor.get_all_securities_info()))
+            measure('iter_all_securities_info',
+                    lambda: sum(1 for _ in alor.iter_all_securities_info()))
+            measure("iter_all_securities_info(fields=('symbol',))",
+                    lambda: len({s['symbol'] for s in
+                                 alor.iter_all_securities_info(
+                                     fields=('symbol',))}))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,67 @@
+"""
+Проверка Stream против WebSocket сервера-заглушки: обновления двух
+подписок в одном соединении, одна из них с callback, который падает
+на каждом обновлении. Ошибка callback не должна останавливать поток:
+вторая подписка продолжает получать данные, а после разрыва
+соединения сервером обе подписки восстанавливаются.
+
+Запуск из корня репозитория:
+    python -m benchmarks.streaming [секунд на этап]
+"""
+import asyncio
+import sys
+
+from async_client import AsyncApi
+from benchmarks.mock_server import MockServer
+from streaming import Stream
+
+
+async def received(subscription, seconds: float) -> int:
+    """
+    :return: Сколько обновлений пришло в очередь подписки за seconds
+    """
+    count = 0
+    try:
+        async with asyncio.timeout(seconds):
+            async for _ in subscription:
+                count += 1
+    except TimeoutError:
+        pass
+    return count
+
+
+async def check(server: MockServer, seconds: float) -> bool:
+    calls = 0
+
+    def broken(data):
+        nonlocal calls
+        calls += 1
+        raise RuntimeError('ошибка в callback')
+
+    async with AsyncApi('refresh', 'P000000', url_api=server.url,
+                        url_oauth=server.url, cache=False) as alor:
+        async with Stream(alor, url_ws=server.url_ws,
+                          reconnect_delay=(0.05, 0.5)) as stream:
+            await stream.quotes('SBER', exchange='MOEX', callback=broken)
+            book = await stream.orderbook('SBER', exchange='MOEX')
+            await stream.wait_connected(5)
+            before = await received(book, seconds)
+            failed = calls
+            await asyncio.to_thread(server.drop_connections)
+            after = await received(book, seconds)
+            print(f'до разрыва: стакан {before}, ошибок callback {failed}')
+            print(f'после разрыва: стакан {after}, ошибок callback '
+                  f'{calls - failed}, переподключений {stream.reconnects}')
+            return (before and failed and after and calls > failed
+                    and stream.reconnects > 0)
+
+
+def main(seconds: float = 1):
+    with MockServer() as server:
+        ok = asyncio.run(check(server, seconds))
+    print('OK' if ok else 'ОШИБКА: поток остановился')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(*map(float, sys.argv[1:])))
@@ -0,0 +1,280 @@
+"""
+Сводный бенчмарк клиента против сервера-заглушки (отдельный процесс):
+задержка каждого метода Api (перцентили), пропускная способность под
+нагрузкой из потоков и корутин AsyncApi, память на разбор ответа
+разного размера. Результат - JSON, который можно сравнить с прошлым
+прогоном: регрессия задержки или пропускной способности методов
+заявок завершает запуск с кодом 1.
+
+Запуск из корня репозитория:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --baseline results.json
+
+Кеш ответов и ограничение частоты отключены: каждый вызов доходит до
+сервера, измеряется путь запроса, а не попадание в кеш.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import codec
+from async_client import AsyncApi
+from benchmarks.mock_server import MockServer
+from client import Api
+
+PORTFOLIO = 'D00031'
+EXCHANGE = 'MOEX'
+ORDER_METHODS = ('set_market_order', 'set_limit_order', 'change_limit_order',
+                 'cancel_order', 'set_stoploss', 'set_take_profit')
+THREADS = (1, 4, 16)
+CONCURRENCY = (1, 16, 64)
+RESPONSE_SIZES = (1_000, 10_000, 100_000)
+
+
+def methods(alor: Api) -> dict:
+    """
+    Вызовы Api без аргументов, по одному на метод
+    """
+    return {
+        'get_time': alor.get_time,
+        'get_portfolios': alor.get_portfolios,
+        'get_orders_info': alor.get_orders_info,
+        'get_order_info': lambda: alor.get_order_info('1'),
+        'get_stoporders_info': alor.get_stoporders_info,
+        'get_summary_info': alor.get_summary_info,
+        'get_positions_info': alor.get_positions_info,
+        'get_position_info': lambda: alor.get_position_info('SBER'),
+        'get_trades_info': alor.get_trades_info,
+        'get_risk_info': alor.get_risk_info,
+        'get_fortrisk_info': alor.get_fortrisk_info,
+        'get_securities_info': lambda: alor.get_securities_info('SBER'),
+        'get_security_info': lambda: alor.get_security_info('SEC1'),
+        'get_quotes_list': lambda: alor.get_quotes_list('MOEX:SBER'),
+        'get_futures_quotes': lambda: alor.get_futures_quotes('SBRF'),
+        'get_today_trades': lambda: alor.get_today_trades('SBER'),
+        'get_orderbooks': lambda: alor.get_orderbooks(['SBER']),
+        'set_market_order': lambda: alor.set_market_order('SBER', 'buy', 1),
+        'set_limit_order': lambda: alor.set_limit_order(
+            'SBER', 'buy', 1, 100.0),
+        'change_limit_order': lambda: alor.change_limit_order(
+            'SBER', 'buy', 1, 100.0, '1'),
+        'cancel_order': lambda: alor.cancel_order('1', stop=False),
+        'set_stoploss': lambda: alor.set_stoploss('SBER', 'sell', 1, 90.0),
+        'set_take_profit': lambda: alor.set_take_profit(
+            'SBER', 'sell', 1, 110.0),
+    }
+
+
+def _percentile(timings: list, q: float) -> float:
+    return timings[min(len(timings) - 1, int(len(timings) * q))]
+
+
+def summarize(timings: list) -> dict:
+    """
+    :param timings: Задержки вызовов в секундах
+    :return: Перцентили в миллисекундах
+    """
+    timings = sorted(t * 1000 for t in timings)
+    return {'n': len(timings),
+            'mean_ms': statistics.fmean(timings),
+            'p50_ms': _percentile(timings, 0.5),
+            'p90_ms': _percentile(timings, 0.9),
+            'p99_ms': _percentile(timings, 0.99),
+            'max_ms': timings[-1]}
+
+
+def _client(server: MockServer, cls=Api, **options):
+    alor = cls('refresh', 'P000000', url_api=server.url,
+               url_oauth=server.url, rate_limits=None, cache=False,
+               **options)
+    alor.exchange = EXCHANGE
+    alor.portfolio = PORTFOLIO
+    return alor
+
+
+def latency(server: MockServer, n: int) -> dict:
+    with _client(server) as alor:
+        results = {}
+        for name, call in methods(alor).items():
+            if call() is None:
+                raise RuntimeError(f'{name}: нет ответа сервера-заглушки')
+            timings = []
+            for _ in range(n):
+                start = time.perf_counter()
+                call()
+                timings.append(time.perf_counter() - start)
+            results[name] = summarize(timings)
+        return results
+
+
+def _rate(calls: int, elapsed: float, errors: int) -> dict:
+    return {'calls': calls, 'errors': errors,
+            'calls_per_s': calls / elapsed}
+
+
+def threaded(server: MockServer, n: int) -> dict:
+    """
+    Пропускная способность одного Api, общего для всех потоков
+    """
+    results = {}
+    with _client(server, pool_size=max(THREADS), coalesce=False) as alor:
+        calls = {'set_limit_order': methods(alor)['set_limit_order'],
+                 'get_orders_info': alor.get_orders_info}
+        for name, call in calls.items():
+            for threads in THREADS:
+                with ThreadPoolExecutor(threads) as pool:
+                    start = time.perf_counter()
+                    done = list(pool.map(lambda _: call(), range(n)))
+                    elapsed = time.perf_counter() - start
+                errors = sum(result is None for result in done)
+                results[f'{name}/threads={threads}'] = _rate(
+                    n, elapsed, errors)
+    return results
+
+
+async def _gathered(server: MockServer, n: int) -> dict:
+    results = {}
+    async with _client(server, AsyncApi, pool_size=max(CONCURRENCY),
+                       coalesce=False) as alor:
+        for concurrency in CONCURRENCY:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def call():
+                async with semaphore:
+                    return await alor.set_limit_order(
+                        'SBER', 'buy', 1, 100.0)
+
+            start = time.perf_counter()
+            done = await asyncio.gather(*(call() for _ in range(n)))
+            elapsed = time.perf_counter() - start
+            errors = sum(result is None for result in done)
+            results[f'async set_limit_order/concurrency={concurrency}'] = \
+                _rate(n, elapsed, errors)
+    return results
+
+
+def gathered(server: MockServer, n: int) -> dict:
+    """
+    Пропускная способность AsyncApi при разном числе одновременных корутин
+    """
+    return asyncio.run(_gathered(server, n))
+
+
+def memory(sizes=RESPONSE_SIZES) -> list:
+    """
+    Пиковая память разбора ленты сделок get_today_trades на каждую
+    запись и на байт ответа
+    """
+    results = []
+    for size in sizes:
+        with MockServer(isolated=True, trades_count=size) as server:
+            with _client(server) as alor:
+                body = alor.session.get(
+                    f'{server.url}/md/v2/Securities/{EXCHANGE}/SBER'
+                    f'/alltrades').content
+                gc.collect()
+                tracemalloc.start()
+                trades = alor.get_today_trades('SBER')
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                del trades
+        results.append({'records': size, 'response_bytes': len(body),
+                        'peak_bytes': peak,
+                        'bytes_per_record': peak / size,
+                        'bytes_per_response_byte': peak / len(body)})
+    return results
+
+
+def run(n: int = 200, load: int = 2000) -> dict:
+    with MockServer(isolated=True) as server:
+        throughput = threaded(server, load)
+        throughput.update(gathered(server, load))
+        return {
+            'meta': {'python': platform.python_version(),
+                     'platform': platform.platform(),
+                     'codec': codec.BACKEND,
+                     'calls': n, 'load': load,
+                     'time': int(time.time())},
+            'latency': latency(server, n),
+            'throughput': throughput,
+            'memory': memory(),
+        }
+
+
+def regressions(results: dict, baseline: dict,
+                tolerance: float) -> list:
+    """
+    Ухудшения методов заявок относительно baseline больше tolerance
+    (доля): задержка p50/p99 и пропускная способность
+
+    :return: Список описаний регрессий
+    """
+    found = []
+    for name in ORDER_METHODS:
+        old = baseline['latency'].get(name)
+        new = results['latency'].get(name)
+        if old is None or new is None:
+            continue
+        for key in ('p50_ms', 'p99_ms'):
+            if new[key] > old[key] * (1 + tolerance):
+                found.append(f'{name} {key}: {old[key]:.3f} -> '
+                             f'{new[key]:.3f}')
+    for name, old in baseline['throughput'].items():
+        new = results['throughput'].get(name)
+        if 'set_limit_order' not in name or new is None:
+            continue
+        if new['calls_per_s'] < old['calls_per_s'] * (1 - tolerance):
+            found.append(f'{name} calls/s: {old["calls_per_s"]:.1f} -> '
+                         f'{new["calls_per_s"]:.1f}')
+    return found
+
+
+def report(results: dict):
+    for name, stats in results['latency'].items():
+        print(f'{name:<22} p50 {stats["p50_ms"]:7.3f} ms   '
+              f'p90 {stats["p90_ms"]:7.3f} ms   '
+              f'p99 {stats["p99_ms"]:7.3f} ms')
+    for name, stats in results['throughput'].items():
+        print(f'{name:<44} {stats["calls_per_s"]:8.1f} вызовов/с   '
+              f'ошибок {stats["errors"]}')
+    for stats in results['memory']:
+        print(f'лента {stats["records"]:>7} сделок '
+              f'({stats["response_bytes"] / 2 ** 20:6.1f} MiB)   '
+              f'пик {stats["peak_bytes"] / 2 ** 20:7.1f} MiB   '
+              f'{stats["bytes_per_record"]:6.0f} байт/сделку')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--calls', type=int, default=200,
+                        help='вызовов каждого метода для перцентилей')
+    parser.add_argument('--load', type=int, default=2000,
+                        help='вызовов на каждый уровень нагрузки')
+    parser.add_argument('-o', '--output', help='записать результаты в JSON')
+    parser.add_argument('--baseline', help='JSON прошлого прогона')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='допустимое ухудшение, доля (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+    results = run(args.calls, args.load)
+    report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f'РЕГРЕССИЯ {line}')
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
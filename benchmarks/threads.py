@@ -0,0 +1,62 @@
+"""
+Нагрузочная проверка одного Api, общего для пула потоков: сервер-
+заглушка отвечает с задержкой, потоки вперемешку делают успешные и
+ошибочные запросы. Каждый вызов сверяет свой результат и alor.error
+своего потока; пропускная способность должна расти с числом потоков.
+
+Запуск из корня репозитория:
+    python -m benchmarks.threads [вызовов на уровень] [задержка, мс]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_server import MockServer
+from client import Api
+
+THREADS = (1, 2, 4, 8, 16, 32)
+
+
+def call(alor: Api, i: int) -> bool:
+    """
+    :return: Совпали ли результат и alor.error с ожидаемыми
+    """
+    if i % 3 == 0:
+        result = alor.get_security_info('UNKNOWN', exchange='MOEX')
+        return result is None and alor.error
+    if i % 3 == 1:
+        portfolio = f'P{i % 7}'
+        result = alor.get_risk_info(portfolio=portfolio, exchange='MOEX')
+        return result is not None and result['portfolio'] == portfolio \
+            and not alor.error
+    result = alor.set_limit_order('SBER', 'buy', 1, 100.0,
+                                  portfolio='D00031', exchange='MOEX')
+    return result is not None and not alor.error
+
+
+def main(n: int = 2000, delay_ms: float = 5):
+    print(f'Задержка сервера {delay_ms} мс, {n} вызовов на уровень')
+    with MockServer(isolated=True, response_delay=delay_ms / 1000) as server:
+        with Api('refresh', 'P000000', url_api=server.url,
+                 url_oauth=server.url, pool_size=max(THREADS),
+                 rate_limits=None, cache=False) as alor:
+            base = None
+            failed = 0
+            for threads in THREADS:
+                with ThreadPoolExecutor(threads) as pool:
+                    start = time.perf_counter()
+                    checks = list(pool.map(lambda i: call(alor, i),
+                                           range(n)))
+                    elapsed = time.perf_counter() - start
+                rate = n / elapsed
+                base = base or rate
+                wrong = checks.count(False)
+                failed += wrong
+                print(f'потоков {threads:3}   {rate:8.1f} вызовов/с   '
+                      f'x{rate / base:5.1f}   неверных результатов {wrong}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(float(arg) if i else int(arg)
+                    for i, arg in enumerate(sys.argv[1:]))))
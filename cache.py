@@ -0,0 +1,98 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from settings import CACHE_MAX_BYTES
+
+
+class ResponseCache:
+    """
+    Кеш ответов со сроком жизни записи и вытеснением давно не
+    использованных записей (LRU), когда суммарный размер превышает
+    max_bytes. Потокобезопасен.
+
+        cache = ResponseCache()
+        cache.set(key, response, ttl=3600, size=len(response.content))
+        cache.get(key)
+        cache.stats()
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        """
+        :param max_bytes: Максимальный суммарный размер записей
+        """
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def get(self, key):
+        """
+        :return: Значение или None, если записи нет или она устарела
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, ttl: float, size: int = None):
+        """
+        :param ttl: Срок жизни записи в секундах
+        :param size: Размер значения в байтах, по умолчанию
+         sys.getsizeof(value)
+        """
+        if size is None:
+            size = sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, url: str = None):
+        """
+        Удалить записи
+
+        :param url: Удалить только записи, URL которых начинается с url,
+         None - очистить кеш полностью
+        """
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+                self.bytes = 0
+                return
+            for key in [key for key in self._entries
+                        if isinstance(key, tuple) and len(key) > 1
+                        and str(key[1]).startswith(url)]:
+                self._drop(key)
+
+    def stats(self) -> dict:
+        """
+        :return: {'hits', 'misses', 'evictions', 'entries', 'bytes'}
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self._entries),
+                'bytes': self.bytes}
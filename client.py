@@ -1,7 +1,7 @@
 import asyncio
-import hashlib
-import json
-import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
 from datetime import datetime, date
 from json import JSONDecodeError
@@ -12,40 +12,96 @@ import requests
 from settings import (
     URL_OAUTH,
     URL_API,
-    LOGGING, TTL_JWT_TOKEN
+    LOGGING,
+    HTTP_POOL_SIZE, HTTP_TIMEOUT,
+    ORDERBOOK_CONCURRENCY, ORDERBOOK_TIMEOUT,
+    STREAM_CHUNK_SIZE,
+    RATE_LIMITS,
+    CACHE_TTL,
+    ACCOUNT_CONCURRENCY,
+    ROUTING_RETRY_DELAY,
+    EXCHANGE
 )
-
-if LOGGING:
-    logging.basicConfig(
-        filename='debug.log',
-        filemode='a',
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%d-%b-%y %H:%M:%S',
-        level=logging.DEBUG
-    )
+from accounts import account_jobs, merge
+from auth import TokenManager
+from cache import ResponseCache
+from codec import loads, dumps
+from jsonstream import iter_json_array
+from log import logger, request_fields
+from metrics import Metrics, TimedHTTPAdapter, take_connect_time
+from models import (
+    Book, FortsRisk, Order, Position, Risk, StopOrder, Summary, Trade,
+    decode
+)
+from orderbook import fetch_orderbooks
+from ratelimit import RateLimiter
+from routing import RoutingTable, Route, instrument_type, DEFAULT_TRADE_SERVER
+from singleflight import SingleFlight, request_key
+from order_id import OrderIdGenerator
 
 
 class Api:
 
     @property
     def _headers(self):
-        now = int(datetime.timestamp(datetime.now()))
-        if now - self.token_ttl > TTL_JWT_TOKEN:
-            self.jwt_token = self._get_jwt_token()
-        bearer = self.jwt_token
-        if not bearer:
-            logging.error('Не найден JWT токен, запустите get_jwt()!')
-            return None
-        headers = {"Content-Type": "application/json",
-                   "Authorization": f"Bearer {bearer}"
-                   }
+        """
+        Готовые заголовки авторизации из TokenManager. Словарь общий,
+        для добавления заголовков делайте копию.
+        """
+        start = time.perf_counter()
+        headers = self.tokens.get_headers()
+        self._local.auth = time.perf_counter() - start
+        if headers is None:
+            self.error = True
+            logger.error('Не найден JWT токен, проверьте refresh токен!')
         return headers
 
+    @property
+    def jwt_token(self):
+        return self.tokens.jwt_token
+
+    @property
+    def error(self) -> bool:
+        """
+        Результат последнего вызова в текущем потоке: у каждого потока
+        свое значение, поэтому один Api можно вызывать из пула потоков
+        """
+        return getattr(self._local, 'error', False)
+
+    @error.setter
+    def error(self, value: bool):
+        self._local.error = value
+
+    @property
+    def portfolio(self):
+        return self._defaults[0]
+
+    @portfolio.setter
+    def portfolio(self, value):
+        with self._defaults_lock:
+            self._defaults = value, self._defaults[1]
+
+    @property
+    def exchange(self):
+        return self._defaults[1]
+
+    @exchange.setter
+    def exchange(self, value):
+        with self._defaults_lock:
+            self._defaults = self._defaults[0], value
+
+    def _account(self, portfolio: str = None, exchange: str = None):
+        """
+        Портфель и биржа вызова. Значения по умолчанию (portfolio,
+        exchange) читаются одним снимком, поэтому другой поток, меняющий
+        их, не даст вызову смесь старого портфеля и новой биржи.
+        """
+        default_portfolio, default_exchange = self._defaults
+        return default_portfolio or portfolio, default_exchange or exchange
+
     @property
     def _random_order_id(self) -> str:
-        data = self.username + str(datetime.timestamp(datetime.now()))
-        rand_id = hashlib.sha256(data.encode('utf-8')).hexdigest()
-        return rand_id[:-30]
+        return self._order_ids()
 
     @property
     def is_working_hours(self) -> bool:
@@ -53,44 +109,195 @@ class Api:
             return True
         return False
 
-    def __init__(self, refresh=None, username=None):
+    def __init__(self,
+                 refresh=None,
+                 username=None,
+                 pool_size: int = HTTP_POOL_SIZE,
+                 timeout: tuple = HTTP_TIMEOUT,
+                 url_api: str = URL_API,
+                 url_oauth: str = URL_OAUTH,
+                 background_refresh: bool = True,
+                 rate_limits: dict = RATE_LIMITS,
+                 coalesce: bool = True,
+                 cache: ResponseCache = None,
+                 metrics: Metrics = None,
+                 ):
+        """
+        :param refresh: Токен обновления
+        :param username: Аккаунт клиента
+        :param pool_size: Максимум keep-alive соединений на один хост
+        :param timeout: Таймауты (подключение, чтение) в секундах
+        :param url_api: Адрес API (по умолчанию из settings)
+        :param url_oauth: Адрес сервера авторизации (по умолчанию из settings)
+        :param background_refresh: Обновлять JWT токен заранее в фоновом
+         потоке, а не в момент запроса
+        :param rate_limits: Лимиты запросов по классам эндпоинтов
+         {класс: (запросов в секунду, всплеск)}, None - без ограничений
+         и без повтора ответов 429/5xx
+        :param coalesce: Объединять одинаковые одновременные GET запросы,
+         счетчики в coalescer.requests и coalescer.coalesced
+        :param cache: Кеш справочных ответов (инструменты, портфели,
+         время сервера), по умолчанию свой ResponseCache(), False -
+         без кеша
+        :param metrics: Сборщик метрик запросов, по умолчанию свой
+         Metrics(), False - без метрик
+        """
+        self._local = threading.local()
         self.error = False
         self.username = username
         self.refresh_token = refresh
-        self.portfolio = None
-        self.exchange = None
-        self.token_ttl = TTL_JWT_TOKEN
-        self.jwt_token = self._get_jwt_token()
-
-    def _get_jwt_token(self):
+        self._order_ids = OrderIdGenerator(username)
+        self._defaults = None, None
+        self._defaults_lock = threading.Lock()
+        self.url_api = url_api
+        self.url_oauth = url_oauth
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate_limits) if rate_limits else None
+        self.coalescer = SingleFlight() if coalesce else None
+        self.cache = ResponseCache() if cache is None else cache or None
+        self.metrics = Metrics() if metrics is None else metrics or None
+        self._routing = None
+        self._routing_retry_at = 0.0
+        self._unresolved = {}
+        self.session = self._create_session(pool_size)
+        self._loop = None
+        self._loop_thread = None
+        self._aio_session = None
+        self._aio_lock = threading.Lock()
+        self.tokens = TokenManager(refresh, url_oauth=url_oauth,
+                                   session=self.session, timeout=timeout)
+        self.tokens.refresh()
+        self.error = self.tokens.error
+        if background_refresh:
+            self.tokens.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def _create_session(pool_size: int) -> requests.Session:
         """
-        Создать JWT Token
+        Общая для всех методов сессия с пулом keep-alive соединений,
+        чтобы не устанавливать TCP+TLS соединение на каждый запрос.
+        pool_connections=2: отдельные пулы для URL_API и URL_OAUTH
+        """
+        session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=2,
+                                   pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _request(self, method: str, url: str, ttl: float = None,
+                 **kwargs):
+        """
+        Одинаковые одновременные GET запросы из разных потоков (URL,
+        параметры, токен) объединяются в один: ответ общий, JSON каждый
+        вызов разбирает сам и получает свою копию.
 
-        Токен обновления, создается в личном кабинете
-        https://oauthdev.alor.ru
-        :return: JSON
+        :param ttl: Срок хранения успешного ответа в кеше, секунды
         """
-        payload = {'token': self.refresh_token}
-        res = requests.post(
-            url=f'{URL_OAUTH}/refresh',
-            params=payload
-        )
-        if res.status_code != 200:
+        auth = getattr(self._local, 'auth', None)
+        if auth is not None:
+            self._local.auth = None
+            if self.metrics is not None:
+                self.metrics.observe(url, 'auth', auth)
+        kwargs.setdefault('timeout', self.timeout)
+        if 'json' in kwargs:
+            kwargs['data'] = dumps(kwargs.pop('json'))
+            kwargs['headers'] = dict(kwargs.get('headers') or {},
+                                     **{'Content-Type': 'application/json'})
+        if method != 'GET' or kwargs.get('stream'):
+            return self._send(method, url, **kwargs)
+        if not ttl or self.cache is None:
+            return self._coalesced(method, url, **kwargs)
+        key = request_key(method, url, kwargs.get('params'))
+        res = self.cache.get(key)
+        if res is None:
+            res = self._coalesced(method, url, **kwargs)
+            if res.status_code == 200:
+                self.cache.set(key, res, ttl, size=len(res.content))
+        return res
+
+    def _coalesced(self, method: str, url: str, **kwargs):
+        if self.coalescer is None:
+            return self._send(method, url, **kwargs)
+        key = request_key(method, url, kwargs.get('params'),
+                          kwargs.get('headers'))
+        return self.coalescer.do(
+            key, lambda: self._send(method, url, **kwargs))
+
+    def _send(self, method: str, url: str, **kwargs):
+        """
+        Запрос в пределах лимита класса эндпоинта. Ответы 429/5xx на
+        GET и команды с X-ALOR-REQID повторяются с задержкой из
+        Retry-After или экспоненциальной.
+        """
+        if self.limiter is None:
+            return self._http(method, url, **kwargs)
+        attempt = 0
+        while True:
+            self.limiter.acquire(url)
+            res = self._http(method, url, **kwargs)
+            if not self.limiter.should_retry(res.status_code, attempt,
+                                             method, kwargs.get('headers')):
+                return res
+            delay = self.limiter.retry_delay(
+                url, res.status_code, attempt, res.headers.get('Retry-After'))
             if LOGGING:
-                logging.error(
-                    f'Ошибка получения JWT токена: {res.status_code}')
-            self.error = True
-            return None
+                logger.warning('%s %s %s, повтор через %.2f с',
+                               res.status_code, method, url, delay,
+                               extra=request_fields(
+                                   url, res.status_code,
+                                   res.elapsed.total_seconds()))
+            res.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _http(self, method: str, url: str, **kwargs):
+        """
+        Один HTTP запрос с записью в metrics
+        """
+        if self.metrics is None:
+            return self.session.request(method, url, **kwargs)
+        sent = len(kwargs.get('data') or b'')
+        take_connect_time()
+        start = time.perf_counter()
         try:
-            token = res.json()
-            jwt = token.get('AccessToken')
-            self.token_ttl = int(datetime.timestamp(datetime.now()))
-            return jwt
-        except JSONDecodeError as e:
-            self.error = True
-            if LOGGING:
-                logging.error(f'Ошибка декодирования JWT токена: {e}')
-                return None
+            res = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.metrics.request(url, 0, time.perf_counter() - start,
+                                 take_connect_time(), sent)
+            raise
+        if kwargs.get('stream'):
+            received = int(res.headers.get('Content-Length') or 0)
+        else:
+            received = len(res.content)
+        self.metrics.request(url, res.status_code,
+                             time.perf_counter() - start,
+                             take_connect_time(), sent, received)
+        return res
+
+    def close(self):
+        """
+        Закрыть соединения пула и остановить фоновое обновление токена
+        """
+        self.tokens.stop()
+        self.session.close()
+        with self._aio_lock:
+            if self._loop is None:
+                return
+            if self._aio_session is not None:
+                asyncio.run_coroutine_threadsafe(
+                    self._aio_session.close(), self._loop).result()
+                self._aio_session = None
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+            self._loop = self._loop_thread = None
 
     def _payload(self,
                  ticker,
@@ -101,8 +308,7 @@ class Api:
                  portfolio: str = None,
                  exchange: str = None,
                  ):
-        if self.exchange:
-            exchange = self.exchange
+        _, exchange = self._account(exchange=exchange)
         payload = {
             "symbol": ticker,
             "side": side,
@@ -121,20 +327,59 @@ class Api:
         }
         return payload
 
-    def _check_results(self, res):
+    def _check_results(self, res, model=None):
+        """
+        :param model: Класс из models.py - вернуть модели вместо JSON
+        """
         if res.status_code != 200:
             self.error = True
             if LOGGING:
-                logging.error(f'Ошибка: {res.status_code} {res.text}')
+                logger.error('Ошибка: %s %s', res.status_code, res.text,
+                             extra=request_fields(
+                                 res.url, res.status_code,
+                                 res.elapsed.total_seconds()))
             return
+        start = time.perf_counter()
         try:
-            result = json.loads(res.content)
+            result = decode(loads(res.content), model)
             self.error = False
-            return result
         except JSONDecodeError as e:
             self.error = True
+            if self.metrics is not None:
+                self.metrics.error(res.url)
             if LOGGING:
-                logging.error(f'Ошибка декодирования JSON: {e}')
+                logger.error('Ошибка декодирования JSON: %s', e,
+                             extra=request_fields(res.url, res.status_code))
+            return
+        if self.metrics is not None:
+            self.metrics.observe(res.url, 'decode',
+                                 time.perf_counter() - start)
+        return result
+
+    def _iter_results(self, res, fields: tuple = None):
+        """
+        Потоковый аналог _check_results() для ответов-массивов:
+        элементы разбираются по мере чтения тела ответа
+        """
+        with res:
+            if res.status_code != 200:
+                self.error = True
+                if LOGGING:
+                    logger.error('Ошибка: %s %s', res.status_code, res.text,
+                                 extra=request_fields(
+                                     res.url, res.status_code,
+                                     res.elapsed.total_seconds()))
+                return
+            try:
+                yield from iter_json_array(
+                    res.iter_content(STREAM_CHUNK_SIZE), fields)
+                self.error = False
+            except ValueError as e:
+                self.error = True
+                if LOGGING:
+                    logger.error('Ошибка декодирования JSON: %s', e,
+                                 extra=request_fields(res.url,
+                                                      res.status_code))
 
     # ---------------- Блок "Информация о клиенте -------------------
 
@@ -143,221 +388,270 @@ class Api:
         Получение списка серверов и идентификаторы клиентского портфеля
         :return: Simple JSON
         """
-        res = requests.get(
-            url=f'{URL_API}/client/v1.0/users/{self.username}/portfolios',
-            headers=self._headers
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/client/v1.0/users/{self.username}/portfolios',
+            headers=self._headers,
+            ttl=CACHE_TTL['portfolios']
         )
         return self._check_results(res)
 
-    def get_orders_info(self, portfolio: str = None, exchange: str = None):
+    def get_orders_info(self, portfolio: str = None, exchange: str = None,
+                        typed: bool = False):
         """
         Запрос информации о всех заявках
 
         :param portfolio: Идентификатор клиентского портфеля (например D39004)
         :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Order вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/clients/{exchange}/{portfolio}/orders',
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/clients/{exchange}/{portfolio}/orders',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, Order if typed else None)
 
     def get_order_info(self, orderId: str, portfolio: str = None,
-                       exchange: str = None):
+                       exchange: str = None, typed: bool = False):
         """
         Запрос информации о выбранной заявке
 
         :param portfolio: Идентификатор клиентского портфеля (например D39004)
         :param orderId: Идентификатор заявки (например 18995978560)
         :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Order вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/clients/{exchange}/{portfolio}'
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/clients/{exchange}/{portfolio}'
                 f'/orders/{orderId}',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, Order if typed else None)
 
     def get_stoporders_info(self, portfolio: str = None,
-                            exchange: str = 'MOEX'):
+                            exchange: str = 'MOEX', typed: bool = False):
         """Запрос информации о всех стоп-заявках
 
         :param portfolio: Идентификатор клиентского портфеля (например D39004)
         :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.StopOrder вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/clients/{exchange}/{portfolio}/stoporders',
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/'
+                f'clients/{exchange}/{portfolio}/stoporders',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, StopOrder if typed else None)
 
     def get_stoporder_info(self, orderId: str, portfolio: str = None,
-                           exchange: str = None):
+                           exchange: str = None, typed: bool = False):
         """Запрос информации о выбранной стоп-заявке
 
         :param portfolio: Идентификатор клиентского портфеля (например D39004)
         :param orderId: Идентификатор заявки (например 18995978560)
         :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.StopOrder вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/clients/{exchange}'
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/clients/{exchange}'
                 f'/{portfolio}/stoporders/{orderId}',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, StopOrder if typed else None)
 
-    def get_summary_info(self, portfolio: str = None, exchange: str = None):
+    def get_summary_info(self, portfolio: str = None, exchange: str = None,
+                         typed: bool = False):
         """
         Запрос сводной информации
 
         :param portfolio: Идентификатор клиентского портфеля (например D39004)
         :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Summary вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/clients/{exchange}/{portfolio}/summary',
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/clients/{exchange}/{portfolio}/summary',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, Summary if typed else None)
 
-    def get_positions_info(self, portfolio: str = None, exchange: str = None):
+    def get_positions_info(self, portfolio: str = None, exchange: str = None,
+                           typed: bool = False):
         """
         Запрос информации о позициях
 
         :param portfolio: Идентификатор клиентского портфеля
         :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Position вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/Clients/{exchange}/{portfolio}/positions',
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/'
+                f'Clients/{exchange}/{portfolio}/positions',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, Position if typed else None)
 
     def get_position_info(self, ticker: str, portfolio: str = None,
-                          exchange: str = None):
+                          exchange: str = None, typed: bool = False):
         """
         Запрос информации о позици по инструменту
 
         :param ticker: Инструмент (GAZP)
         :param portfolio: Идентификатор клиентского портфеля
         :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Position вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/'
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/'
                 f'clients/{exchange}/{portfolio}/positions/{ticker}',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, Position if typed else None)
 
-    def get_trades_info(self, portfolio: str = None, exchange: str = None):
+    def get_trades_info(self, portfolio: str = None, exchange: str = None,
+                        typed: bool = False):
         """Запрос информации о сделках
 
         :param portfolio: Идентификатор клиентского портфеля
         :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Trade вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/'
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/'
                 f'Clients/{exchange}/{portfolio}/trades',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, Trade if typed else None)
 
     def get_trade_info(self, ticker: str, portfolio: str = None,
-                       exchange: str = None):
+                       exchange: str = None, typed: bool = False):
         """Запрос информации о сделках по выбранному инструменту
 
         :param ticker: Инструмент (GAZP)
         :param portfolio: Идентификатор клиентского портфеля
         :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Trade вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/'
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/'
                 f'Clients/{exchange}/{portfolio}/{ticker}/trades',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, Trade if typed else None)
 
-    def get_fortrisk_info(self, portfolio: str = None, exchange: str = None):
+    def get_fortrisk_info(self, portfolio: str = None, exchange: str = None,
+                          typed: bool = False):
         """
         Запрос информации о рисках
 
         :param portfolio: Идентификатор клиентского портфеля
         :param exchange: Биржа Available values : MOEX
+        :param typed: Вернуть models.FortsRisk вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/'
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/'
                 f'Clients/{exchange}/{portfolio}/fortsrisk',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, FortsRisk if typed else None)
 
-    def get_risk_info(self, portfolio: str = None, exchange: str = None):
+    def get_risk_info(self, portfolio: str = None, exchange: str = None,
+                      typed: bool = False):
         """
         Запрос информации о рисках
 
         :param portfolio: Идентификатор клиентского портфеля
         :param exchange: Биржа Available values : MOEX, SPBX
+        :param typed: Вернуть models.Risk вместо JSON
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/'
+        portfolio, exchange = self._account(portfolio, exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/'
                 f'Clients/{exchange}/{portfolio}/risk',
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, Risk if typed else None)
+
+    def get_accounts(self, portfolios: list = None, endpoints: tuple = None,
+                     exchange: str = None,
+                     concurrency: int = ACCOUNT_CONCURRENCY,
+                     typed: bool = False):
+        """
+        Данные клиента по нескольким портфелям одним вызовом: запросы
+        всех пар портфель x эндпоинт выполняются параллельно, поэтому
+        общее время - примерно один запрос, а не N x M. Значение
+        по умолчанию self.portfolio здесь не применяется.
+
+            alor.get_accounts(endpoints=('positions', 'summary'))
+            # {'D00031': {'positions': [...], 'summary': {...}},
+            #  '7500031': {'positions': [...], 'summary': {...}}}
+
+        :param portfolios: Портфели, по умолчанию все из get_portfolios()
+        :param endpoints: Ключи accounts.ACCOUNT_ENDPOINTS: positions,
+         summary, risk, fortsrisk, orders, stoporders, trades. По
+         умолчанию positions, summary, risk и fortsrisk для портфелей
+         срочного рынка
+        :param exchange: Биржа Available values : MOEX, SPBX
+        :param concurrency: Максимум одновременных запросов
+        :param typed: Вернуть модели из models.py вместо JSON
+        :return: {портфель: {эндпоинт: JSON или None при ошибке}}
+        """
+        routing = self.routing
+        markets = routing.markets if routing is not None else {}
+        if portfolios is None:
+            portfolios = list(markets)
+        _, exchange = self._account(exchange=exchange)
+        jobs = account_jobs(self.url_api, exchange or EXCHANGE, portfolios,
+                            endpoints, markets)
+        if not jobs:
+            return {}
+
+        def fetch(job):
+            _, _, url, model = job
+            try:
+                res = self._request('GET', url=url, headers=self._headers)
+            except requests.RequestException as e:
+                if LOGGING:
+                    logger.error('Ошибка запроса %s: %s', url, e,
+                                 extra=request_fields(url))
+                return None
+            return self._check_results(res, model if typed else None)
+
+        with ThreadPoolExecutor(min(concurrency, len(jobs))) as pool:
+            results = list(pool.map(fetch, jobs))
+        self.error = any(result is None for result in results)
+        return merge(jobs, results)
 
     # ------------------ Блок Ценные бумаги / инструменты ---------------------
 
@@ -375,18 +669,19 @@ class Api:
         :param ticker: Фильтр про инструменту GAZP
         :return: [ Simple JSON ]
         """
-        if self.exchange:
-            exchange = self.exchange
+        _, exchange = self._account(exchange=exchange)
         query = {'query': ticker,
                  'limit': limit,
                  'sector': sector,
                  'cficode': cficode,
                  'exchange': exchange
                  }
-        res = requests.get(
-            url=f'{URL_API}/md/v2/securities',
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/securities',
             params=query,
-            headers=self._headers
+            headers=self._headers,
+            ttl=CACHE_TTL['securities']
         )
         return self._check_results(res)
 
@@ -399,14 +694,33 @@ class Api:
 
         :return: Simple JSON
         """
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/Securities/{exchange}',
+        _, exchange = self._account(exchange=exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/Securities/{exchange}',
             headers=self._headers
         )
         return self._check_results(res)
 
+    def iter_all_securities_info(self, exchange: str = None,
+                                 fields: tuple = None):
+        """
+        Потоковый вариант get_all_securities_info(): инструменты отдаются
+        по одному по мере загрузки, память не растет с размером ответа
+
+        :param exchange:  Биржа Available values : MOEX, SPBX
+        :param fields: Оставить только эти поля, например ('symbol', 'ISIN')
+        :return: Генератор Simple JSON
+        """
+        _, exchange = self._account(exchange=exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/Securities/{exchange}',
+            headers=self._headers,
+            stream=True
+        )
+        return self._iter_results(res, fields)
+
     def get_security_info(self, ticker: str, exchange: str = None):
         """
         Запрос информации о выбранном финансовом инструменте на бирже
@@ -416,11 +730,12 @@ class Api:
         :param ticker: Инструмент GAZP
         :return: Simple JSON
         """
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/Securities/{exchange}/{ticker}',
-            headers=self._headers
+        _, exchange = self._account(exchange=exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/Securities/{exchange}/{ticker}',
+            headers=self._headers,
+            ttl=CACHE_TTL['securities']
         )
         return self._check_results(res)
 
@@ -433,51 +748,114 @@ class Api:
          Например MOEX:SBER,MOEX:GAZP,SPBX:AAPL
         :return: Simple JSON
         """
-        res = requests.get(
-            url=f'{URL_API}/md/v2/securities/{symbols}/quotes',
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/securities/{symbols}/quotes',
             headers=self._headers
         )
         return self._check_results(res)
 
-    async def _get_orderbook(self, sec: str, depth: int = 5):
-        session = aiohttp.ClientSession()
-        exchange = self.exchange
-        res = await session.get(
-            url=f'{URL_API}/md/v2/orderbooks/{exchange}/{sec}?depth={depth}',
-            headers=self._headers
-        )
-        if res.status != 200:
-            await session.close()
-            return sec, None
+    def _submit_orderbooks(self, sec_ls, depth, concurrency, timeout):
+        """
+        Запустить опрос стаканов в фоновом event loop клиента.
+        :return: concurrent.futures.Future
+        """
+        if isinstance(sec_ls, str):
+            sec_ls = [sec_ls]
+        _, exchange = self._account()
+        # _headers может обновить токен синхронным запросом и ставит
+        # error своего потока, поэтому вычисляем его в вызывающем потоке
+        headers = self._headers
+
+        async def fan_out():
+            if self._aio_session is None:
+                self._aio_session = aiohttp.ClientSession()
+            return await fetch_orderbooks(
+                self._aio_session, self.url_api, exchange, sec_ls,
+                depth, headers, concurrency=concurrency, timeout=timeout,
+                limiter=self.limiter)
 
-        data = await res.json()
-        await session.close()
-        return sec, data
+        return asyncio.run_coroutine_threadsafe(fan_out(), self._aio_loop)
 
-    def get_orderbooks(self, sec_ls: list = None, depth: int = 5):
+    @property
+    def _aio_loop(self):
+        """
+        Собственный event loop клиента в фоновом потоке: в нем живет
+        общая aiohttp сессия для параллельных запросов стаканов.
+        """
+        with self._aio_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, name='alor-api-loop',
+                    daemon=True)
+                self._loop_thread.start()
+        return self._loop
+
+    @staticmethod
+    def _orderbooks_result(results, return_errors: bool,
+                           typed: bool = False):
+        if typed:
+            results = [(sec, decode(data, Book), error)
+                       for sec, data, error in results]
+        if return_errors:
+            return results
+        return [(sec, data) for sec, data, _ in results]
+
+    def get_orderbooks(self,
+                       sec_ls: list = None,
+                       depth: int = 5,
+                       concurrency: int = ORDERBOOK_CONCURRENCY,
+                       timeout: float = ORDERBOOK_TIMEOUT,
+                       return_errors: bool = False,
+                       typed: bool = False,
+                       ):
         """
         Получить списки заявок bid/ask для ценных бумаг
 
+        Запросы идут параллельно через одну aiohttp сессию, не больше
+        concurrency одновременно. Внутри работающего event loop
+        используйте get_orderbooks_async().
+
         :param depth: Глубина стакана
         :param sec_ls: Список ценных бумаг
+        :param concurrency: Максимум одновременных запросов
+        :param timeout: Таймаут на одну бумагу в секундах
+        :param return_errors: Вернуть тройки с текстом ошибки по бумаге
+        :param typed: Вернуть стаканы models.Book вместо JSON
         :return: [(Название бумаги, JSON), ... ]
+         или [(Название бумаги, JSON, ошибка), ... ]
         """
-
         if sec_ls is None:
             return None
-        if isinstance(sec_ls, str):
-            sec_ls = [sec_ls]
-
-        futures = [self._get_orderbook(sec, depth=depth) for sec in sec_ls]
-        loop = asyncio.get_event_loop()
-        order_books = loop.run_until_complete(asyncio.gather(*futures))
-        return order_books
+        future = self._submit_orderbooks(sec_ls, depth, concurrency, timeout)
+        return self._orderbooks_result(future.result(), return_errors,
+                                       typed)
+
+    async def get_orderbooks_async(self,
+                                   sec_ls: list = None,
+                                   depth: int = 5,
+                                   concurrency: int = ORDERBOOK_CONCURRENCY,
+                                   timeout: float = ORDERBOOK_TIMEOUT,
+                                   return_errors: bool = False,
+                                   typed: bool = False,
+                                   ):
+        """
+        То же, что get_orderbooks(), но для вызова из работающего
+        event loop: ожидание не блокирует вызывающий loop.
+        """
+        if sec_ls is None:
+            return None
+        future = self._submit_orderbooks(sec_ls, depth, concurrency, timeout)
+        results = await asyncio.wrap_future(future)
+        return self._orderbooks_result(results, return_errors, typed)
 
     def get_today_trades(self,
                          ticker: str,
                          exchange: str = None,
                          start: int = None,
-                         finish: int = None
+                         finish: int = None,
+                         typed: bool = False,
                          ):
         """
         Запросить данные о всех сделках (лента) по ценным бумагам
@@ -488,17 +866,49 @@ class Api:
         :param ticker: Инструмент GAZP
         :param start: Начало отрезка времени (UTC) для фильтра результатов
         :param finish: Конец отрезка времени (UTC) для фильтра результатов
+        :param typed: Вернуть models.Trade вместо JSON
         :return: Simple JSON
         """
-        if self.exchange:
-            exchange = self.exchange
+        _, exchange = self._account(exchange=exchange)
         query = {'from': start, 'to': finish}
-        res = requests.get(
-            url=f'{URL_API}/md/v2/Securities/{exchange}/{ticker}/alltrades',
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/'
+                f'Securities/{exchange}/{ticker}/alltrades',
             params=query,
             headers=self._headers
         )
-        return self._check_results(res)
+        return self._check_results(res, Trade if typed else None)
+
+    def iter_today_trades(self,
+                          ticker: str,
+                          exchange: str = None,
+                          start: int = None,
+                          finish: int = None,
+                          fields: tuple = None,
+                          ):
+        """
+        Потоковый вариант get_today_trades(): сделки отдаются по одной
+        по мере загрузки ленты
+
+        :param exchange: Биржа : MOEX, SPBX
+        :param ticker: Инструмент GAZP
+        :param start: Начало отрезка времени (UTC) для фильтра результатов
+        :param finish: Конец отрезка времени (UTC) для фильтра результатов
+        :param fields: Оставить только эти поля, например ('price', 'qty')
+        :return: Генератор Simple JSON
+        """
+        _, exchange = self._account(exchange=exchange)
+        query = {'from': start, 'to': finish}
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/'
+                f'Securities/{exchange}/{ticker}/alltrades',
+            params=query,
+            headers=self._headers,
+            stream=True
+        )
+        return self._iter_results(res, fields)
 
     def get_futures_quotes(self, symbol: str, exchange: str = None):
         """
@@ -508,12 +918,13 @@ class Api:
         :param symbol: Инструмент SBRF
         :return: Simple JSON
         """
-        if self.exchange:
-            exchange = self.exchange
-        res = requests.get(
-            url=f'{URL_API}/md/v2/Securities/'
+        _, exchange = self._account(exchange=exchange)
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/Securities/'
                 f'{exchange}/{symbol}/actualFuturesQuote',
-            headers=self._headers
+            headers=self._headers,
+            ttl=CACHE_TTL['futures_quotes']
         )
         return self._check_results(res)
 
@@ -537,16 +948,16 @@ class Api:
          Допустимые значения 15, 60, 300, 900, 3600, 86400
         :return: Simple JSON
         """
-        if self.exchange:
-            exchange = self.exchange
+        _, exchange = self._account(exchange=exchange)
         payload = {
             'exchange': exchange,
             'symbol': ticker,
             'from': start,
             'to': finish,
             'tf': tfs}
-        res = requests.get(
-            url=f'{URL_API}/md/v2/history',
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/md/v2/history',
             params=payload,
             headers=self._headers
         )
@@ -559,16 +970,86 @@ class Api:
         без авторизации, то будет возвращено время,
         которое было 15 минут назад.
 
+        Время берется из кеша как смещение часов сервера относительно
+        локальных и обновляется раз в CACHE_TTL['time'] секунд.
+
         :return:
         """
-        res = requests.get(
-            url=f'{URL_API}/md/v2/time',
+        url = f'{self.url_api}/md/v2/time'
+        key = request_key('GET', url)
+        offset = None if self.cache is None else self.cache.get(key)
+        if offset is not None:
+            return int(time.time() + offset)
+        res = self._request(
+            'GET',
+            url=url,
             headers=self._headers
         )
-        return self._check_results(res)
+        result = self._check_results(res)
+        if result is not None and self.cache is not None:
+            self.cache.set(key, result - time.time(), CACHE_TTL['time'])
+        return result
 
     # ------------- Работа с заявками ---------------
 
+    @property
+    def routing(self):
+        """
+        Таблица маршрутов заявок, загружается из get_portfolios() один раз.
+        После ошибки повторная загрузка не раньше, чем через
+        ROUTING_RETRY_DELAY секунд.
+
+        :return: RoutingTable или None, если портфели не получены
+        """
+        if self._routing is None and \
+                time.monotonic() >= self._routing_retry_at:
+            portfolios = self.get_portfolios()
+            if portfolios:
+                self._routing = RoutingTable(portfolios)
+            else:
+                self._routing_retry_at = \
+                    time.monotonic() + ROUTING_RETRY_DELAY
+        return self._routing
+
+    def route(self, ticker: str = None, portfolio: str = None,
+              exchange: str = None):
+        """
+        Маршрут заявки: портфель, tks (account) и код торгового сервера.
+        Если портфель не указан, рынок определяется по инструменту
+        (get_security_info(), ответ кешируется, неизвестный тикер
+        перезапрашивается не раньше, чем через ROUTING_RETRY_DELAY).
+
+        :param ticker: Инструмент SBER
+        :param portfolio: Идентификатор клиентского портфеля
+        :param exchange: Биржа MOEX, SPBX
+        :return: Route или None
+        """
+        if self.routing is None:
+            return None
+        if portfolio is not None:
+            return self.routing.for_portfolio(portfolio, exchange)
+        if ticker is None:
+            return None
+        key = ticker, exchange
+        if time.monotonic() < self._unresolved.get(key, 0.0):
+            return None
+        security = self.get_security_info(ticker, exchange)
+        if not security:
+            self._unresolved[key] = time.monotonic() + ROUTING_RETRY_DELAY
+            return None
+        self._unresolved.pop(key, None)
+        market, kind = instrument_type(security)
+        return self.routing.resolve(market, exchange, kind)
+
+    def _route(self, ticker, portfolio, exchange) -> Route:
+        """
+        Маршрут с подставленным портфелем, по умолчанию сервер TRADE
+        """
+        route = self.route(ticker, portfolio, exchange)
+        if route is None:
+            return Route(None, portfolio, None, DEFAULT_TRADE_SERVER)
+        return route._replace(portfolio=portfolio or route.portfolio)
+
     def set_market_order(self, ticker: str,
                          side: str,
                          quantity: int,
@@ -594,17 +1075,19 @@ class Api:
         :param order_id: Уникальная строка ордера
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
+        portfolio, exchange = self._account(portfolio, exchange)
+        route = self._route(ticker, portfolio, exchange)
+        portfolio = route.portfolio
         if not order_id:
             order_id = self._random_order_id
         payload = self._payload(ticker, side, quantity, type_order='market',
                                 exchange=exchange, portfolio=portfolio)
-        headers = self._headers
+        headers = dict(self._headers)
         headers['X-ALOR-REQID'] = f'{portfolio};{order_id}'
-        res = requests.post(
-            url=f'{URL_API}/commandapi/warptrans/TRADE/'
-                f'v2/client/orders/actions/market',
+        res = self._request(
+            'POST',
+            url=f'{self.url_api}/commandapi/warptrans/'
+                f'{route.trade_server_code}/v2/client/orders/actions/market',
             headers=headers,
             json=payload
         )
@@ -638,10 +1121,9 @@ class Api:
         :param order_id: Уникальная строка ордера
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
+        portfolio, exchange = self._account(portfolio, exchange)
+        route = self._route(ticker, portfolio, exchange)
+        portfolio = route.portfolio
         if not order_id:
             order_id = self._random_order_id
         payload = self._payload(ticker, side, quantity,
@@ -649,11 +1131,12 @@ class Api:
                                 price=price,
                                 exchange=exchange,
                                 portfolio=portfolio)
-        headers = self._headers
+        headers = dict(self._headers)
         headers['X-ALOR-REQID'] = f'{portfolio};{order_id}'
-        res = requests.post(
-            url=f'{URL_API}/commandapi/warptrans/TRADE/'
-                f'v2/client/orders/actions/limit',
+        res = self._request(
+            'POST',
+            url=f'{self.url_api}/commandapi/warptrans/'
+                f'{route.trade_server_code}/v2/client/orders/actions/limit',
             headers=headers,
             json=payload
         )
@@ -664,8 +1147,8 @@ class Api:
                      side: str,
                      quantity: int,
                      price: float,
-                     trade_server_code: str,
-                     account: str,
+                     trade_server_code: str = None,
+                     account: str = None,
                      portfolio: str = None,
                      exchange: str = None,
                      order_id: str = None,
@@ -681,9 +1164,9 @@ class Api:
         на предыдущий запрос с таким значением идентификатора.
 
         :param account: Значение tks из выдачи get_portfolios(),
-        например (L01-00000F00)
+        например (L01-00000F00), по умолчанию из таблицы маршрутов
         :param trade_server_code: Код сервера, TRADE для фондового рынка, FX1
-        для валютного, см выдачу get_portfolios()
+        для валютного, по умолчанию из таблицы маршрутов
         :param exchange: Биржа MOEX, SPBX
         :param ticker: Инструмент GDH1
         :param side: Купить или продать по рынку sell, buy
@@ -694,10 +1177,12 @@ class Api:
         :param order_id: Уникальная строка ордера
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
+        portfolio, exchange = self._account(portfolio, exchange)
+        if trade_server_code is None or account is None or portfolio is None:
+            route = self._route(ticker, portfolio, exchange)
+            portfolio = route.portfolio
+            account = account or route.tks
+            trade_server_code = trade_server_code or route.trade_server_code
         if not order_id:
             order_id = self._random_order_id
         payload = {
@@ -714,10 +1199,11 @@ class Api:
             },
             "OrderEndUnixTime": 0
         }
-        headers = self._headers
+        headers = dict(self._headers)
         headers['X-ALOR-REQID'] = order_id
-        res = requests.post(
-            url=f'{URL_API}/warptrans/{trade_server_code}/'
+        res = self._request(
+            'POST',
+            url=f'{self.url_api}/warptrans/{trade_server_code}/'
                 f'v2/client/orders/actions/stopLoss',
             headers=headers,
             json=payload
@@ -729,8 +1215,8 @@ class Api:
                         side: str,
                         quantity: int,
                         price: float,
-                        trade_server_code: str,
-                        account: str,
+                        trade_server_code: str = None,
+                        account: str = None,
                         portfolio: str = None,
                         exchange: str = None,
                         order_id: str = None,
@@ -746,9 +1232,9 @@ class Api:
         на предыдущий запрос с таким значением идентификатора.
 
         :param account: Значение tks из выдачи get_portfolios(),
-        например (L01-00000F00)
+        например (L01-00000F00), по умолчанию из таблицы маршрутов
         :param trade_server_code: Код сервера, TRADE для фондового рынка, FX1
-        для валютного, см выдачу get_portfolios()
+        для валютного, по умолчанию из таблицы маршрутов
         :param exchange: Биржа MOEX, SPBX
         :param ticker: Инструмент GDH1
         :param side: Купить или продать по рынку sell, buy
@@ -759,10 +1245,12 @@ class Api:
         :param order_id: Уникальная строка ордера
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
+        portfolio, exchange = self._account(portfolio, exchange)
+        if trade_server_code is None or account is None or portfolio is None:
+            route = self._route(ticker, portfolio, exchange)
+            portfolio = route.portfolio
+            account = account or route.tks
+            trade_server_code = trade_server_code or route.trade_server_code
         if not order_id:
             order_id = self._random_order_id
         payload = {
@@ -779,10 +1267,11 @@ class Api:
             },
             "OrderEndUnixTime": 0
         }
-        headers = self._headers
+        headers = dict(self._headers)
         headers['X-ALOR-REQID'] = order_id
-        res = requests.post(
-            url=f'{URL_API}/warptrans/{trade_server_code}/'
+        res = self._request(
+            'POST',
+            url=f'{self.url_api}/warptrans/{trade_server_code}/'
                 f'v2/client/orders/actions/takeProfit',
             headers=headers,
             json=payload
@@ -815,17 +1304,18 @@ class Api:
         :param order_id: Уникальная строка ордера
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
-        if self.exchange:
-            exchange = self.exchange
+        portfolio, exchange = self._account(portfolio, exchange)
+        route = self._route(ticker, portfolio, exchange)
+        portfolio = route.portfolio
         payload = self._payload(ticker, side, quantity, type_order='market',
                                 exchange=exchange, )
-        headers = self._headers
+        headers = dict(self._headers)
         headers['X-ALOR-REQID'] = f'{portfolio};{order_id};{quantity}'
-        res = requests.put(
-            url=f'{URL_API}/commandapi/warptrans/TRADE/'
-                f'v2/client/orders/actions/market/{order_id}',
+        res = self._request(
+            'PUT',
+            url=f'{self.url_api}/commandapi/warptrans/'
+                f'{route.trade_server_code}/v2/client/orders/actions/market/'
+                f'{order_id}',
             headers=headers,
             json=payload
         )
@@ -858,17 +1348,20 @@ class Api:
         :param order_id: Уникальная строка ордера
         :return: Simple JSON
         """
-        if self.portfolio:
-            portfolio = self.portfolio
+        portfolio, exchange = self._account(portfolio, exchange)
+        route = self._route(ticker, portfolio, exchange)
+        portfolio = route.portfolio
         payload = self._payload(ticker, side, quantity, type_order='limit',
                                 price=price,
                                 exchange=exchange,
                                 portfolio=portfolio)
-        headers = self._headers
+        headers = dict(self._headers)
         headers['X-ALOR-REQID'] = f'{portfolio};{order_id};{quantity}'
-        res = requests.put(
-            url=f'{URL_API}/commandapi/warptrans/TRADE/'
-                f'v2/client/orders/actions/limit/{order_id}',
+        res = self._request(
+            'PUT',
+            url=f'{self.url_api}/commandapi/warptrans/'
+                f'{route.trade_server_code}/v2/client/orders/actions/limit/'
+                f'{order_id}',
             headers=headers,
             json=payload
         )
@@ -889,10 +1382,8 @@ class Api:
         :param stop:
         :return:
         """
-        if self.exchange:
-            exchange = self.exchange
-        if self.portfolio:
-            portfolio = self.portfolio
+        portfolio, exchange = self._account(portfolio, exchange)
+        server = self._route(None, portfolio, exchange).trade_server_code
         payload = {
             'exchange': exchange,
             'portfolio': portfolio,
@@ -902,8 +1393,9 @@ class Api:
         }
         headers = self._headers
         path_part = '/commandapi' if not stop else ''
-        res = requests.delete(
-            url=f'{URL_API}{path_part}/warptrans/TRADE/'
+        res = self._request(
+            'DELETE',
+            url=f'{self.url_api}{path_part}/warptrans/{server}/'
                 f'v2/client/orders/{order_id}',
             headers=headers,
             params=payload
@@ -927,10 +1419,7 @@ class Api:
             'Orders': list(),
             'ExecutionPolicy': 'OnExecuteOrCancel'
         }
-        if self.exchange:
-            exchange = self.exchange
-        if self.portfolio:
-            portfolio = self.portfolio
+        portfolio, exchange = self._account(portfolio, exchange)
         default_order = {
             'Portfolio': portfolio,
             'Exchange': exchange,
@@ -943,8 +1432,9 @@ class Api:
             payload['Orders'].append(order)
 
         headers = self._headers
-        res = requests.post(
-            url=f'{URL_API}/commandapi/api/orderGroups',
+        res = self._request(
+            'POST',
+            url=f'{self.url_api}/commandapi/api/orderGroups',
             headers=headers,
             json=payload
         )
@@ -957,8 +1447,9 @@ class Api:
         :return:
         """
         headers = self._headers
-        res = requests.delete(
-            url=f'{URL_API}/commandapi/api/orderGroups/{group_id}',
+        res = self._request(
+            'DELETE',
+            url=f'{self.url_api}/commandapi/api/orderGroups/{group_id}',
             headers=headers,
 
         )
@@ -973,8 +1464,9 @@ class Api:
         :return:
         """
         headers = self._headers
-        res = requests.get(
-            url=f'{URL_API}/commandapi/api/orderGroups/{group_id}',
+        res = self._request(
+            'GET',
+            url=f'{self.url_api}/commandapi/api/orderGroups/{group_id}',
             headers=headers,
 
         )
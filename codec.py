@@ -0,0 +1,38 @@
+"""
+Кодирование и разбор JSON: orjson, если установлен, иначе json из
+стандартной библиотеки. Ошибки разбора в обоих случаях - подклассы
+json.JSONDecodeError.
+
+    from codec import loads, dumps
+    loads(b'{"a": 1}')
+    dumps({'a': 1})  # b'{"a":1}'
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'json' if orjson is None else 'orjson'
+
+
+if orjson is not None:
+    def loads(data):
+        """
+        :param data: bytes или str
+        """
+        return orjson.loads(data)
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+else:
+    def loads(data):
+        """
+        :param data: bytes или str
+        """
+        return json.loads(data)
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False,
+                          separators=(',', ':')).encode()
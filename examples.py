@@ -1,7 +1,10 @@
+import log
 from client import Api
 from misc import print_orderbook
 from settings import REFRESH_TOKEN, USERNAME
 
+log.configure()
+
 # Создаем объект API используя Refresh токен и Аккаунт - username
 alor = Api(REFRESH_TOKEN, USERNAME)
 
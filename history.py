@@ -0,0 +1,156 @@
+import asyncio
+
+import aiohttp
+import numpy as np
+
+from log import logger
+from ratelimit import RETRY_STATUSES
+from settings import (
+    LOGGING,
+    HISTORY_WINDOW_BARS, HISTORY_CONCURRENCY, HISTORY_RETRIES
+)
+
+BAR_DTYPE = np.dtype([
+    ('time', 'i8'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'i8'),
+])
+
+
+def bars_to_array(bars: list) -> np.ndarray:
+    """
+    Список баров get_history()['history'] в структурированный массив
+
+    :return: np.ndarray с dtype BAR_DTYPE
+    """
+    return np.array([(bar['time'], bar['open'], bar['high'], bar['low'],
+                      bar['close'], bar['volume']) for bar in bars],
+                    dtype=BAR_DTYPE)
+
+
+def merge_bars(arrays: list) -> np.ndarray:
+    """
+    Склеить куски истории: упорядочить по времени и убрать бары,
+    попавшие в соседние куски на их границе
+    """
+    if not arrays:
+        return np.empty(0, dtype=BAR_DTYPE)
+    bars = np.concatenate(arrays)
+    _, unique = np.unique(bars['time'], return_index=True)
+    return bars[unique]
+
+
+def split_range(start: int, finish: int, tf: int,
+                max_bars: int = HISTORY_WINDOW_BARS) -> list:
+    """
+    Разбить интервал на окна не больше max_bars баров
+
+    :return: [(от, до), ...] в unix time seconds
+    """
+    step = tf * max_bars
+    return [(left, min(left + step, finish))
+            for left in range(start, finish, step)] or [(start, finish)]
+
+
+class HistoryLoader:
+    """
+    Загрузка длинной истории баров через AsyncApi.
+
+    Интервал режется на окна по max_bars баров, окна запрашиваются
+    параллельно (не больше concurrency одновременно) с повтором при
+    сетевой ошибке или 429/5xx, если их не повторил сам AsyncApi
+    (rate_limits=None). Ответ 4xx - ошибка запроса, окно сразу
+    считается незагруженным. Результат склеивается без дублей на
+    границах окон.
+
+        loader = HistoryLoader(alor)
+        bars = await loader.load('SBER', start, finish, tf=60)
+        bars['close'].mean()
+    """
+
+    def __init__(self, api,
+                 concurrency: int = HISTORY_CONCURRENCY,
+                 retries: int = HISTORY_RETRIES,
+                 max_bars: int = HISTORY_WINDOW_BARS):
+        """
+        :param api: AsyncApi
+        :param concurrency: Максимум одновременных запросов
+        :param retries: Сколько раз повторять запрос окна после сетевой
+         ошибки или 429/5xx, не повторенных AsyncApi
+        :param max_bars: Максимум баров в одном запросе
+        """
+        self.api = api
+        self.concurrency = concurrency
+        self.retries = retries
+        self.max_bars = max_bars
+        self.failed_windows = []
+
+    async def _fetch(self, semaphore, ticker, window, tf, exchange):
+        start, finish = window
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+            try:
+                async with semaphore:
+                    status, body = await self.api._history(
+                        ticker, start, finish, tf, exchange=exchange)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if LOGGING:
+                    logger.error('Ошибка загрузки истории %s %s-%s: %s',
+                                 ticker, start, finish, e)
+                continue
+            data = self.api._check_results(status, body)
+            if data is not None:
+                return bars_to_array(data.get('history') or [])
+            if status != 200 and (status not in RETRY_STATUSES or
+                                  self.api.limiter is not None):
+                # 4xx не исправится повтором, а 429/5xx AsyncApi
+                # уже повторял сам
+                break
+        self.failed_windows.append((ticker, start, finish, tf))
+        if LOGGING:
+            logger.error('Не удалось загрузить историю %s %s-%s, tf=%s',
+                         ticker, start, finish, tf)
+        return None
+
+    async def load(self, ticker: str, start: int, finish: int, tf: int,
+                   exchange: str = None) -> np.ndarray:
+        """
+        Загрузить историю баров
+
+        :param ticker: Код инструмента SBER
+        :param start: От (unix time seconds)
+        :param finish: До (unix time seconds)
+        :param tf: Длительность таймфрейма в секундах.
+         Допустимые значения 15, 60, 300, 900, 3600, 86400
+        :param exchange: Биржа - допустимые значения MOEX, SPBX
+        :return: np.ndarray с dtype BAR_DTYPE, окна, которые не удалось
+         загрузить, попадают в failed_windows
+        """
+        bars, _ = await self.load_windows(ticker, start, finish, tf,
+                                          exchange=exchange)
+        return bars
+
+    async def load_windows(self, ticker: str, start: int, finish: int,
+                           tf: int, exchange: str = None) -> tuple:
+        """
+        То же, что load(), но с окнами, не загруженными этим вызовом:
+        failed_windows общий для всех вызовов и одновременных загрузок
+
+        :return: (np.ndarray с dtype BAR_DTYPE,
+         [(тикер, от, до, таймфрейм), ...])
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        windows = split_range(start, finish, tf, self.max_bars)
+        arrays = await asyncio.gather(
+            *(self._fetch(semaphore, ticker, window, tf, exchange)
+              for window in windows))
+        failed = [(ticker, left, right, tf)
+                  for (left, right), array in zip(windows, arrays)
+                  if array is None]
+        bars = merge_bars([array for array in arrays if array is not None])
+        return bars[(bars['time'] >= start) & (bars['time'] <= finish)], \
+            failed
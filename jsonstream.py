@@ -0,0 +1,122 @@
+"""
+Потоковый разбор JSON массивов: элементы отдаются по одному по мере
+чтения ответа, поэтому в памяти не бывает одновременно всего тела,
+его текста и всего дерева объектов. Используется для больших ответов:
+выгрузки инструментов и ленты сделок.
+"""
+import codecs
+import json
+import re
+from json import JSONDecodeError
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JsonArrayParser:
+    """
+    Инкрементальный разбор JSON массива верхнего уровня.
+    Каждый элемент разбирается C-декодером json через raw_decode,
+    недочитанный хвост ждет следующего куска.
+
+        parser = JsonArrayParser(fields=('symbol', 'price'))
+        for chunk in chunks:
+            for record in parser.feed(chunk):
+                ...
+        parser.close()
+    """
+
+    def __init__(self, fields: tuple = None):
+        """
+        :param fields: Оставить в элементах только эти ключи
+        """
+        self.fields = fields
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._started = False
+        self._finished = False
+
+    def _project(self, record):
+        if self.fields is None or not isinstance(record, dict):
+            return record
+        return {k: record[k] for k in self.fields if k in record}
+
+    def _drain(self, final: bool) -> list:
+        buffer = self._buffer
+        size = len(buffer)
+        pos = 0
+        records = []
+        while not self._finished:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == size:
+                break
+            char = buffer[pos]
+            if not self._started:
+                if char != '[':
+                    raise ValueError('Ожидался JSON массив')
+                self._started = True
+                pos += 1
+            elif char == ',':
+                pos += 1
+            elif char == ']':
+                self._finished = True
+                pos += 1
+            else:
+                try:
+                    record, end = self._decoder.raw_decode(buffer, pos)
+                except JSONDecodeError:
+                    if final:
+                        raise
+                    break
+                if not final and isinstance(record, (int, float)):
+                    # число в конце куска могло быть обрезано: ждем
+                    # разделитель после него
+                    after = _WHITESPACE.match(buffer, end).end()
+                    if after == size or buffer[after] not in ',]':
+                        break
+                records.append(self._project(record))
+                pos = end
+        self._buffer = buffer[pos:]
+        return records
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        :return: Элементы, полностью прочитанные к этому куску
+        """
+        self._buffer += self._utf8.decode(chunk)
+        return self._drain(final=False)
+
+    def close(self) -> list:
+        """
+        :return: Оставшиеся элементы
+        """
+        self._buffer += self._utf8.decode(b'', final=True)
+        records = self._drain(final=True)
+        if not self._finished:
+            raise ValueError('JSON массив оборван')
+        return records
+
+
+def iter_json_array(chunks, fields: tuple = None):
+    """
+    :param chunks: Итератор кусков bytes, например res.iter_content()
+    :param fields: Оставить в элементах только эти ключи
+    :return: Генератор элементов массива
+    """
+    parser = JsonArrayParser(fields)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+async def aiter_json_array(chunks, fields: tuple = None):
+    """
+    То же, что iter_json_array(), для асинхронного итератора кусков,
+    например res.content.iter_chunked()
+    """
+    parser = JsonArrayParser(fields)
+    async for chunk in chunks:
+        for record in parser.feed(chunk):
+            yield record
+    for record in parser.close():
+        yield record
@@ -0,0 +1,172 @@
+"""
+Журнал клиента: логгер 'alor' без обработчиков по умолчанию (импорт
+ничего не настраивает и не трогает корневой логгер). configure()
+включает запись в файл из фонового потока: вызывающий поток только
+кладет запись в очередь, а повторяющиеся ошибки прореживаются.
+
+    import log
+    log.configure('debug.log')
+    ...
+    log.shutdown()
+
+Поля endpoint, status и latency передаются через extra:
+
+    logger.error('Ошибка: %s', status,
+                 extra=request_fields(url, status, latency))
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from metrics import endpoint_name
+from settings import LOG_FILE, LOG_QUEUE_SIZE, LOG_RATE
+
+logger = logging.getLogger('alor')
+logger.addHandler(logging.NullHandler())
+
+FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DATEFMT = '%d-%b-%y %H:%M:%S'
+FIELDS = ('endpoint', 'status', 'latency', 'suppressed')
+
+_listener = None
+_handler = None
+
+
+def request_fields(url: str = None, status: int = None,
+                   latency: float = None) -> dict:
+    """
+    Структурированные поля записи для extra=
+
+    :param url: URL запроса, в журнал попадает шаблон эндпоинта
+    :param latency: Длительность запроса в секундах
+    """
+    result = {}
+    if url is not None:
+        result['endpoint'] = endpoint_name(url)
+    if status is not None:
+        result['status'] = status
+    if latency is not None:
+        result['latency'] = round(latency, 6)
+    return result
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Формат FORMAT и поля FIELDS записи в виде key=value
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = ' '.join(f'{name}={getattr(record, name)}'
+                         for name in FIELDS if hasattr(record, name))
+        return f'{line} {extra}' if extra else line
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Не больше count записей одного шаблона сообщения (уровень + msg
+    до подстановки аргументов) за per секунд. Сколько записей
+    отброшено, сообщает следующая пропущенная в поле suppressed.
+    """
+
+    def __init__(self, count: int, per: float):
+        super().__init__()
+        self.count = count
+        self.per = per
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = record.levelno, record.msg
+        now = time.monotonic()
+        with self._lock:
+            start, passed, dropped = self._windows.get(key, (now, 0, 0))
+            if now - start >= self.per:
+                start, passed = now, 0
+            if passed >= self.count:
+                self._windows[key] = start, passed, dropped + 1
+                return False
+            self._windows[key] = start, passed + 1, 0
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler, который при переполненной очереди отбрасывает запись
+    вместо ожидания: счетчик в dropped
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(QueueListener):
+
+    def enqueue_sentinel(self):
+        # очередь ограничена: ждать места, а не терять остановку
+        self.queue.put(self._sentinel)
+
+
+def configure(filename: str = LOG_FILE,
+              level: int = logging.DEBUG,
+              handler: logging.Handler = None,
+              rate: tuple = LOG_RATE,
+              queue_size: int = LOG_QUEUE_SIZE):
+    """
+    Включить журнал клиента. Повторный вызов заменяет настройки.
+
+    :param filename: Файл журнала (дописывается)
+    :param level: Уровень логгера 'alor'
+    :param handler: Свой обработчик вместо файла, выполняется в фоне
+    :param rate: (записей, за секунд) на шаблон сообщения, None - без
+     ограничения
+    :param queue_size: Размер очереди, при переполнении записи
+     отбрасываются
+    :return: DroppingQueueHandler
+    """
+    global _listener, _handler
+    shutdown()
+    if handler is None:
+        handler = logging.FileHandler(filename, encoding='utf-8')
+    if handler.formatter is None:
+        handler.setFormatter(StructuredFormatter(FORMAT, DATEFMT))
+    _handler = DroppingQueueHandler(queue.Queue(queue_size))
+    if rate:
+        _handler.addFilter(RateLimitFilter(*rate))
+    _listener = _Listener(_handler.queue, handler,
+                          respect_handler_level=True)
+    _listener.start()
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return _handler
+
+
+def shutdown():
+    """
+    Дописать очередь и остановить фоновый поток журнала
+    """
+    global _listener, _handler
+    if _listener is None:
+        return
+    logger.removeHandler(_handler)
+    logger.propagate = True
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = _handler = None
+
+
+atexit.register(shutdown)
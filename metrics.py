@@ -0,0 +1,326 @@
+"""
+Метрики запросов клиента: гистограммы длительности по эндпоинтам и
+фазам, счетчики запросов, ошибок и байт, экспорт в текстовом формате
+Prometheus.
+
+Фазы запроса:
+    auth - получение заголовков авторизации (обновление JWT токена)
+    connect - установка нового соединения (0, если взято из пула)
+    server - отправка запроса и получение ответа, без connect
+    decode - разбор JSON ответа
+
+    alor = Api(REFRESH_TOKEN, USERNAME)
+    alor.metrics.add_hook(print)
+    print(alor.metrics.export())
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from aiohttp import TraceConfig
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from settings import LOGGING
+
+logger = logging.getLogger('alor')
+
+PHASES = ('auth', 'connect', 'server', 'decode')
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1, 2.5, 5, 10)
+
+# Неизменяемые части путей REST API, остальное (биржа, портфель,
+# тикер, номер заявки, код сервера) заменяется на *
+_PATH_WORDS = frozenset((
+    'md', 'v2', 'v1.0', 'client', 'clients', 'users', 'portfolios',
+    'orders', 'stoporders', 'summary', 'positions', 'trades', 'risk',
+    'fortsrisk', 'securities', 'quotes', 'alltrades', 'actualfuturesquote',
+    'orderbooks', 'history', 'time', 'commandapi', 'warptrans', 'actions',
+    'market', 'limit', 'stoploss', 'takeprofit', 'api', 'ordergroups',
+    'refresh', 'ws',
+))
+
+
+@lru_cache(maxsize=4096)
+def endpoint_name(url: str) -> str:
+    """
+    Шаблон пути без изменяемых частей, чтобы число меток не росло:
+    .../md/v2/Clients/MOEX/D00031/positions -> /md/v2/clients/*/*/positions
+    """
+    parts = urlsplit(url).path.lower().split('/')
+    return '/'.join(part if not part or part in _PATH_WORDS else '*'
+                    for part in parts)
+
+
+class Sample(NamedTuple):
+    """
+    Одно измерение фазы запроса, передается в хуки Metrics
+    """
+    endpoint: str
+    phase: str
+    seconds: float
+    status: int = None
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин, как в Prometheus
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценка квантиля по верхней границе корзины
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return float('inf') if self.counts[-1] else 0.0
+
+
+def _is_error(status: int) -> bool:
+    return status == 0 or status >= 400
+
+
+def _labels(**labels) -> str:
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n') for value in labels.values())
+    return ','.join(f'{name}="{value}"'
+                    for name, value in zip(labels, escaped))
+
+
+class Metrics:
+    """
+    Потокобезопасный сборщик метрик. Хуки вызываются на каждое
+    измерение с Sample в потоке запроса, их ошибки не прерывают запрос.
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        """
+        :param buckets: Границы корзин гистограмм в секундах
+        """
+        self.buckets = buckets
+        self.hooks = []
+        self._histograms = {}
+        self._requests = {}
+        self._errors = {}
+        self._bytes = {}
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """
+        :param hook: Функция hook(sample: Sample)
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _run_hooks(self, sample: Sample):
+        for hook in self.hooks:
+            try:
+                hook(sample)
+            except Exception as e:
+                if LOGGING:
+                    logger.error('Ошибка хука метрик %r: %s', hook, e)
+
+    def _observe(self, endpoint: str, phase: str, seconds: float):
+        histogram = self._histograms.get((endpoint, phase))
+        if histogram is None:
+            histogram = self._histograms[endpoint, phase] = \
+                Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def observe(self, url: str, phase: str, seconds: float):
+        """
+        Записать длительность фазы auth или decode
+
+        :param url: URL запроса
+        """
+        endpoint = endpoint_name(url)
+        with self._lock:
+            self._observe(endpoint, phase, seconds)
+        if self.hooks:
+            self._run_hooks(Sample(endpoint, phase, seconds))
+
+    def request(self, url: str, status: int, seconds: float,
+                connect: float = 0.0, sent: int = 0, received: int = 0):
+        """
+        Записать выполненный HTTP запрос
+
+        :param status: HTTP статус, 0 - сетевая ошибка
+        :param seconds: Длительность запроса вместе с connect
+        :param connect: Время установки нового соединения
+        :param sent: Байт в теле запроса
+        :param received: Байт в теле ответа
+        """
+        endpoint = endpoint_name(url)
+        server = max(seconds - connect, 0.0)
+        with self._lock:
+            self._observe(endpoint, 'connect', connect)
+            self._observe(endpoint, 'server', server)
+            key = endpoint, status
+            self._requests[key] = self._requests.get(key, 0) + 1
+            if _is_error(status):
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+            for direction, size in (('out', sent), ('in', received)):
+                key = endpoint, direction
+                self._bytes[key] = self._bytes.get(key, 0) + size
+        if self.hooks:
+            self._run_hooks(Sample(endpoint, 'connect', connect, status))
+            self._run_hooks(Sample(endpoint, 'server', server, status))
+
+    def error(self, url: str):
+        """
+        Ошибка, не видная по HTTP статусу (ответ не разобран)
+        """
+        endpoint = endpoint_name(url)
+        with self._lock:
+            self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def histogram(self, url: str, phase: str):
+        """
+        :return: Histogram фазы эндпоинта или None
+        """
+        return self._histograms.get((endpoint_name(url), phase))
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+            self._errors.clear()
+            self._bytes.clear()
+
+    def export(self) -> str:
+        """
+        :return: Метрики в текстовом формате Prometheus
+        """
+        lines = [
+            '# HELP alor_request_phase_seconds Длительность фазы запроса',
+            '# TYPE alor_request_phase_seconds histogram',
+        ]
+        with self._lock:
+            for (endpoint, phase), h in sorted(self._histograms.items()):
+                labels = _labels(endpoint=endpoint, phase=phase)
+                cumulative = 0
+                for bound, count in zip(self.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'alor_request_phase_seconds_bucket'
+                                 f'{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'alor_request_phase_seconds_bucket'
+                             f'{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f'alor_request_phase_seconds_sum'
+                             f'{{{labels}}} {h.sum}')
+                lines.append(f'alor_request_phase_seconds_count'
+                             f'{{{labels}}} {h.count}')
+            lines += ['# HELP alor_requests_total HTTP запросы',
+                      '# TYPE alor_requests_total counter']
+            for (endpoint, status), n in sorted(self._requests.items()):
+                labels = _labels(endpoint=endpoint, status=status)
+                lines.append(f'alor_requests_total{{{labels}}} {n}')
+            lines += ['# HELP alor_errors_total Ошибки запросов',
+                      '# TYPE alor_errors_total counter']
+            for endpoint, n in sorted(self._errors.items()):
+                labels = _labels(endpoint=endpoint)
+                lines.append(f'alor_errors_total{{{labels}}} {n}')
+            lines += ['# HELP alor_bytes_total Байт в телах запросов '
+                      '(out) и ответов (in)',
+                      '# TYPE alor_bytes_total counter']
+            for (endpoint, direction), n in sorted(self._bytes.items()):
+                labels = _labels(endpoint=endpoint, direction=direction)
+                lines.append(f'alor_bytes_total{{{labels}}} {n}')
+        return '\n'.join(lines) + '\n'
+
+
+# ------------- Время установки соединения ---------------
+
+_connect = threading.local()
+
+
+def take_connect_time() -> float:
+    """
+    Время установки соединений текущего потока с прошлого вызова
+    """
+    seconds = getattr(_connect, 'seconds', 0.0)
+    _connect.seconds = 0.0
+    return seconds
+
+
+class _TimedConnect:
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect.seconds = getattr(_connect, 'seconds', 0.0) + \
+                time.perf_counter() - start
+
+
+class _TimedHTTPConnection(_TimedConnect, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnect, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter, соединения которого засекают время connect() для
+    take_connect_time()
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+def connect_trace() -> TraceConfig:
+    """
+    TraceConfig aiohttp: время установки соединения записывается в
+    словарь, переданный запросу как trace_request_ctx, ключ 'connect'
+    """
+    async def start(session, context, params):
+        context.connect_start = time.perf_counter()
+
+    async def end(session, context, params):
+        timing = context.trace_request_ctx
+        if isinstance(timing, dict):
+            timing['connect'] = time.perf_counter() - context.connect_start
+
+    trace = TraceConfig()
+    trace.on_connection_create_start.append(start)
+    trace.on_connection_create_end.append(end)
+    return trace
@@ -1,23 +1,24 @@
 from datetime import datetime
+from itertools import zip_longest
+
+from orderbook import OrderBook
 
 
 def print_orderbook(result):
-    timestamp = result[1].get('timestamp')
-    bids = result[1].get('bids')
-    asks = result[1].get('asks')
-    depth = len(asks) if len(asks) >= len(bids) else len(bids)
+    """
+    :param result: (Название бумаги, JSON) или (Название бумаги, JSON,
+     ошибка) из get_orderbooks(), или OrderBook
+    """
+    if not isinstance(result, OrderBook):
+        ticker, data = result[0], result[1]
+        if data is None:
+            print('\n')
+            print(ticker, 'нет данных:', result[2] if len(result) > 2 else '')
+            return
+        result = OrderBook.from_json(ticker, data)
     print('\n')
-    print(result[0], datetime.fromtimestamp(timestamp))
+    print(result.symbol, datetime.fromtimestamp(result.timestamp))
     print(f'|volume{" ":5} bids{"":7} asks{" ":5} volume|')
-    for i in range(depth):
-        try:
-            b_price = bids[i].get('price')
-            b_volume = bids[i].get('volume')
-        except IndexError:
-            b_price = b_volume = 0
-        try:
-            a_price = asks[i].get('price')
-            a_volume = asks[i].get('volume')
-        except IndexError:
-            a_price = a_volume = 0
-        print(f'|{b_volume:4} {b_price:12} {a_price:12} {a_volume:9}|')
+    for (b_price, b_volume), (a_price, a_volume) in zip_longest(
+            result.levels('bids'), result.levels('asks'), fillvalue=(0, 0)):
+        print(f'|{b_volume:4g} {b_price:12} {a_price:12} {a_volume:9g}|')
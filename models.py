@@ -0,0 +1,185 @@
+"""
+Компактные модели ответов API на __slots__: заявки, стоп-заявки,
+позиции, сделки, сводка и риски портфеля, уровни стакана.
+
+Модель хранит только свои поля, без словаря на каждый объект, поля
+доступны как атрибуты в snake_case: order.trans_time вместо
+order['transTime']. Списки в ответах декодируются лениво (ModelList):
+словарь превращается в модель при первом обращении к элементу.
+"""
+import re
+from collections.abc import Sequence
+
+_CAMEL = re.compile(r'(?<=[a-z0-9])([A-Z])')
+
+
+def _fields(*keys) -> tuple:
+    """
+    :return: ((атрибут, ключ JSON), ...), атрибут - ключ в snake_case
+    """
+    return tuple((_CAMEL.sub(r'_\1', key).lower(), key) for key in keys)
+
+
+class Model:
+    """
+    Базовая модель: _fields задает соответствие атрибутов ключам JSON,
+    отсутствующие в ответе поля равны None
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init__(self, **kwargs):
+        for name, _ in self._fields:
+            setattr(self, name, kwargs.get(name))
+
+    @classmethod
+    def from_json(cls, data: dict):
+        model = cls.__new__(cls)
+        for name, key in cls._fields:
+            setattr(model, name, data.get(key))
+        return model
+
+    def to_json(self) -> dict:
+        return {key: getattr(self, name) for name, key in self._fields}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name)
+            for name, _ in self._fields)
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={getattr(self, name)!r}'
+                           for name, _ in self._fields
+                           if getattr(self, name) is not None)
+        return f'{type(self).__name__}({values})'
+
+
+class Order(Model):
+    _fields = _fields('id', 'symbol', 'exchange', 'type', 'side', 'status',
+                      'transTime', 'endTime', 'qty', 'qtyUnits', 'filled',
+                      'filledQtyUnits', 'price', 'existing')
+    __slots__ = tuple(name for name, _ in _fields)
+
+
+class StopOrder(Model):
+    _fields = _fields('id', 'symbol', 'exchange', 'type', 'side', 'status',
+                      'condition', 'transTime', 'endTime', 'qty', 'filled',
+                      'price', 'stopPrice', 'existing')
+    __slots__ = tuple(name for name, _ in _fields)
+
+
+class Position(Model):
+    _fields = _fields('symbol', 'exchange', 'portfolio', 'shortName',
+                      'avgPrice', 'qty', 'qtyUnits', 'open', 'openUnits',
+                      'lotSize', 'dailyUnrealisedPl', 'unrealisedPl',
+                      'isCurrency', 'existing')
+    __slots__ = tuple(name for name, _ in _fields)
+
+
+class Trade(Model):
+    """
+    Сделка клиента (get_trades_info) или сделка ленты (get_today_trades)
+    """
+    _fields = _fields('id', 'orderno', 'symbol', 'exchange', 'side',
+                      'price', 'qty', 'qtyUnits', 'date', 'timestamp',
+                      'existing')
+    __slots__ = tuple(name for name, _ in _fields)
+
+
+class Summary(Model):
+    _fields = _fields('buyingPowerAtMorning', 'buyingPower', 'profit',
+                      'profitRate', 'portfolioEvaluation',
+                      'portfolioLiquidationValue', 'initialMargin',
+                      'riskBeforeForcePositionClosing', 'commission')
+    __slots__ = tuple(name for name, _ in _fields)
+
+
+class Risk(Model):
+    _fields = _fields('portfolio', 'exchange', 'portfolioEvaluation',
+                      'portfolioLiquidationValue', 'initialMargin',
+                      'minimalMargin', 'riskCoverageRatioOne',
+                      'riskCoverageRatioTwo', 'riskCategoryId',
+                      'clientType', 'hasForbiddenPositions',
+                      'hasNegativeQuantity')
+    __slots__ = tuple(name for name, _ in _fields)
+
+
+class FortsRisk(Model):
+    _fields = _fields('portfolio', 'moneyFree', 'moneyBlocked', 'fee',
+                      'moneyOld', 'moneyAmount', 'moneyPledgeAmount',
+                      'vmInterCl', 'vmCurrentPositions', 'varMargin',
+                      'isLimitsSet')
+    __slots__ = tuple(name for name, _ in _fields)
+
+
+class BookLevel(Model):
+    _fields = _fields('price', 'volume')
+    __slots__ = tuple(name for name, _ in _fields)
+
+
+class Book(Model):
+    """
+    Стакан: bids и asks - списки BookLevel
+    """
+    _fields = _fields('bids', 'asks', 'timestamp', 'msTimestamp',
+                      'existing')
+    __slots__ = tuple(name for name, _ in _fields)
+
+    @classmethod
+    def from_json(cls, data: dict):
+        book = super().from_json(data)
+        book.bids = ModelList(book.bids or [], BookLevel)
+        book.asks = ModelList(book.asks or [], BookLevel)
+        return book
+
+
+class ModelList(Sequence):
+    """
+    Список моделей поверх списка словарей ответа. Элемент превращается
+    в модель при первом обращении, словарь при этом освобождается.
+    """
+
+    __slots__ = ('_items', '_model')
+
+    def __init__(self, items: list, model):
+        self._items = items
+        self._model = model
+
+    def __len__(self):
+        return len(self._items)
+
+    def _decode(self, index: int):
+        item = self._items[index]
+        if isinstance(item, dict):
+            item = self._items[index] = self._model.from_json(item)
+        return item
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode(i)
+                    for i in range(*index.indices(len(self._items)))]
+        return self._decode(index)
+
+    def __iter__(self):
+        for i in range(len(self._items)):
+            yield self._decode(i)
+
+    def __repr__(self):
+        return f'ModelList({self._model.__name__}, {len(self)})'
+
+
+def decode(data, model):
+    """
+    Ответ API в модели
+
+    :param model: Класс модели или None - вернуть ответ как есть
+    :return: ModelList для списков, модель для объекта
+    """
+    if model is None or data is None:
+        return data
+    if isinstance(data, list):
+        return ModelList(data, model)
+    if isinstance(data, dict):
+        return model.from_json(data)
+    return data
@@ -0,0 +1,50 @@
+import itertools
+import os
+import socket
+import time
+import weakref
+import zlib
+
+_generators = weakref.WeakSet()
+
+
+class OrderIdGenerator:
+    """
+    Уникальные строки ордеров (X-ALOR-REQID) без хеширования.
+
+    Строка - это префикс процесса (узел, pid, время запуска) и значение
+    монотонного счетчика. next() у itertools.count атомарен, поэтому
+    потоки не получают одинаковых значений, а префикс различает
+    процессы и перезапуски. После fork() дочерний процесс получает
+    новый префикс и счетчик с нуля.
+
+        ids = OrderIdGenerator('P000000')
+        ids()  # 'cc62c0121fc0-18df66ba339018ff-0'
+    """
+
+    __slots__ = ('node', 'prefix', '_counter', '__weakref__')
+
+    def __init__(self, node: str = None):
+        """
+        :param node: Строка, отличающая клиентов на разных машинах,
+         например аккаунт клиента. К ней добавляется имя хоста.
+        """
+        self.node = zlib.crc32(f'{socket.gethostname()}:{node}'.encode())
+        self._reset()
+        _generators.add(self)
+
+    def _reset(self):
+        self.prefix = f'{self.node:08x}{os.getpid():x}-{time.time_ns():x}-'
+        self._counter = itertools.count()
+
+    def __call__(self) -> str:
+        return f'{self.prefix}{next(self._counter):x}'
+
+
+def _after_fork():
+    for generator in list(_generators):
+        generator._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,235 @@
+import asyncio
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from json import JSONDecodeError
+
+import aiohttp
+
+from codec import loads
+from log import logger
+from settings import LOGGING, ORDERBOOK_CONCURRENCY, ORDERBOOK_TIMEOUT
+
+
+async def fetch_orderbooks(session: aiohttp.ClientSession,
+                           url_api: str,
+                           exchange: str,
+                           sec_ls: list,
+                           depth: int,
+                           headers: dict,
+                           concurrency: int = ORDERBOOK_CONCURRENCY,
+                           timeout: float = ORDERBOOK_TIMEOUT,
+                           limiter=None,
+                           ):
+    """
+    Параллельно запросить стаканы по списку бумаг через одну сессию.
+    Одновременно выполняется не больше concurrency запросов, на каждую
+    бумагу отводится не больше timeout секунд. Ошибка одной бумаги не
+    прерывает остальные.
+
+    :param session: Общая aiohttp сессия
+    :param url_api: Адрес API
+    :param exchange: Биржа MOEX, SPBX
+    :param sec_ls: Список ценных бумаг
+    :param depth: Глубина стакана
+    :param headers: Заголовки авторизации (вычисляются один раз на запрос)
+    :param concurrency: Максимум одновременных запросов
+    :param timeout: Таймаут на одну бумагу в секундах
+    :param limiter: RateLimiter, None - без ограничения частоты
+    :return: [(Название бумаги, JSON или None, ошибка или None), ... ]
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    request_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def fetch(sec):
+        url = f'{url_api}/md/v2/orderbooks/{exchange}/{sec}'
+        async with semaphore:
+            if limiter is not None:
+                await limiter.acquire_async(url)
+            try:
+                async with session.get(
+                        url=url,
+                        params={'depth': depth},
+                        headers=headers,
+                        timeout=request_timeout
+                ) as res:
+                    body = await res.read()
+                    if res.status != 200:
+                        return sec, None, f'HTTP {res.status}'
+                    return sec, loads(body), None
+            except asyncio.TimeoutError:
+                return sec, None, 'timeout'
+            except (aiohttp.ClientError, JSONDecodeError) as e:
+                return sec, None, str(e) or type(e).__name__
+
+    results = await asyncio.gather(*(fetch(sec) for sec in sec_ls))
+    if LOGGING:
+        for sec, _, error in results:
+            if error:
+                logger.error('Ошибка получения стакана %s: %s', sec, error)
+    return results
+
+
+class OrderBook:
+    """
+    Стакан, который обновляется на месте.
+
+    Уровни каждой стороны лежат в компактных массивах array('d'),
+    отсортированных так, что лучшая цена всегда последняя: для bids
+    ключ - цена, для asks - цена со знаком минус. Поэтому лучшие цены
+    и спред берутся за O(1), а обновление уровня - bisect и сдвиг
+    короткого массива. Накопленный объем от лучшей цены пересчитывается
+    лениво, только после изменений.
+
+        book = OrderBook.from_json('SBER', data)
+        book.update('bids', 290.5, 0)
+        book.best_bid, book.spread, book.volume_to_price('asks', 291)
+    """
+
+    __slots__ = ('symbol', 'timestamp', '_keys', '_volumes', '_cumulative')
+
+    SIDES = {'bids': 1, 'asks': -1}
+
+    def __init__(self, symbol: str = None):
+        self.symbol = symbol
+        self.timestamp = None
+        self._keys = {'bids': array('d'), 'asks': array('d')}
+        self._volumes = {'bids': array('d'), 'asks': array('d')}
+        self._cumulative = {'bids': None, 'asks': None}
+
+    @classmethod
+    def from_json(cls, symbol: str, data: dict):
+        """
+        :param symbol: Название бумаги
+        :param data: JSON стакана из get_orderbooks() или подписки
+        """
+        book = cls(symbol)
+        book.apply(data)
+        return book
+
+    def __len__(self):
+        return max(len(self._keys['bids']), len(self._keys['asks']))
+
+    def apply(self, data: dict):
+        """
+        Применить снимок стакана или, если snapshot=False, изменения:
+        уровни с нулевым объемом удаляются
+        """
+        if data.get('snapshot', True):
+            self.snapshot(data.get('bids', ()), data.get('asks', ()))
+        else:
+            for side in self.SIDES:
+                for level in data.get(side, ()):
+                    self.update(side, level['price'], level['volume'])
+        self.timestamp = data.get('timestamp', self.timestamp)
+
+    def snapshot(self, bids, asks):
+        """
+        Заменить стакан целиком
+
+        :param bids: [{'price': ..., 'volume': ...}, ...]
+        :param asks: [{'price': ..., 'volume': ...}, ...]
+        """
+        for side, levels in (('bids', bids), ('asks', asks)):
+            sign = self.SIDES[side]
+            levels = sorted((sign * level['price'], level['volume'])
+                            for level in levels if level['volume'])
+            self._keys[side] = array('d', (key for key, _ in levels))
+            self._volumes[side] = array('d', (vol for _, vol in levels))
+            self._cumulative[side] = None
+
+    def update(self, side: str, price: float, volume: float):
+        """
+        Изменить объем на уровне цены, volume=0 удаляет уровень
+
+        :param side: bids или asks
+        """
+        keys = self._keys[side]
+        volumes = self._volumes[side]
+        key = self.SIDES[side] * price
+        i = bisect_left(keys, key)
+        exists = i < len(keys) and keys[i] == key
+        if volume:
+            if exists:
+                volumes[i] = volume
+            else:
+                keys.insert(i, key)
+                volumes.insert(i, volume)
+        elif exists:
+            del keys[i]
+            del volumes[i]
+        self._cumulative[side] = None
+
+    @property
+    def best_bid(self):
+        keys = self._keys['bids']
+        return keys[-1] if keys else None
+
+    @property
+    def best_ask(self):
+        keys = self._keys['asks']
+        return -keys[-1] if keys else None
+
+    @property
+    def spread(self):
+        if not self._keys['bids'] or not self._keys['asks']:
+            return None
+        return -self._keys['asks'][-1] - self._keys['bids'][-1]
+
+    @property
+    def mid(self):
+        if not self._keys['bids'] or not self._keys['asks']:
+            return None
+        return (self._keys['bids'][-1] - self._keys['asks'][-1]) / 2
+
+    def levels(self, side: str, depth: int = None):
+        """
+        Уровни стороны стакана от лучшей цены
+
+        :return: [(цена, объем), ...]
+        """
+        sign = self.SIDES[side]
+        keys = self._keys[side]
+        volumes = self._volumes[side]
+        n = len(keys) if depth is None else min(depth, len(keys))
+        return [(sign * keys[-1 - i], volumes[-1 - i]) for i in range(n)]
+
+    def _cumulative_volumes(self, side: str):
+        """
+        Накопленный объем: [i] - сумма объемов i+1 лучших уровней
+        """
+        cumulative = self._cumulative[side]
+        if cumulative is None:
+            cumulative = array('d', accumulate(reversed(self._volumes[side])))
+            self._cumulative[side] = cumulative
+        return cumulative
+
+    def depth(self, side: str, levels: int) -> float:
+        """
+        Суммарный объем levels лучших уровней
+        """
+        cumulative = self._cumulative_volumes(side)
+        if not cumulative or levels <= 0:
+            return 0
+        return cumulative[min(levels, len(cumulative)) - 1]
+
+    def volume_to_price(self, side: str, price: float) -> float:
+        """
+        Суммарный объем по ценам не хуже price: для bids - не ниже,
+        для asks - не выше
+        """
+        keys = self._keys[side]
+        n = len(keys) - bisect_left(keys, self.SIDES[side] * price)
+        return self.depth(side, n)
+
+    def price_for_volume(self, side: str, volume: float):
+        """
+        Худшая цена, по которой будет исполнен объем volume рыночной
+        заявкой против этой стороны, или None, если объема в стакане
+        не хватает
+        """
+        cumulative = self._cumulative_volumes(side)
+        i = bisect_left(cumulative, volume)
+        if i == len(cumulative):
+            return None
+        return self.SIDES[side] * self._keys[side][-1 - i]
@@ -0,0 +1,164 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from settings import RATE_LIMITS, RATE_RETRIES, RATE_BACKOFF
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+def endpoint_class(url: str) -> str:
+    """
+    Класс эндпоинта для лимитов: orders - торговые команды
+    (/commandapi, /warptrans), account - данные клиента,
+    market - рыночные данные
+    """
+    path = urlsplit(url).path.lower()
+    if path.startswith('/commandapi/') or '/warptrans/' in path:
+        return 'orders'
+    if path.startswith('/md/v2/clients/') or path.startswith('/client/'):
+        return 'account'
+    return 'market'
+
+
+def parse_retry_after(value: str):
+    """
+    :return: Retry-After в секундах (число секунд или HTTP дата)
+     или None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp()
+                   - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate запросов в секунду с всплеском до capacity.
+
+    Токены резервируются под блокировкой, ожидание считается заранее,
+    поэтому одно ведро можно делить между потоками и event loop'ами.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Взять токен
+
+        :return: Сколько секунд подождать перед запросом
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+            self._tokens -= 1
+            return max(0.0, self._updated - now) + \
+                max(0.0, -self._tokens) / self.rate
+
+    def pause(self, seconds: float):
+        """
+        Не выдавать токены seconds секунд (сервер ответил 429)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens, 1)
+            self._updated = max(self._updated, now + seconds)
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    """
+    Ограничение частоты запросов с отдельным ведром на каждый класс
+    эндпоинтов (market, account, orders) и повтор ответов 429/5xx с
+    экспоненциальной задержкой со случайным разбросом. Повторяются
+    только GET и запросы с X-ALOR-REQID: сервер не исполнит заявку с
+    тем же идентификатором дважды, а у прочих команд повтор может
+    создать дубль.
+
+    Задержка из Retry-After соблюдается; на 429 приостанавливается все
+    ведро класса, чтобы остальные потоки тоже не получили отказ.
+    """
+
+    def __init__(self, limits: dict = RATE_LIMITS,
+                 retries: int = RATE_RETRIES,
+                 backoff: tuple = RATE_BACKOFF):
+        """
+        :param limits: {класс: (запросов в секунду, всплеск)}
+        :param retries: Сколько раз повторять запрос после 429/5xx
+        :param backoff: (начальная, максимальная) задержка в секундах
+        """
+        self.buckets = {name: TokenBucket(rate, capacity)
+                        for name, (rate, capacity) in limits.items()}
+        self.retries = retries
+        self.backoff = backoff
+        self.throttled = 0
+
+    def _bucket(self, url: str):
+        return self.buckets.get(endpoint_class(url))
+
+    def acquire(self, url: str):
+        bucket = self._bucket(url)
+        if bucket is not None:
+            bucket.acquire()
+
+    async def acquire_async(self, url: str):
+        bucket = self._bucket(url)
+        if bucket is not None:
+            await bucket.acquire_async()
+
+    def should_retry(self, status: int, attempt: int, method: str = 'GET',
+                     headers: dict = None) -> bool:
+        """
+        :param method: HTTP метод запроса
+        :param headers: Заголовки запроса
+        """
+        if status not in RETRY_STATUSES or attempt >= self.retries:
+            return False
+        return method == 'GET' or 'X-ALOR-REQID' in (headers or {})
+
+    def retry_delay(self, url: str, status: int, attempt: int,
+                    retry_after: str = None) -> float:
+        """
+        :param attempt: Номер неудачной попытки, с нуля
+        :param retry_after: Заголовок Retry-After ответа
+        :return: Сколько секунд подождать перед повтором
+        """
+        self.throttled += 1
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            base, cap = self.backoff
+            delay = min(cap, base * 2 ** attempt)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        if status == 429:
+            bucket = self._bucket(url)
+            if bucket is not None:
+                bucket.pause(delay)
+        return delay
@@ -0,0 +1,98 @@
+from collections import namedtuple
+
+STOCK = 'Фондовый рынок'
+DERIVATIVES = 'Срочный рынок'
+CURRENCY = 'Валютный рынок'
+
+DEFAULT_TRADE_SERVER = 'TRADE'
+
+Route = namedtuple('Route', 'market portfolio tks trade_server_code')
+
+
+def instrument_type(security: dict) -> tuple:
+    """
+    Рынок и тип инструмента по справочнику get_security_info()
+
+    :return: (рынок, тип) - тип: share, bond, future, option, currency
+    """
+    cfi = (security.get('cfiCode') or '').upper()
+    board = security.get('primary_board') or security.get('board') or ''
+    if cfi.startswith('F') or board in ('RFUD', 'SPBFUT'):
+        return DERIVATIVES, 'future'
+    if cfi.startswith('O') or board in ('ROPD', 'SPBOPT'):
+        return DERIVATIVES, 'option'
+    if board == 'CETS' or cfi.startswith('MRC'):
+        return CURRENCY, 'currency'
+    if cfi.startswith('D'):
+        return STOCK, 'bond'
+    return STOCK, 'share'
+
+
+def _contracts(market: str, exchange: str, kind: str) -> str:
+    """
+    Значение contracts сервера из get_portfolios() для инструмента
+    """
+    if market == STOCK:
+        return 'ицб' if exchange == 'SPBX' else 'рцб'
+    if market == DERIVATIVES:
+        return 'опцион' if kind == 'option' else 'фьючерс'
+    return ''
+
+
+class RoutingTable:
+    """
+    Таблица маршрутов заявок из выдачи get_portfolios(): для рынка,
+    биржи и типа инструмента - портфель, tks (account) и код торгового
+    сервера (tradeServerCode).
+
+        routes = RoutingTable(alor.get_portfolios())
+        routes.resolve(STOCK, exchange='MOEX')
+        # Route(market='Фондовый рынок', portfolio='D00031',
+        #       tks='L01-00000F00', trade_server_code='TRADE')
+    """
+
+    def __init__(self, portfolios: dict):
+        """
+        :param portfolios: Выдача get_portfolios()
+        """
+        self.routes = {}
+        self.markets = {}
+        for market, accounts in portfolios.items():
+            for account in accounts:
+                self.markets[account['portfolio']] = market
+                for server in account.get('tradeServersInfo') or [{}]:
+                    self.routes.setdefault(market, []).append((
+                        (server.get('contracts') or '').lower(),
+                        Route(market, account['portfolio'],
+                              account.get('tks'),
+                              server.get('tradeServerCode')
+                              or DEFAULT_TRADE_SERVER)))
+
+    def resolve(self, market: str, exchange: str = None,
+                kind: str = None, portfolio: str = None):
+        """
+        :param market: Рынок, ключ выдачи get_portfolios()
+        :param exchange: Биржа MOEX, SPBX
+        :param kind: Тип инструмента, см. instrument_type()
+        :param portfolio: Портфель, если их на рынке несколько
+        :return: Route или None, если рынка нет в таблице
+        """
+        routes = [route for route in self.routes.get(market, ())
+                  if portfolio is None or route[1].portfolio == portfolio]
+        if not routes:
+            return None
+        contracts = _contracts(market, exchange, kind)
+        for server_contracts, route in routes:
+            if contracts and server_contracts.startswith(contracts):
+                return route
+        return routes[0][1]
+
+    def for_portfolio(self, portfolio: str, exchange: str = None,
+                      kind: str = None):
+        """
+        :return: Route портфеля или None
+        """
+        market = self.markets.get(portfolio)
+        if market is None:
+            return None
+        return self.resolve(market, exchange, kind, portfolio)
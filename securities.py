@@ -0,0 +1,228 @@
+import json
+import os
+import time
+from collections import defaultdict
+from json import JSONDecodeError
+
+import requests
+
+from codec import loads
+from log import logger, request_fields
+from settings import (LOGGING, SECURITIES_CACHE_DIR, SECURITIES_RETRY_DELAY,
+                      SECURITIES_TTL)
+
+
+class SecuritiesMaster:
+    """
+    Локальный справочник инструментов биржи.
+
+    Полная выгрузка get_all_securities_info() (~25 мб) хранится на диске
+    и перезапрашивается не чаще раза в ttl секунд, условным запросом
+    (If-None-Match / If-Modified-Since), если сервер отдал ETag или
+    Last-Modified. По выгрузке строятся индексы по тикеру, ISIN, CFI коду
+    и режиму торгов, поэтому поиск - это чтение словаря в памяти.
+    Срок выгрузки проверяется при каждом поиске. Тикер, которого нет в
+    выгрузке, запрашивается через get_security_info() и запоминается.
+    После неудачной загрузки используется прошлая выгрузка с диска, а
+    сервер запрашивается снова не раньше, чем через retry_delay секунд.
+
+        master = SecuritiesMaster(alor, 'MOEX')
+        master.get('SBER')['lotsize']
+        master.by_isin('RU0009029540')
+    """
+
+    def __init__(self, api, exchange: str = None,
+                 cache_dir: str = SECURITIES_CACHE_DIR,
+                 ttl: int = SECURITIES_TTL,
+                 retry_delay: float = SECURITIES_RETRY_DELAY):
+        """
+        :param api: Api, через который скачивается выгрузка
+        :param exchange: Биржа MOEX, SPBX
+        :param cache_dir: Каталог для выгрузки на диске
+        :param ttl: Через сколько секунд перепроверять выгрузку на сервере
+        :param retry_delay: Через сколько секунд повторять неудачную
+         загрузку выгрузки
+        """
+        self.api = api
+        self.exchange = api.exchange or exchange
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.securities = []
+        self._symbols = {}
+        self._isins = {}
+        self._cfi_codes = defaultdict(list)
+        self._boards = defaultdict(list)
+        self._loaded = False
+        self._fetched = 0.0
+        self._mtime = None
+        self._retry_at = 0.0
+
+    @property
+    def _path(self):
+        return os.path.join(self.cache_dir, f'securities_{self.exchange}.json')
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.cache_dir,
+                            f'securities_{self.exchange}.meta.json')
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self._meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, JSONDecodeError):
+            return {}
+
+    def _write(self, path: str, data: bytes):
+        """
+        Запись через временный файл, чтобы не оставить на диске
+        недописанную выгрузку
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _revalidate(self, meta: dict) -> bool:
+        """
+        Скачать выгрузку, если она изменилась на сервере
+
+        :return: Есть ли на диске актуальная выгрузка
+        """
+        headers = self.api._headers
+        if headers is None:
+            return self._failed()
+        headers = dict(headers)
+        if os.path.exists(self._path):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            res = self.api._request(
+                'GET',
+                url=f'{self.api.url_api}/md/v2/Securities/{self.exchange}',
+                headers=headers
+            )
+        except requests.RequestException as e:
+            if LOGGING:
+                logger.error('Ошибка загрузки справочника инструментов: %s',
+                             e)
+            return self._failed()
+        if res.status_code == 200:
+            self._write(self._path, res.content)
+        elif res.status_code != 304:
+            if LOGGING:
+                logger.error('Ошибка загрузки справочника инструментов: %s %s',
+                             res.status_code, res.text,
+                             extra=request_fields(res.url, res.status_code))
+            return self._failed()
+        self._retry_at = 0.0
+        meta = {'fetched': time.time(),
+                'etag': res.headers.get('ETag'),
+                'last_modified': res.headers.get('Last-Modified')}
+        self._write(self._meta_path, json.dumps(meta).encode())
+        self._fetched = meta['fetched']
+        return True
+
+    def _failed(self) -> bool:
+        """
+        Отложить следующую загрузку на retry_delay секунд
+
+        :return: Есть ли на диске прошлая выгрузка
+        """
+        self._retry_at = time.monotonic() + self.retry_delay
+        return os.path.exists(self._path)
+
+    def load(self, force: bool = False):
+        """
+        Загрузить справочник: с диска, если выгрузка свежее ttl,
+        иначе с перепроверкой на сервере
+
+        :param force: Перепроверить выгрузку на сервере независимо от ttl
+         и паузы после ошибки
+        :return: self
+        """
+        meta = self._read_meta()
+        self._fetched = meta.get('fetched', 0)
+        fresh = time.time() - self._fetched < self.ttl
+        exists = os.path.exists(self._path)
+        if force or not fresh or not exists:
+            if force or time.monotonic() >= self._retry_at:
+                exists = self._revalidate(meta)
+            if not exists:
+                return self
+        mtime = os.path.getmtime(self._path)
+        if not self._loaded or mtime != self._mtime:
+            # 304 или ошибка сервера: выгрузка на диске та же, индексы
+            # уже построены
+            with open(self._path, 'rb') as f:
+                self._index(loads(f.read()))
+            self._mtime = mtime
+        return self
+
+    def _index(self, securities: list):
+        self.securities = securities
+        self._symbols = {}
+        self._isins = {}
+        self._cfi_codes = defaultdict(list)
+        self._boards = defaultdict(list)
+        for security in securities:
+            self._add(security)
+        self._loaded = True
+
+    def _add(self, security: dict):
+        self._symbols.setdefault(security.get('symbol'), security)
+        if security.get('ISIN'):
+            self._isins.setdefault(security['ISIN'], security)
+        self._cfi_codes[security.get('cfiCode')].append(security)
+        board = security.get('board') or security.get('primary_board')
+        self._boards[board].append(security)
+
+    def _ensure_loaded(self):
+        if not self._loaded or (
+                time.time() - self._fetched >= self.ttl and
+                time.monotonic() >= self._retry_at):
+            self.load()
+
+    def get(self, ticker: str):
+        """
+        Инструмент по тикеру, при промахе - запрос get_security_info()
+
+        :param ticker: Инструмент GAZP
+        :return: Simple JSON или None
+        """
+        self._ensure_loaded()
+        security = self._symbols.get(ticker)
+        if security is None:
+            security = self.api.get_security_info(ticker, self.exchange)
+            if security:
+                self.securities.append(security)
+                self._add(security)
+        return security
+
+    def by_isin(self, isin: str):
+        """
+        :param isin: ISIN инструмента RU0007661625
+        :return: Simple JSON или None
+        """
+        self._ensure_loaded()
+        return self._isins.get(isin)
+
+    def by_cfi_code(self, cficode: str) -> list:
+        """
+        :param cficode: Код финансового инструмента по стандарту ISO 10962
+        :return: [ Simple JSON ]
+        """
+        self._ensure_loaded()
+        return self._cfi_codes.get(cficode, [])
+
+    def by_board(self, board: str) -> list:
+        """
+        :param board: Режим торгов TQBR, RFUD, CETS
+        :return: [ Simple JSON ]
+        """
+        self._ensure_loaded()
+        return self._boards.get(board, [])
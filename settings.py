@@ -4,13 +4,55 @@ import os
 load_dotenv()
 
 LOGGING = True
+LOG_FILE = 'debug.log'
+LOG_QUEUE_SIZE = 10000
+LOG_RATE = (10, 1)
 DEVMODE = True
 TTL_JWT_TOKEN = 60
+TOKEN_REFRESH_MARGIN = 10
+HTTP_POOL_SIZE = 10
+ASYNC_POOL_SIZE = 100
+HTTP_TIMEOUT = (3.05, 10)
+ORDERBOOK_CONCURRENCY = 20
+ORDERBOOK_TIMEOUT = 2
+WS_RECONNECT_DELAY = (1, 30)
+WS_QUEUE_SIZE = 1000
+SECURITIES_CACHE_DIR = 'cache'
+SECURITIES_TTL = 24 * 60 * 60
+SECURITIES_RETRY_DELAY = 60
+STREAM_CHUNK_SIZE = 64 * 1024
+HISTORY_WINDOW_BARS = 5000
+HISTORY_CONCURRENCY = 8
+HISTORY_RETRIES = 3
+BAR_STORE_DIR = 'bars'
+TAPE_BUFFER_SIZE = 10000
+TAPE_CONCURRENCY = 20
+TAPE_POLL_INTERVAL = 1
+ACCOUNT_CONCURRENCY = 10
+ROUTING_RETRY_DELAY = 60
+BATCH_CONCURRENCY = 10
+BATCH_RATE = 20
+BATCH_RETRIES = 2
+RATE_LIMITS = {
+    'market': (100, 100),
+    'account': (50, 50),
+    'orders': (20, 20),
+}
+RATE_RETRIES = 3
+RATE_BACKOFF = (0.5, 30)
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_TTL = {
+    'portfolios': 60 * 60,
+    'securities': 60 * 60,
+    'futures_quotes': 5,
+    'time': 60,
+}
 USERNAME = os.getenv('ALOR_USERNAME')
 EXCHANGE = 'MOEX'
 REFRESH_TOKEN = os.getenv('REFRESH_TOKEN')
 URL_OAUTH = f'https://oauth{"dev" if DEVMODE else ""}.alor.ru'
 URL_API = f'https://api{"dev" if DEVMODE else ""}.alor.ru'
+URL_WS = f'wss://api{"dev" if DEVMODE else ""}.alor.ru/ws'
 
 
 OIL = ['BRH1', 'BRJ1', 'BRK1', 'BRM1', 'BRN1', 'BRQ1',
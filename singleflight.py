@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+
+def request_key(method: str, url: str, params=None, headers=None) -> tuple:
+    """
+    Ключ одинаковых запросов: метод, URL, параметры и заголовки.
+    Заголовки входят в ключ целиком: условный запрос (If-None-Match)
+    не должен получить чужой полный ответ, а обычный - чужой 304.
+    """
+    if isinstance(params, dict):
+        params = tuple(sorted((k, str(v)) for k, v in params.items()
+                              if v is not None))
+    elif params is not None:
+        params = repr(params)
+    if headers:
+        headers = tuple(sorted(headers.items()))
+    return method, url, params, headers or None
+
+
+class _Call:
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вызовов из разных потоков:
+    первый поток выполняет запрос, остальные ждут и получают его
+    результат. Завершенные вызовы не кешируются.
+
+    requests - сколько запросов выполнено, coalesced - сколько вызовов
+    получили результат чужого запроса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """
+        :param key: Ключ вызова, см. request_key()
+        :param func: Функция без аргументов, выполняющая запрос
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.requests += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """
+    Объединение одинаковых одновременных корутин в одном event loop.
+    Отмена одного из ожидающих не отменяет общий запрос.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def _done(self, key, task):
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, factory):
+        """
+        :param key: Ключ вызова, см. request_key()
+        :param factory: Функция без аргументов, возвращающая корутину
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.requests += 1
+            task = self._calls[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda done: self._done(key, done))
+        return await asyncio.shield(task)
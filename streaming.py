@@ -0,0 +1,268 @@
+"""
+Подписки на рыночные данные через WebSocket API Alor.
+
+Все подписки мультиплексируются в одном соединении. При обрыве
+соединение восстанавливается с экспоненциальной задержкой, и все
+активные подписки отправляются заново.
+
+    async with AsyncApi(REFRESH_TOKEN, USERNAME) as alor:
+        async with Stream(alor) as stream:
+            book = await stream.orderbook('SBER', exchange='MOEX')
+            async for data in book:
+                print(data)
+"""
+import asyncio
+import uuid
+from typing import Callable
+
+import aiohttp
+
+from codec import loads, dumps
+from log import logger
+from settings import LOGGING, URL_WS, WS_RECONNECT_DELAY, WS_QUEUE_SIZE
+
+
+class Subscription:
+    """
+    Одна подписка. Обновления доставляются в callback, если он задан,
+    иначе складываются в очередь, которую можно читать через async for.
+    При переполнении очереди отбрасываются самые старые обновления.
+    """
+
+    def __init__(self, stream, request: dict, callback: Callable = None,
+                 maxsize: int = WS_QUEUE_SIZE):
+        self.guid = request['guid']
+        self.request = request
+        self.callback = callback
+        self.dropped = 0
+        self._stream = stream
+        self._queue = asyncio.Queue(maxsize)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self._queue.get()
+        if data is None:
+            raise StopAsyncIteration
+        return data
+
+    async def _deliver(self, data):
+        if self.request['opcode'] == 'BarsGetAndSubscribe':
+            # после переподключения запросим бары с последнего полученного
+            self.request['from'] = data.get('time', self.request['from'])
+        try:
+            if self.callback is not None:
+                result = self.callback(data)
+                if asyncio.iscoroutine(result):
+                    await result
+                return
+            if self._queue.full():
+                self._queue.get_nowait()
+                self.dropped += 1
+            self._queue.put_nowait(data)
+        except Exception:
+            # ошибка одной подписки не должна останавливать общий поток
+            if LOGGING:
+                logger.exception('Ошибка обработки обновления подписки %s',
+                                 self.guid)
+
+    def _finish(self):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def unsubscribe(self):
+        await self._stream.unsubscribe(self)
+
+
+class Stream:
+    """
+    Соединение WebSocket с подписками на стаканы, котировки, ленту
+    сделок и бары. Токен авторизации берется у AsyncApi.
+    """
+
+    def __init__(self, api, url_ws: str = URL_WS,
+                 reconnect_delay: tuple = WS_RECONNECT_DELAY):
+        """
+        :param api: AsyncApi, его сессия и токен используются соединением
+        :param url_ws: Адрес WebSocket API (по умолчанию из settings)
+        :param reconnect_delay: Начальная и максимальная задержка
+         переподключения в секундах
+        """
+        self.api = api
+        self.url_ws = url_ws
+        self.reconnect_delay = reconnect_delay
+        self.subscriptions = {}
+        self.reconnects = 0
+        self._ws = None
+        self._task = None
+        self._connected = asyncio.Event()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """
+        Закрыть соединение и завершить все подписки
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for subscription in self.subscriptions.values():
+            subscription._finish()
+        self.subscriptions.clear()
+
+    async def wait_connected(self, timeout: float = None):
+        await asyncio.wait_for(self._connected.wait(), timeout)
+
+    async def _send(self, message: dict):
+        message = dict(message, token=await self.api._jwt())
+        await self._ws.send_str(dumps(message).decode())
+
+    async def _run(self):
+        delay, max_delay = self.reconnect_delay
+        while True:
+            try:
+                async with self.api.session.ws_connect(
+                        self.url_ws, heartbeat=30) as ws:
+                    self._ws = ws
+                    for subscription in list(self.subscriptions.values()):
+                        await self._send(subscription.request)
+                    self._connected.set()
+                    delay = self.reconnect_delay[0]
+                    await self._read(ws)
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    ValueError) as e:
+                if LOGGING:
+                    logger.error('Ошибка соединения WebSocket: %s', e)
+            except Exception:
+                if LOGGING:
+                    logger.exception('Ошибка потока WebSocket')
+            finally:
+                self._ws = None
+                self._connected.clear()
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    async def _read(self, ws):
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            message = loads(msg.data)
+            subscription = self.subscriptions.get(message.get('guid'))
+            if subscription is not None and 'data' in message:
+                await subscription._deliver(message['data'])
+            elif message.get('httpCode', 200) != 200 and LOGGING:
+                logger.error('Ошибка подписки %s: %s',
+                             message.get('requestGuid'),
+                             message.get('message'))
+
+    async def subscribe(self, request: dict, callback: Callable = None,
+                        maxsize: int = WS_QUEUE_SIZE) -> Subscription:
+        """
+        Подписаться произвольным запросом WebSocket API
+
+        :param request: Запрос без guid и token, например
+         {'opcode': 'QuotesSubscribe', 'code': 'SBER', 'exchange': 'MOEX'}
+        :param callback: Функция или корутина, получающая обновления
+        :param maxsize: Размер очереди обновлений без callback
+        :return: Subscription
+        """
+        self.start()
+        request = dict(request, guid=str(uuid.uuid4()))
+        request.setdefault('format', 'Simple')
+        subscription = Subscription(self, request, callback, maxsize)
+        self.subscriptions[subscription.guid] = subscription
+        if self._ws is not None:
+            await self._send(request)
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription):
+        if self.subscriptions.pop(subscription.guid, None) is None:
+            return
+        if self._ws is not None:
+            await self._send({'opcode': 'unsubscribe',
+                              'guid': subscription.guid})
+        subscription._finish()
+
+    def _exchange(self, exchange: str = None):
+        return self.api.exchange or exchange
+
+    async def orderbook(self, ticker: str, exchange: str = None,
+                        depth: int = 10, callback: Callable = None):
+        """
+        Подписка на стакан
+
+        :param ticker: Инструмент SBER
+        :param exchange: Биржа MOEX, SPBX
+        :param depth: Глубина стакана
+        :param callback: Функция или корутина, получающая обновления
+        :return: Subscription
+        """
+        return await self.subscribe({'opcode': 'OrderBookGetAndSubscribe',
+                                     'code': ticker,
+                                     'exchange': self._exchange(exchange),
+                                     'depth': depth}, callback)
+
+    async def quotes(self, ticker: str, exchange: str = None,
+                     callback: Callable = None):
+        """
+        Подписка на котировки
+
+        :param ticker: Инструмент SBER
+        :param exchange: Биржа MOEX, SPBX
+        :param callback: Функция или корутина, получающая обновления
+        :return: Subscription
+        """
+        return await self.subscribe({'opcode': 'QuotesSubscribe',
+                                     'code': ticker,
+                                     'exchange': self._exchange(exchange)},
+                                    callback)
+
+    async def trades(self, ticker: str, exchange: str = None,
+                     callback: Callable = None):
+        """
+        Подписка на ленту всех сделок
+
+        :param ticker: Инструмент SBER
+        :param exchange: Биржа MOEX, SPBX
+        :param callback: Функция или корутина, получающая обновления
+        :return: Subscription
+        """
+        return await self.subscribe({'opcode': 'AllTradesGetAndSubscribe',
+                                     'code': ticker,
+                                     'exchange': self._exchange(exchange),
+                                     'depth': 0}, callback)
+
+    async def bars(self, ticker: str, tf: int, start: int,
+                   exchange: str = None, callback: Callable = None):
+        """
+        Подписка на бары
+
+        :param ticker: Инструмент SBER
+        :param tf: Длительность таймфрейма в секундах
+        :param start: С какого времени (unix time seconds) прислать историю
+        :param exchange: Биржа MOEX, SPBX
+        :param callback: Функция или корутина, получающая обновления
+        :return: Subscription
+        """
+        return await self.subscribe({'opcode': 'BarsGetAndSubscribe',
+                                     'code': ticker,
+                                     'tf': tf,
+                                     'from': start,
+                                     'exchange': self._exchange(exchange)},
+                                    callback)
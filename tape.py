@@ -0,0 +1,121 @@
+import asyncio
+from collections import deque
+from typing import Callable
+
+import aiohttp
+
+from log import logger
+from settings import (LOGGING, TAPE_BUFFER_SIZE, TAPE_CONCURRENCY,
+                      TAPE_POLL_INTERVAL)
+
+
+class TapeCursor:
+    """
+    Позиция в ленте одного тикера: последняя полная секунда и id сделок
+    за нее. Сервер фильтрует ленту по секундам, поэтому сделки этой
+    секунды придут повторно и отбрасываются по id.
+    """
+
+    __slots__ = ('second', 'seen')
+
+    def __init__(self):
+        self.second = None
+        self.seen = set()
+
+    def select_new(self, trades: list) -> list:
+        """
+        :return: Сделки, которых еще не было, по возрастанию времени
+        """
+        since = 0 if self.second is None else self.second * 1000
+        new = [trade for trade in trades
+               if trade['timestamp'] >= since and trade['id'] not in self.seen]
+        if not new:
+            return new
+        new.sort(key=lambda trade: (trade['timestamp'], trade['id']))
+        second = new[-1]['timestamp'] // 1000
+        if second != self.second:
+            self.seen = set()
+            self.second = second
+        bound = second * 1000
+        self.seen.update(trade['id'] for trade in new
+                         if trade['timestamp'] >= bound)
+        return new
+
+
+class TapeReader:
+    """
+    Инкрементальное чтение ленты сделок get_today_trades() по многим
+    тикерам.
+
+    Для каждого тикера хранится курсор, и сервер запрашивается только
+    начиная с последней полученной секунды. Повторы на границе окна
+    отбрасываются, последние maxlen сделок тикера держатся в кольцевом
+    буфере buffers[ticker]. Тикеры опрашиваются параллельно.
+
+        reader = TapeReader(alor, ['SBER', 'GAZP'], exchange='MOEX')
+        await reader.run(callback=lambda ticker, trades: print(trades))
+    """
+
+    def __init__(self, api, tickers: list, exchange: str = None,
+                 maxlen: int = TAPE_BUFFER_SIZE,
+                 concurrency: int = TAPE_CONCURRENCY):
+        """
+        :param api: AsyncApi
+        :param tickers: Список тикеров
+        :param exchange: Биржа MOEX, SPBX
+        :param maxlen: Сколько последних сделок хранить по тикеру
+        :param concurrency: Максимум одновременных запросов
+        """
+        self.api = api
+        self.exchange = exchange
+        self.cursors = {ticker: TapeCursor() for ticker in tickers}
+        self.buffers = {ticker: deque(maxlen=maxlen) for ticker in tickers}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def poll_ticker(self, ticker: str) -> list:
+        """
+        :return: Новые сделки тикера с прошлого опроса. При сетевой
+         ошибке - пустой список, курсор не сдвигается, и сделки придут
+         при следующем опросе
+        """
+        cursor = self.cursors[ticker]
+        try:
+            async with self._semaphore:
+                trades = await self.api.get_today_trades(
+                    ticker, exchange=self.exchange, start=cursor.second)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if LOGGING:
+                logger.error('Ошибка опроса ленты %s: %s', ticker, e)
+            return []
+        if not trades:
+            return []
+        new = cursor.select_new(trades)
+        self.buffers[ticker].extend(new)
+        return new
+
+    async def poll(self) -> dict:
+        """
+        Опросить все тикеры
+
+        :return: {тикер: [новые сделки]}
+        """
+        tickers = list(self.cursors)
+        results = await asyncio.gather(
+            *(self.poll_ticker(ticker) for ticker in tickers))
+        return dict(zip(tickers, results))
+
+    async def run(self, callback: Callable = None,
+                  interval: float = TAPE_POLL_INTERVAL):
+        """
+        Опрашивать ленту каждые interval секунд
+
+        :param callback: Функция или корутина (тикер, [новые сделки]),
+         вызывается только при наличии новых сделок
+        """
+        while True:
+            for ticker, trades in (await self.poll()).items():
+                if trades and callback is not None:
+                    result = callback(ticker, trades)
+                    if asyncio.iscoroutine(result):
+                        await result
+            await asyncio.sleep(interval)